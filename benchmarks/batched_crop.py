@@ -0,0 +1,82 @@
+"""Micro-benchmark for cropping a batch of frames with a different crop region per frame.
+
+Compares cropping each frame in a Python loop against a single call to
+`tvl.transforms.crop_batch`, both for crops inside the frames and for crops which need padding
+with each of the padding modes.
+"""
+
+import itertools
+import time
+
+import torch
+import torch.nn.functional as F
+
+from tvl.transforms import crop, crop_batch
+
+
+def looped(frames, boxes, out, padding_mode='constant'):
+    h, w = frames.shape[-2:]
+    for i, (frame, box) in enumerate(zip(frames, boxes.tolist())):
+        if padding_mode == 'constant':
+            out[i].copy_(crop(frame, *box))
+            continue
+        # `crop` only supports constant padding, so pad each frame just enough for its box.
+        t, l, crop_h, crop_w = box
+        margins = max(-l, 0), max(l + crop_w - w, 0), max(-t, 0), max(t + crop_h - h, 0)
+        padded = F.pad(frame[None], margins, mode=padding_mode)[0]
+        t, l = t + margins[2], l + margins[0]
+        out[i].copy_(padded[..., t:t + crop_h, l:l + crop_w])
+    return out
+
+
+def batched(frames, boxes, out, padding_mode='constant'):
+    return crop_batch(frames, boxes, padding_mode=padding_mode, out=out)
+
+
+def time_fn(fn, device, n_trials, *args):
+    fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    t1 = time.perf_counter()
+    for _ in range(n_trials):
+        fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    t2 = time.perf_counter()
+    return (t2 - t1) / n_trials
+
+
+def random_boxes(b, h, w, crop_size, margin, device):
+    """Random crop regions, which extend up to `margin` pixels outside of the frame."""
+    t = torch.randint(-margin, h - crop_size[0] + margin + 1, (b, 1))
+    l = torch.randint(-margin, w - crop_size[1] + margin + 1, (b, 1))
+    sizes = torch.tensor(crop_size).expand(b, 2)
+    return torch.cat([t, l, sizes], 1).to(device)
+
+
+def main():
+    devices = [torch.device('cpu')]
+    if torch.cuda.is_available():
+        devices.append(torch.device('cuda'))
+    # Large frames, and a bigger batch of small frames where per-frame overheads dominate.
+    configs = [(64, 256, 320, (224, 224)), (256, 64, 80, (56, 56))]
+    for device, (b, h, w, crop_size) in itertools.product(devices, configs):
+        n_trials = 50 if device.type == 'cuda' else 10
+        frames = torch.randint(0, 256, (b, 3, h, w), dtype=torch.uint8, device=device)
+        out = torch.empty((b, 3, *crop_size), dtype=frames.dtype, device=device)
+        print(f'+++ {device.type.upper()} ({b} frames of {w}x{h}) +++')
+        in_bounds = random_boxes(b, h, w, crop_size, 0, device)
+        padded = random_boxes(b, h, w, crop_size, 32, device)
+        cases = [('in bounds', in_bounds, 'constant')]
+        cases += [(padding_mode, padded, padding_mode)
+                  for padding_mode in ['constant', 'reflect', 'replicate']]
+        for name, boxes, padding_mode in cases:
+            t_looped = time_fn(looped, device, n_trials, frames, boxes, out, padding_mode)
+            t_batched = time_fn(batched, device, n_trials, frames, boxes, out, padding_mode)
+            print(f'{name:12s} looped {t_looped * 1000:8.2f} ms    crop_batch '
+                  f'{t_batched * 1000:8.2f} ms    speedup {t_looped / t_batched:5.2f}x')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Micro-benchmark for NV12 to RGB colour conversion.
+
+Compares the original multi-pass conversion from the NVDEC backend (followed by separate data
+type conversion and resizing passes, as done by `Backend._postprocess_frame`) against the fused
+`tvl.pixel_format.yuv420_to_rgb` routine.
+"""
+
+import time
+
+import torch
+
+from tvl.pixel_format import nv12_planes, yuv420_to_rgb
+from tvl.transforms import resize
+
+
+def nv12_to_rgb_unfused(planar_yuv, h, w):
+    """The original NVDEC backend conversion, kept here as a baseline."""
+    rgb = torch.empty([3, h, w], dtype=torch.float32, device=planar_yuv.device)
+    v, _, u = rgb
+    y = planar_yuv[:w*h].view(h, w).float()
+    u.copy_(planar_yuv[w*h::2].view(h//2, 1, w//2, 1).expand(h//2, 2, w//2, 2).contiguous().view(h, w))
+    v.copy_(planar_yuv[w*h+1::2].view(h//2, 1, w//2, 1).expand(h//2, 2, w//2, 2).contiguous().view(h, w))
+    torch.add(u, v, alpha=2.075161, out=rgb[1])
+    const1 = torch.tensor([6.258931e-3, -1.536320e-3, 7.910723e-3], device=rgb.device).view(3, 1, 1)
+    const2 = torch.tensor([-0.8742, 0.5316706, -1.0856313], device=rgb.device).view(3, 1, 1)
+    rgb.mul_(const1)
+    torch.add(rgb, y, alpha=4.566207e-3, out=rgb)
+    rgb.add_(const2)
+    return rgb.clamp_(0, 1)
+
+
+def unfused(nv12, h, w, dtype, size):
+    rgb = nv12_to_rgb_unfused(nv12, h, w)
+    if dtype == torch.uint8:
+        rgb = rgb.mul_(255).to(dtype)
+    if size != (h, w):
+        rgb = resize(rgb, size)
+    return rgb
+
+
+def fused(nv12, h, w, dtype, size):
+    return yuv420_to_rgb(*nv12_planes(nv12, h, w), size=size, dtype=dtype)
+
+
+def time_fn(fn, device, n_trials, *args):
+    fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    t1 = time.perf_counter()
+    for _ in range(n_trials):
+        fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    t2 = time.perf_counter()
+    return (t2 - t1) / n_trials
+
+
+def main():
+    devices = [torch.device('cpu')]
+    if torch.cuda.is_available():
+        devices.append(torch.device('cuda'))
+    h, w = 1080, 1920
+    configs = [
+        ('float32', torch.float32, (h, w)),
+        ('uint8', torch.uint8, (h, w)),
+        ('float32 resized', torch.float32, (h // 4, w // 4)),
+    ]
+    for device in devices:
+        n_trials = 100 if device.type == 'cuda' else 10
+        nv12 = torch.randint(0, 256, (h * w * 3 // 2,), dtype=torch.uint8, device=device)
+        print(f'+++ {device.type.upper()} ({w}x{h}) +++')
+        for name, dtype, size in configs:
+            t_unfused = time_fn(unfused, device, n_trials, nv12, h, w, dtype, size)
+            t_fused = time_fn(fused, device, n_trials, nv12, h, w, dtype, size)
+            print(f'{name:16s} unfused {t_unfused * 1000:8.2f} ms    fused {t_fused * 1000:8.2f} ms'
+                  f'    speedup {t_unfused / t_fused:5.2f}x')
+        print()
+
+
+if __name__ == '__main__':
+    main()
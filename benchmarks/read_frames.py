@@ -1,3 +1,9 @@
+"""Benchmark for reading frames from the sample video with every available backend.
+
+Usage:
+    python -m benchmarks.read_frames
+"""
+
 import os
 import time
 
@@ -5,9 +11,7 @@ import numpy as np
 import torch
 
 import tvl
-from tvl_backends.fffr import FffrBackendFactory
-from tvl_backends.nvdec import NvdecBackendFactory
-from tvl_backends.pyav import PyAvBackendFactory
+from benchmarks.suite import available_backends
 
 video_file = os.path.join(os.path.dirname(__file__), '../data/board_game-h264.mkv')
 
@@ -21,11 +25,11 @@ def read_sequential(video_file, device, **backend_opts):
     # Read one frame to get any initialisation out of the way.
     vl.read_frame()
 
-    t1 = time.time()
+    t1 = time.perf_counter()
     for _ in range(n_trials):
         frames = list(vl.read_frames(n_frames))
         assert len(frames) == n_frames
-    t2 = time.time()
+    t2 = time.perf_counter()
 
     return (n_trials * n_frames) / (t2 - t1)
 
@@ -40,11 +44,11 @@ def read_random(video_file, device, **backend_opts):
     vl.read_frame()
     vl.seek(0)
 
-    t1 = time.time()
+    t1 = time.perf_counter()
     for _ in range(n_trials):
         frames = list(vl.select_frames(np.arange(n_frames) * 10))
         assert len(frames) == n_frames
-    t2 = time.time()
+    t2 = time.perf_counter()
 
     return (n_trials * n_frames) / (t2 - t1)
 
@@ -54,12 +58,10 @@ def main():
     for i in range(torch.cuda.device_count()):
         torch.empty(0).to(torch.device('cuda', i))
 
-    backends = [
-        ('nvdec-cuda', NvdecBackendFactory, 'cuda'),
-        ('fffr-cuda', FffrBackendFactory, 'cuda'),
-        ('pyav-cpu', PyAvBackendFactory, 'cpu'),
-        ('fffr-cpu', FffrBackendFactory, 'cpu'),
-    ]
+    # Only backends which are installed (and devices which are available) are benchmarked. See
+    # `benchmarks.suite` for a more thorough set of scenarios.
+    backends = [(f'{name}-{device_type}', factory_cls, device_type)
+                for name, factory_cls, device_type in available_backends()]
 
     print('+++ SEQUENTIAL +++')
     for name, factory_cls, device_type in backends:
@@ -72,7 +74,7 @@ def main():
     print('+++ RANDOM +++')
     for name, factory_cls, device_type in backends:
         tvl.set_backend_factory(device_type, factory_cls())
-        fps = read_random(video_file, device_type, seek_threshold=5)
+        fps = read_random(video_file, device_type)
         print(f'{name:12s} {fps:10.2f}')
 
 
@@ -0,0 +1,82 @@
+"""Micro-benchmark for resizing batches of frames.
+
+Compares `tvl.transforms.resize`, which resamples uint8 frames without a float32 copy, against
+converting the frames to float32, resizing them, and converting back. On CUDA devices, the peak
+memory allocated by each is also reported.
+
+Antialiased downscaling (`antialias=True`) is compared against halving the frames with bilinear
+resizing until they are close to the output size.
+"""
+
+import time
+
+import torch
+
+from tvl.transforms import resize
+
+
+def float_round_trip(frames, size, mode):
+    return resize(frames.float(), size, mode).round_().clamp_(0, 255).to(torch.uint8)
+
+
+def multi_step(frames, size):
+    while frames.shape[-2] >= 2 * size[0] and frames.shape[-1] >= 2 * size[1]:
+        frames = resize(frames, (frames.shape[-2] // 2, frames.shape[-1] // 2))
+    return resize(frames, size)
+
+
+def time_fn(fn, device, n_trials, *args):
+    fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    base_memory = torch.cuda.memory_allocated(device) if device.type == 'cuda' else 0
+    t1 = time.perf_counter()
+    for _ in range(n_trials):
+        fn(*args)
+    peak_memory = 0
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        peak_memory = torch.cuda.max_memory_allocated(device) - base_memory
+    t2 = time.perf_counter()
+    return (t2 - t1) / n_trials, peak_memory
+
+
+def main():
+    devices = [torch.device('cpu')]
+    if torch.cuda.is_available():
+        devices.append(torch.device('cuda'))
+    b, h, w = 16, 720, 1280
+    configs = [
+        ('bilinear', (360, 640)),
+        ('bilinear', (112, 112)),
+        ('area', (180, 320)),
+        ('nearest', (360, 640)),
+    ]
+    for device in devices:
+        n_trials = 50 if device.type == 'cuda' else 5
+        frames = torch.randint(0, 256, (b, 3, h, w), dtype=torch.uint8, device=device)
+        print(f'+++ {device.type.upper()} ({b} frames of {w}x{h}) +++')
+        for mode, size in configs:
+            t_float, m_float = time_fn(float_round_trip, device, n_trials, frames, size, mode)
+            t_uint8, m_uint8 = time_fn(resize, device, n_trials, frames, size, mode)
+            name = f'{mode} {size[1]}x{size[0]}'
+            line = (f'{name:18s} float32 {t_float * 1000:8.2f} ms    uint8 {t_uint8 * 1000:8.2f} ms'
+                    f'    speedup {t_float / t_uint8:5.2f}x')
+            if device.type == 'cuda':
+                line += f'    peak memory {m_float / 2**20:7.1f} MiB -> {m_uint8 / 2**20:7.1f} MiB'
+            print(line)
+        frames = frames.float().div_(255)
+        for size in [(112, 112), (360, 640)]:
+            t_steps, _ = time_fn(multi_step, device, n_trials, frames, size)
+            name = f'antialias {size[1]}x{size[0]}'
+            line = f'{name:18s} multi-step {t_steps * 1000:8.2f} ms'
+            for mode in ['bilinear', 'area', 'lanczos']:
+                t_mode, _ = time_fn(resize, device, n_trials, frames, size, mode, True)
+                line += f'    {mode} {t_mode * 1000:8.2f} ms'
+            print(line)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+"""Benchmark suite for video loading.
+
+Runs a set of reproducible loading scenarios against every available backend, using synthetic
+videos generated with known parameters, and writes the results as JSON. Two result files can
+then be compared to find regressions.
+
+Usage:
+    python -m benchmarks.suite run --output results.json
+    python -m benchmarks.suite compare baseline.json results.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+import numpy as np
+import torch
+
+import tvl
+from benchmarks.synthetic import VideoSpec, get_video
+
+# Backend factories to benchmark, with the device types they support.
+BACKENDS = {
+    'pyav': ('tvl_backends.pyav.PyAvBackendFactory', {'cpu'}),
+    'opencv': ('tvl_backends.opencv.OpenCvBackendFactory', {'cpu'}),
+    'fffr': ('tvl_backends.fffr.FffrBackendFactory', {'cpu', 'cuda'}),
+    'nvdec': ('tvl_backends.nvdec.NvdecBackendFactory', {'cuda'}),
+}
+
+
+def available_backends(device_types=('cpu', 'cuda')):
+    """Find the backends which can be benchmarked in this environment.
+
+    Backends which are not installed, and CUDA devices when CUDA is unavailable, are skipped.
+
+    Args:
+        device_types (Sequence of str): Device types to consider.
+
+    Returns:
+        list of tuple: (backend name, backend factory class, device type) tuples.
+    """
+    backends = []
+    for name, (factory_path, supported) in BACKENDS.items():
+        module_name, class_name = factory_path.rsplit('.', 1)
+        try:
+            factory_cls = getattr(importlib.import_module(module_name), class_name)
+        except ImportError:
+            continue
+        for device_type in device_types:
+            if device_type not in supported:
+                continue
+            if device_type == 'cuda' and not torch.cuda.is_available():
+                continue
+            backends.append((name, factory_cls, device_type))
+    return backends
+
+
+class Context:
+    """Everything a scenario needs to set itself up."""
+
+    def __init__(self, spec: VideoSpec, device, dtype, seed, cache_dir):
+        self.spec = spec
+        self.device = device
+        self.dtype = dtype
+        self.seed = seed
+        self.cache_dir = cache_dir
+
+    def video(self, **changes):
+        """Get the path to the benchmark video (or a variation of it)."""
+        spec = self.spec
+        if changes:
+            spec = VideoSpec(**{**asdict(spec), **changes})
+        return str(get_video(spec, self.cache_dir))
+
+    def loader(self, filename=None):
+        if filename is None:
+            filename = self.video()
+        return tvl.VideoLoader(filename, self.device, self.dtype)
+
+    def rng(self):
+        return np.random.default_rng(self.seed)
+
+
+# Each scenario takes a Context and returns a pair of functions: one which runs a single
+# iteration and returns the number of frames read, and one which cleans up afterwards.
+
+def sequential(ctx: Context):
+    """Read a run of frames from the start of the video."""
+    vl = ctx.loader()
+    n_frames = min(ctx.spec.n_frames, 50)
+
+    def run():
+        vl.seek_to_frame(0)
+        return sum(1 for _ in vl.read_frames(n_frames))
+
+    return run, vl.close
+
+
+def _random_indices(rng, n_frames, n):
+    return np.sort(rng.choice(n_frames, size=min(n, n_frames), replace=False)).tolist()
+
+
+def random_access(ctx: Context):
+    """Read a handful of frames at random positions."""
+    vl = ctx.loader()
+    rng = ctx.rng()
+
+    def run():
+        return len(list(vl.select_frames(_random_indices(rng, ctx.spec.n_frames, 5))))
+
+    return run, vl.close
+
+
+def strided_clips(ctx: Context, clip_length=8, stride=2):
+    """Read a clip of every `stride`-th frame from a random start, as for action recognition."""
+    vl = ctx.loader()
+    rng = ctx.rng()
+    span = (clip_length - 1) * stride + 1
+
+    def run():
+        start = int(rng.integers(0, max(ctx.spec.n_frames - span, 0) + 1))
+        indices = [i for i in range(start, start + span, stride) if i < ctx.spec.n_frames]
+        return vl.select_frames_stacked(indices).shape[0]
+
+    return run, vl.close
+
+
+def sliding_windows(ctx: Context, length=16, stride=4):
+    """Read every overlapping window of a video in one pass, as for dense feature extraction."""
+    vl = ctx.loader()
+
+    def run():
+        return sum(len(window) for window in vl.sliding_windows(length, stride))
+
+    return run, vl.close
+
+
+def many_small_files(ctx: Context, n_files=8, n_frames=4):
+    """Open a short video, read a few frames from it, and close it again."""
+    filenames = [
+        ctx.video(width=min(ctx.spec.width, 320), height=min(ctx.spec.height, 240),
+                  n_frames=16, variant=i)
+        for i in range(n_files)
+    ]
+    next_file = 0
+
+    def run():
+        nonlocal next_file
+        vl = ctx.loader(filenames[next_file])
+        next_file = (next_file + 1) % n_files
+        try:
+            return sum(1 for _ in vl.read_frames(n_frames))
+        finally:
+            vl.close()
+
+    return run, lambda: None
+
+
+def concurrent_loaders(ctx: Context, n_threads=4):
+    """Read random frames with several loaders on different threads at once."""
+    vls = [ctx.loader() for _ in range(n_threads)]
+    rngs = [np.random.default_rng([ctx.seed, i]) for i in range(n_threads)]
+    executor = ThreadPoolExecutor(max_workers=n_threads)
+
+    def read(vl, rng):
+        return len(list(vl.select_frames(_random_indices(rng, ctx.spec.n_frames, 5))))
+
+    def run():
+        return sum(executor.map(read, vls, rngs))
+
+    def close():
+        executor.shutdown()
+        for vl in vls:
+            vl.close()
+
+    return run, close
+
+
+SCENARIOS = {
+    'sequential': sequential,
+    'random_access': random_access,
+    'strided_clips': strided_clips,
+    'sliding_windows': sliding_windows,
+    'many_small_files': many_small_files,
+    'concurrent_loaders': concurrent_loaders,
+}
+
+
+def _current_rss():
+    """Get the resident set size of this process in bytes, if it is known."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss():
+    """Get the peak resident set size of this process in bytes, if it is known."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _synchronize(device_type):
+    if device_type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def summarise(durations, frame_counts):
+    """Summarise per-iteration timings.
+
+    Args:
+        durations (Sequence of float): Duration of each iteration in seconds.
+        frame_counts (Sequence of int): Number of frames read in each iteration.
+
+    Returns:
+        dict: Frames per second and latency percentiles (in milliseconds).
+    """
+    latencies = np.asarray(durations) * 1000
+    return {
+        'n_iterations': len(durations),
+        'n_frames': int(sum(frame_counts)),
+        'fps': float(sum(frame_counts) / sum(durations)),
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'min': float(latencies.min()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max()),
+        },
+    }
+
+
+def run_scenario(scenario_fn, ctx: Context, n_iterations, n_warmup):
+    """Run a scenario, timing each iteration after the warmup iterations.
+
+    Memory allocation statistics are gathered in one extra iteration after timing, since
+    tracing allocations slows everything down. They only include allocations made through the
+    Python allocator (eg. by NumPy and by Python objects), and not allocations made by native
+    libraries like FFmpeg or the PyTorch CPU allocator.
+    """
+    run, close = scenario_fn(ctx)
+    device_type = torch.device(ctx.device).type
+    try:
+        for _ in range(n_warmup):
+            run()
+        _synchronize(device_type)
+        rss_before = _current_rss()
+        durations = []
+        frame_counts = []
+        for _ in range(n_iterations):
+            start = time.perf_counter()
+            n_frames = run()
+            _synchronize(device_type)
+            durations.append(time.perf_counter() - start)
+            frame_counts.append(n_frames)
+        rss_after = _current_rss()
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            run()
+            _synchronize(device_type)
+            after = tracemalloc.take_snapshot()
+            _, alloc_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        new_blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'lineno'))
+    finally:
+        close()
+
+    result = summarise(durations, frame_counts)
+    result['rss_bytes'] = {'before': rss_before, 'after': rss_after, 'peak': _peak_rss()}
+    result['python_alloc'] = {'peak_bytes': alloc_peak, 'retained_blocks': new_blocks}
+    return result
+
+
+def run_suite(backends, scenarios, spec: VideoSpec, n_iterations=20, n_warmup=3,
+              dtype=torch.float32, seed=0, cache_dir=None, log=print):
+    """Run scenarios against backends.
+
+    Args:
+        backends (Sequence of tuple): Backends, as returned by `available_backends`.
+        scenarios (Sequence of str): Names of scenarios to run (see `SCENARIOS`).
+        spec (VideoSpec): Parameters of the benchmark video.
+        n_iterations (int): Number of timed iterations for each scenario.
+        n_warmup (int): Number of untimed iterations to run first.
+        dtype (torch.dtype): Data type of loaded frames.
+        seed (int): Seed for choosing random frame indices.
+        cache_dir: Directory for generated videos.
+        log: Function for printing progress, or `None`.
+
+    Returns:
+        list of dict: One result for each combination of backend and scenario.
+    """
+    results = []
+    for backend_name, factory_cls, device_type in backends:
+        tvl.set_backend_factory(device_type, factory_cls())
+        ctx = Context(spec, device_type, dtype, seed, cache_dir)
+        for scenario_name in scenarios:
+            result = {'backend': backend_name, 'device': device_type, 'scenario': scenario_name}
+            try:
+                result.update(run_scenario(SCENARIOS[scenario_name], ctx, n_iterations, n_warmup))
+                summary = f'{result["fps"]:10.2f} fps  p50 {result["latency_ms"]["p50"]:8.2f} ms'
+            except Exception as e:
+                result['error'] = f'{type(e).__name__}: {e}'
+                summary = f'error ({result["error"]})'
+            if log is not None:
+                log(f'{backend_name + "-" + device_type:12s} {scenario_name:20s} {summary}')
+            results.append(result)
+    return results
+
+
+def environment_info():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'cuda_device': torch.cuda.get_device_name() if torch.cuda.is_available() else None,
+    }
+
+
+def _result_key(result):
+    return result['backend'], result['device'], result['scenario']
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Compare two sets of benchmark results.
+
+    A scenario has regressed if its frame rate dropped, or its median latency rose, by more than
+    `threshold` (as a fraction of the baseline). Scenarios which failed in the current results
+    also count as regressions. Scenarios which are missing from either set of results, or which
+    failed in the baseline, cannot be compared, and are reported with a `note` explaining why.
+
+    Args:
+        baseline (dict): Baseline results, as written by `run`.
+        current (dict): New results.
+        threshold (float): Relative change which counts as a regression.
+
+    Returns:
+        list of dict: Comparison rows, with a `regression` flag.
+    """
+    baseline_results = {_result_key(r): r for r in baseline['results']}
+    current_keys = {_result_key(r) for r in current['results']}
+    rows = []
+    for result in current['results']:
+        key = _result_key(result)
+        base = baseline_results.get(key)
+        row = dict(zip(('backend', 'device', 'scenario'), key))
+        row.update(fps_change=None, p50_change=None, regression=False, note=None)
+        if 'error' in result:
+            row.update(regression=True, note='failed')
+        elif base is None:
+            row['note'] = 'not in baseline'
+        elif 'error' in base:
+            row['note'] = 'failed in baseline'
+        else:
+            fps_change = result['fps'] / base['fps'] - 1
+            p50_change = result['latency_ms']['p50'] / base['latency_ms']['p50'] - 1
+            row.update(
+                baseline_fps=base['fps'],
+                fps=result['fps'],
+                fps_change=fps_change,
+                p50_change=p50_change,
+                regression=fps_change < -threshold or p50_change > threshold,
+            )
+        rows.append(row)
+    for key in baseline_results:
+        if key not in current_keys:
+            row = dict(zip(('backend', 'device', 'scenario'), key))
+            row.update(fps_change=None, p50_change=None, regression=False,
+                       note='not in current results')
+            rows.append(row)
+    return rows
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Video loading benchmark suite.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('--output', '-o', help='file to write JSON results to')
+    run_parser.add_argument('--backends', help='comma-separated backend names '
+                                               f'(default: all available of {", ".join(BACKENDS)})')
+    run_parser.add_argument('--devices', default='cpu',
+                            help='comma-separated device types (default: cpu)')
+    run_parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help='comma-separated scenario names (default: all)')
+    run_parser.add_argument('--iterations', type=int, default=20)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--dtype', choices=['float32', 'uint8'], default='float32')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--width', type=int, default=VideoSpec.width)
+    run_parser.add_argument('--height', type=int, default=VideoSpec.height)
+    run_parser.add_argument('--n-frames', type=int, default=VideoSpec.n_frames)
+    run_parser.add_argument('--frame-rate', type=int, default=VideoSpec.frame_rate)
+    run_parser.add_argument('--gop-size', type=int, default=VideoSpec.gop_size)
+    run_parser.add_argument('--codec', default=VideoSpec.codec)
+    run_parser.add_argument('--cache-dir', help='directory for generated videos')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative slowdown which counts as a regression '
+                                     '(default: 0.1)')
+
+    return parser.parse_args(argv)
+
+
+def _run(args):
+    spec = VideoSpec(width=args.width, height=args.height, n_frames=args.n_frames,
+                     frame_rate=args.frame_rate, gop_size=args.gop_size, codec=args.codec)
+    backends = available_backends(args.devices.split(','))
+    if args.backends:
+        names = set(args.backends.split(','))
+        backends = [backend for backend in backends if backend[0] in names]
+    if not backends:
+        print('No backends available.', file=sys.stderr)
+        return 1
+    scenarios = args.scenarios.split(',')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            print(f'Unknown scenario: {scenario}', file=sys.stderr)
+            return 1
+    # Measure the loaders themselves, without process-wide caching.
+    tvl.set_frame_cache(None)
+    tvl.set_backend_pool(None)
+
+    results = run_suite(backends, scenarios, spec, args.iterations, args.warmup,
+                        getattr(torch, args.dtype), args.seed, args.cache_dir)
+    if args.output:
+        report = {
+            'environment': environment_info(),
+            'config': {
+                'video': asdict(spec),
+                'iterations': args.iterations,
+                'warmup': args.warmup,
+                'dtype': args.dtype,
+                'seed': args.seed,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def _compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get('config') != current.get('config'):
+        print('Warning: the result files were produced with different configurations.',
+              file=sys.stderr)
+    rows = compare_results(baseline, current, args.threshold)
+    for row in rows:
+        name = f'{row["backend"]}-{row["device"]}'
+        flag = 'REGRESSION' if row['regression'] else ''
+        if row['note'] is not None:
+            print(f'{name:12s} {row["scenario"]:20s} {row["note"]:>31s} {flag}')
+            continue
+        print(f'{name:12s} {row["scenario"]:20s} {row["baseline_fps"]:10.2f} -> '
+              f'{row["fps"]:10.2f} fps ({row["fps_change"]:+7.1%})  '
+              f'p50 {row["p50_change"]:+7.1%}  {flag}')
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.command == 'run':
+        return _run(args)
+    return _compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
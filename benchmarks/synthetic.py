@@ -0,0 +1,124 @@
+"""Synthetic test videos for benchmarking.
+
+Videos are generated with PyAV from a deterministic moving pattern, so that benchmark results
+only depend on the video parameters (and not on whatever footage happens to be on disk).
+Generated videos are kept in a cache directory and reused by later runs.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+import numpy as np
+
+# Codecs which are known to work well in each container, with their file extension.
+_CONTAINER_EXTENSIONS = {
+    'libx264': '.mkv',
+    'h264': '.mkv',
+    'hevc': '.mkv',
+    'libx265': '.mkv',
+    'mpeg4': '.mp4',
+    'libvpx-vp9': '.webm',
+    'mjpeg': '.avi',
+}
+
+
+@dataclass(frozen=True)
+class VideoSpec:
+    """Parameters of a synthetic video."""
+    width: int = 1280
+    height: int = 720
+    n_frames: int = 100
+    frame_rate: int = 25
+    gop_size: int = 25
+    codec: str = 'libx264'
+    # Videos with different variants have different content, but are otherwise alike.
+    variant: int = 0
+
+    @property
+    def name(self):
+        return f'{self.codec}-{self.width}x{self.height}-{self.n_frames}f-gop{self.gop_size}' \
+               f'-v{self.variant}'
+
+    def key(self):
+        data = json.dumps(asdict(self), sort_keys=True).encode('utf-8')
+        return hashlib.sha1(data).hexdigest()[:12]
+
+
+def default_cache_dir() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return Path(cache_home, 'tvl', 'benchmark_videos')
+
+
+def _pattern_frame(spec: VideoSpec, index):
+    """Draw a frame of a moving colour gradient with a bouncing box, as an [H x W x 3] array."""
+    ys, xs = np.mgrid[0:spec.height, 0:spec.width]
+    phase = index * 4 + spec.variant * 37
+    frame = np.empty((spec.height, spec.width, 3), dtype=np.uint8)
+    frame[..., 0] = (xs + phase) % 256
+    frame[..., 1] = (ys + phase // 2) % 256
+    frame[..., 2] = ((xs + ys) // 2 + phase) % 256
+    box = max(spec.height, spec.width) // 8
+    x = (index * 7 + spec.variant * 13) % max(spec.width - box, 1)
+    y = (index * 5) % max(spec.height - box, 1)
+    frame[y:y + box, x:x + box] = 255
+    return frame
+
+
+def write_video(spec: VideoSpec, filename):
+    """Encode a synthetic video according to `spec`.
+
+    Args:
+        spec (VideoSpec): The video parameters.
+        filename: Path of the output file.
+    """
+    import av
+
+    with av.open(str(filename), 'w') as container:
+        stream = container.add_stream(spec.codec, rate=spec.frame_rate)
+        stream.width = spec.width
+        stream.height = spec.height
+        stream.pix_fmt = 'yuvj420p' if spec.codec == 'mjpeg' else 'yuv420p'
+        stream.codec_context.gop_size = spec.gop_size
+        # Place keyframes exactly every `gop_size` frames, and disable B-frames so that the
+        # decode order matches the display order.
+        stream.codec_context.max_b_frames = 0
+        if spec.codec in {'libx264', 'libx265'}:
+            stream.options = {'keyint_min': str(spec.gop_size), 'sc_threshold': '0'}
+        for i in range(spec.n_frames):
+            frame = av.VideoFrame.from_ndarray(_pattern_frame(spec, i), format='rgb24')
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def get_video(spec: VideoSpec, cache_dir=None) -> Path:
+    """Get the path to a synthetic video, generating it if it is not cached already.
+
+    Args:
+        spec (VideoSpec): The video parameters.
+        cache_dir: Directory to keep generated videos in. Defaults to `~/.cache/tvl`.
+
+    Returns:
+        Path: The path to the video file.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    extension = _CONTAINER_EXTENSIONS.get(spec.codec, '.mkv')
+    path = cache_dir / f'{spec.name}-{spec.key()}{extension}'
+    if not path.exists():
+        # Write to a temporary file first, so that an interrupted run does not leave a partial
+        # video in the cache.
+        tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp{extension}')
+        try:
+            write_video(spec, tmp_path)
+            tmp_path.replace(path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    return path
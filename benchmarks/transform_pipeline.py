@@ -0,0 +1,74 @@
+"""Micro-benchmark for augmenting a batch of video clips.
+
+Compares applying the `tvl.transforms` functions to each clip in a Python loop (with random
+parameters drawn per clip) against a single call to a `tvl.transforms.Pipeline`.
+"""
+
+import random
+import time
+
+import torch
+
+from tvl.transforms import crop, flip, normalise, resize
+from tvl.transforms import Pipeline, RandomCrop, RandomFlip, Resize, Normalise
+
+MEAN = [0.485, 0.456, 0.406]
+STDDEV = [0.229, 0.224, 0.225]
+
+
+def looped(clips, crop_size, out_size):
+    results = []
+    for clip in clips:
+        clip = clip.float().div_(255)
+        t = random.randint(0, clip.shape[-2] - crop_size[0])
+        l = random.randint(0, clip.shape[-1] - crop_size[1])
+        clip = crop(clip, t, l, *crop_size)
+        clip = resize(clip, out_size)
+        clip = flip(clip, horizontal=random.random() < 0.5)
+        results.append(normalise(clip, MEAN, STDDEV))
+    return torch.stack(results)
+
+
+def pipelined(pipeline, clips):
+    return pipeline(clips)
+
+
+def time_fn(fn, device, n_trials, *args):
+    fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    t1 = time.perf_counter()
+    for _ in range(n_trials):
+        fn(*args)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    t2 = time.perf_counter()
+    return (t2 - t1) / n_trials
+
+
+def main():
+    devices = [torch.device('cpu')]
+    if torch.cuda.is_available():
+        devices.append(torch.device('cuda'))
+    b, t, h, w = 16, 8, 256, 320
+    crop_size = (224, 224)
+    configs = [
+        ('crop+flip+norm', crop_size),
+        ('crop+resize+flip+norm', (112, 112)),
+    ]
+    for device in devices:
+        n_trials = 50 if device.type == 'cuda' else 5
+        clips = torch.randint(0, 256, (b, t, 3, h, w), dtype=torch.uint8, device=device)
+        print(f'+++ {device.type.upper()} ({b}x{t} frames of {w}x{h}) +++')
+        for name, out_size in configs:
+            pipeline = Pipeline([RandomCrop(crop_size), Resize(out_size), RandomFlip(),
+                                 Normalise(MEAN, STDDEV)])
+            t_looped = time_fn(looped, device, n_trials, clips, crop_size, out_size)
+            t_pipelined = time_fn(pipelined, device, n_trials, pipeline, clips)
+            print(f'{name:24s} looped {t_looped * 1000:8.2f} ms    pipeline '
+                  f'{t_pipelined * 1000:8.2f} ms    speedup {t_looped / t_pipelined:5.2f}x')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ from pathlib import Path
 import torch
 from torch.utils.data import Dataset
 
+import tvl
 from tvl import VideoLoader
 from tvl.dataset import AsyncDataset, BatchDataLoader
 
@@ -23,8 +24,8 @@ class VideoDataset(Dataset):
 
     def __getitem__(self, index):
         video_filename, frame_indices = self.clips[index]
-        vl = VideoLoader(video_filename, self.device)
-        frames = torch.stack(list(vl.select_frames(frame_indices)), 0)
+        with VideoLoader(video_filename, self.device) as vl:
+            frames = vl.select_frames_stacked(frame_indices)
         return dict(
             frames=frames,
             example_index=index,
@@ -35,10 +36,11 @@ def main():
     device = torch.device('cuda:0')
     torch.empty(0).to(device)  # Initialise CUDA manually so that it doesn't interfere with timing.
 
+    # Reuse open backends when the same video file is sampled more than once.
+    tvl.set_backend_pool(tvl.BackendPool())
+
     dataset = VideoDataset([(video_filename, list(range(40)))] * 8, device=device)
-    # NOTE: The VideoLoader object can deadlock if multiple threads try to use it at once,
-    #       depending on the backend.
-    async_dataset = AsyncDataset(dataset, ThreadPoolExecutor(max_workers=1))
+    async_dataset = AsyncDataset(dataset, ThreadPoolExecutor(max_workers=4))
     loader = BatchDataLoader(async_dataset, batch_size=2, shuffle=False)
 
     start_time = perf_counter()
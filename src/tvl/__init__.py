@@ -1,13 +1,19 @@
+import asyncio
 import importlib
 import os
+from collections import deque
 from contextlib import contextmanager
 from threading import RLock, Condition
-from typing import Dict, Sequence, Iterator, Union
+from time import perf_counter
+from typing import Dict, Sequence, Iterator, Union, Optional
 
 import torch
 
 import tvl.backend
-from tvl.backend import BackendFactory
+import tvl.pixel_format
+import tvl.stats
+from tvl.backend import Backend, BackendFactory
+from tvl.cache import CachedBackend, FrameCache
 
 # Explicitly set backends for particular device types.
 _device_backends: Dict[str, BackendFactory] = {}
@@ -24,6 +30,10 @@ _known_backends = {
         'tvl_backends.nvdec.NvdecBackendFactory',   # PyPI package: tvl-backends-nvdec
     ],
 }
+# Frame cache shared by all VideoLoader instances which are not given a cache explicitly.
+_frame_cache: Optional[FrameCache] = None
+# Backend pool shared by all VideoLoader instances which are not given a pool explicitly.
+_backend_pool: Optional['BackendPool'] = None
 
 
 def set_backend_factory(device_type, backend_factory):
@@ -54,12 +64,197 @@ def get_backend_factory(device_type) -> BackendFactory:
     raise Exception(f'failed to find a backend factory for device type: {device_type}')
 
 
+def set_frame_cache(frame_cache: Optional[FrameCache]):
+    """Set the frame cache to be shared by VideoLoader instances in this process.
+
+    Args:
+        frame_cache (FrameCache): The cache, or `None` to disable process-wide frame caching.
+    """
+    global _frame_cache
+    _frame_cache = frame_cache
+
+
+def get_frame_cache() -> Optional[FrameCache]:
+    """Get the frame cache shared by VideoLoader instances in this process."""
+    return _frame_cache
+
+
+def set_backend_pool(backend_pool: Optional['BackendPool']):
+    """Set the backend pool to be shared by VideoLoader instances in this process.
+
+    Args:
+        backend_pool (BackendPool): The pool, or `None` to disable process-wide backend pooling.
+    """
+    global _backend_pool
+    _backend_pool = backend_pool
+
+
+def get_backend_pool() -> Optional['BackendPool']:
+    """Get the backend pool shared by VideoLoader instances in this process."""
+    return _backend_pool
+
+
+class BackendPool:
+    def __init__(self, max_idle=16):
+        """A pool of open backends which can be reused by VideoLoader instances.
+
+        Reusing a backend for a video file avoids opening and probing the file again.
+
+        Args:
+            max_idle (int): Maximum number of idle backends to keep open.
+        """
+        self.max_idle = max_idle
+        self.lock = RLock()
+        self._idle = []
+        self._checked_out = {}
+
+    @staticmethod
+    def _backend_key(filename, device, dtype, backend_opts):
+        stat = os.stat(filename)
+        opts = tuple(sorted((backend_opts or {}).items()))
+        return os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, str(device), dtype, opts
+
+    def __len__(self):
+        return len(self._idle)
+
+    def has_idle(self, filename, device, dtype=torch.float32, backend_opts=None):
+        """Check whether the pool has an idle backend which is ready for reuse."""
+        if isinstance(device, str):
+            device = torch.device(device)
+        key = self._backend_key(os.fspath(filename), device, dtype, backend_opts)
+        with self.lock:
+            return any(idle_key == key for idle_key, _ in self._idle)
+
+    def checkout(self, filename, device, dtype=torch.float32, backend_opts=None) -> Backend:
+        """Take a backend for a video file from the pool, creating one if necessary.
+
+        Reused backends are rewound to the start of the video.
+        """
+        if isinstance(device, str):
+            device = torch.device(device)
+        filename = os.fspath(filename)
+        key = self._backend_key(filename, device, dtype, backend_opts)
+        backend = None
+        with self.lock:
+            for i in reversed(range(len(self._idle))):
+                if self._idle[i][0] == key:
+                    backend = self._idle.pop(i)[1]
+                    break
+        if backend is None:
+            backend = get_backend_factory(device.type).create(filename, device, dtype, backend_opts)
+        else:
+            backend.seek(0)
+        with self.lock:
+            self._checked_out[id(backend)] = key
+        return backend
+
+    def checkin(self, backend: Backend):
+        """Return a backend to the pool so that it can be reused."""
+        with self.lock:
+            key = self._checked_out.pop(id(backend))
+            self._idle.append((key, backend))
+            # Drop the least recently used backends if there are too many idle ones.
+            while len(self._idle) > self.max_idle:
+                self._idle.pop(0)
+
+    def clear(self):
+        """Remove all idle backends from the pool."""
+        with self.lock:
+            self._idle.clear()
+
+
+def _select_kwargs(roi, check):
+    """Keyword arguments for a backend's `select_frames`, leaving out those which are not set."""
+    kwargs = {}
+    if roi is not None:
+        kwargs['roi'] = roi
+    if check is not None:
+        kwargs['check'] = check
+    return kwargs
+
+
 class VideoLoader:
-    def __init__(self, filename, device: Union[torch.device, str], dtype=torch.float32, backend_opts=None):
+    def __init__(self, filename, device: Union[torch.device, str], dtype=torch.float32, backend_opts=None,
+                 frame_cache: Optional[FrameCache] = None, backend_pool: Optional[BackendPool] = None,
+                 pixel_format: Optional[str] = None, roi=None):
+        """Create a video loader for a particular video file.
+
+        A VideoLoader may be shared between threads. Each method call is atomic with respect to
+        the loader's read position, and `select_frames`/`select_frames_stacked` always return
+        the requested frames, even when other threads are reading from the same loader. The
+        read position itself is shared, so sequential reads (`read_frame`, `remaining_frames`,
+        etc.) made from different threads will each receive a subset of the frames. Decoding is
+        serialised per loader, so threads should use separate loaders to decode in parallel.
+
+        Args:
+            filename: Path to the video file.
+            device: Device to load frames onto.
+            dtype: Data type of loaded frames.
+            backend_opts (dict): Backend-specific options.
+            frame_cache (FrameCache): Cache for frames read with `select_frames`. Defaults to the
+                process-wide cache set with `set_frame_cache` (if any).
+            backend_pool (BackendPool): Pool to check out a backend from. The backend will be
+                returned to the pool when `close` is called. Defaults to the process-wide pool set
+                with `set_backend_pool` (if any).
+            pixel_format (str): Layout of loaded frames: 'rgb_planar' (the default), 'rgb_hwc',
+                'yuv420p', or 'gray' (see `tvl.pixel_format`). Backends produce these formats
+                natively where possible, skipping RGB conversion.
+            roi (tuple of int): Region of interest (top, left, height, width) in source frame
+                pixels. Backends only colour convert (and resize) this region of each frame, so
+                reading a small region is cheaper than cropping full frames afterwards. The
+                region can be overridden for individual calls to `select_frames`.
+
+        If instrumentation is enabled (see `tvl.stats`), `stats` holds the loader's timers and
+        counters. Otherwise it is `None`.
+        """
         if isinstance(device, str):
             device = torch.device(device)
+        self.device = device
         filename = os.fspath(filename)
-        self.backend = get_backend_factory(device.type).create(filename, device, dtype, backend_opts)
+        if pixel_format is not None:
+            tvl.pixel_format.check_pixel_format(pixel_format)
+            backend_opts = {**(backend_opts or {}), 'pixel_format': pixel_format}
+        if roi is not None:
+            backend_opts = {**(backend_opts or {}), 'roi': tuple(roi)}
+        if backend_pool is None:
+            backend_pool = _backend_pool
+        self.backend_pool = backend_pool
+        self.stats = tvl.stats.create_loader_stats()
+        open_start = perf_counter() if self.stats is not None else None
+        if backend_pool is not None:
+            self.backend = backend_pool.checkout(filename, device, dtype, backend_opts)
+        else:
+            self.backend = get_backend_factory(device.type).create(filename, device, dtype, backend_opts)
+        if self.stats is not None:
+            self.stats.add_time('open', perf_counter() - open_start)
+            self.backend.stats = self.stats
+        self._pooled_backend = self.backend
+        # A pooled backend may already have skipped frames for other loaders.
+        self._n_frames_skipped_at_checkout = self._pooled_backend.n_frames_skipped
+        self._n_frames_skipped = 0
+        if frame_cache is None:
+            frame_cache = _frame_cache
+        if frame_cache is not None:
+            self.backend = CachedBackend(self.backend, frame_cache)
+            self.backend.stats = self.stats
+
+    def close(self):
+        """Release the backend, returning it to the backend pool (if any)."""
+        if self._pooled_backend is not None:
+            # Keep the count, since the backend may be reused by other loaders.
+            self._n_frames_skipped = self.n_frames_skipped
+            self._pooled_backend.stats = None
+            self._pooled_backend._save_seek_costs()
+            if self.backend_pool is not None:
+                self.backend_pool.checkin(self._pooled_backend)
+        self._pooled_backend = None
+        self.backend = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def seek(self, time_secs):
         self.backend.seek(time_secs)
@@ -67,11 +262,40 @@ class VideoLoader:
     def seek_to_frame(self, frame_index):
         self.backend.seek_to_frame(frame_index)
 
+    def _count_returned(self, n=1):
+        if self.stats is not None:
+            self.stats.count('frames_returned', n)
+
     def read_frame(self):
-        return self.backend.read_frame()
+        frame = self.backend.read_frame()
+        self._count_returned()
+        return frame
 
     def read_frames(self, n):
-        return self.backend.read_frames(n)
+        frames = self.backend.read_frames(n)
+        self._count_returned(len(frames))
+        return frames
+
+    def release_frame(self, frame):
+        """Indicate that a frame is no longer needed, allowing its memory to be reused.
+
+        The frame must not be used after it has been released.
+        """
+        self.backend.release_frame(frame)
+
+    def read_frames_into(self, n, out=None):
+        """Read a sequence of frames into a single tensor.
+
+        Args:
+            n (int): Number of frames to read.
+            out (torch.Tensor): Optional [N x 3 x H x W] tensor to write the frames into.
+
+        Returns:
+            torch.Tensor: The frames, stacked along the first dimension.
+        """
+        frames = self.backend.read_frames_into(n, out)
+        self._count_returned(len(frames))
+        return frames
 
     @property
     def duration(self):
@@ -89,6 +313,17 @@ class VideoLoader:
     def width(self):
         return self.backend.width
 
+    @property
+    def n_frames_skipped(self):
+        """Number of frames which the backend decoded, but did not return.
+
+        These frames were read and discarded to get to frames selected with `select_frames`
+        (see `Backend.seek_threshold`).
+        """
+        if self._pooled_backend is None:
+            return self._n_frames_skipped
+        return self._pooled_backend.n_frames_skipped - self._n_frames_skipped_at_checkout
+
     @property
     def height(self):
         return self.backend.height
@@ -107,7 +342,7 @@ class VideoLoader:
         self.seek_to_frame(0)
         return self.remaining_frames()
 
-    def select_frames(self, frame_indices):
+    def select_frames(self, frame_indices, roi=None, check=None):
         """Iterate over frames selected by frame index.
 
         Frames will be yielded in ascending order of frame index, regardless of the way
@@ -115,11 +350,76 @@ class VideoLoader:
 
         Args:
             frame_indices (Sequence of int): Indices of frames to read.
+            roi (tuple of int): Region of interest (top, left, height, width) to read from
+                these frames, instead of the loader's region of interest.
+            check: Optional function to call before decoding each frame. It may raise an
+                exception to stop reading early (eg. when the request has been cancelled).
 
         Returns:
             Iterator[torch.Tensor]: An iterator of image tensors.
         """
-        return self.backend.select_frames(frame_indices)
+        frames = self.backend.select_frames(frame_indices, **_select_kwargs(roi, check))
+        if self.stats is None:
+            return frames
+        return self._counted(frames)
+
+    def _counted(self, frames):
+        for frame in frames:
+            self._count_returned()
+            yield frame
+
+    def select_frames_stacked(self, frame_indices, out=None, roi=None, check=None):
+        """Read frames selected by frame index into a single tensor.
+
+        This is equivalent to stacking the result of `select_frames`, but avoids allocating
+        and postprocessing each frame separately.
+
+        Args:
+            frame_indices (Sequence of int): Indices of frames to read.
+            out (torch.Tensor): Optional [N x 3 x H x W] tensor to write the frames into.
+            roi (tuple of int): Region of interest (top, left, height, width) to read from
+                these frames, instead of the loader's region of interest.
+            check: Optional function to call before decoding each frame (see `select_frames`).
+
+        Returns:
+            torch.Tensor: The frames, stacked along the first dimension.
+        """
+        frames = self.backend.select_frames_stacked(frame_indices, out,
+                                                    **_select_kwargs(roi, check))
+        self._count_returned(len(frames))
+        return frames
+
+    def sliding_windows(self, length, stride=1, dilation=1):
+        """Iterate over overlapping clips of frames, decoding the video only once.
+
+        The i-th window contains the frames with indices
+        `i * stride + j * dilation` for `j` in `range(length)`. Only windows which fit entirely
+        within the video are produced. The video is read forwards in a single pass, with each
+        frame decoded once and kept in a ring buffer for as long as upcoming windows need it.
+        Frames which are not part of any window (when `stride` exceeds the span of a window) are
+        skipped over.
+
+        Windows are views into the ring buffer, so they must not be modified in-place, and are
+        only valid until the next window is requested. Clone a window to keep it for longer.
+        The loader's backend is locked while windows are being iterated over.
+
+        Args:
+            length (int): Number of frames in each window.
+            stride (int): Step between the first frames of consecutive windows.
+            dilation (int): Step between consecutive frames within a window.
+
+        Returns:
+            Iterator[torch.Tensor]: An iterator of [length x 3 x H x W] window tensors.
+        """
+        windows = self.backend.sliding_windows(length, stride, dilation)
+        if self.stats is None:
+            return windows
+        return self._counted_windows(windows)
+
+    def _counted_windows(self, windows):
+        for window in windows:
+            self._count_returned(len(window))
+            yield window
 
     def select_frame(self, frame_index):
         """Read a single frame by frame index.
@@ -130,44 +430,148 @@ class VideoLoader:
         Returns:
             torch.Tensor: Frame image tensor.
         """
-        return self.backend.select_frame(frame_index)
+        frame = self.backend.select_frame(frame_index)
+        self._count_returned()
+        return frame
 
 
 class VideoLoaderPool:
     def __init__(self, slots: Dict[str, int]):
-        self.slots = slots
-        self.condition = Condition(RLock())
+        """Manage VideoLoader instances across multiple devices.
 
-    def peek_slot(self):
-        for device, available in self.slots.items():
-            if available > 0:
-                return device
-        return None
+        Each device has a fixed number of slots, which limits how many VideoLoader instances may
+        use the device at once. Backends are kept open between uses of a slot, and are only
+        reopened when a slot is used for a different video file. When choosing a device, slots
+        which already have the requested file open are preferred, followed by the device with
+        the least outstanding work.
 
-    def remove_slot(self):
-        device = self.peek_slot()
+        Args:
+            slots (dict): Number of slots for each device.
+        """
+        self.slots = slots
+        self.capacity = dict(slots)
+        self.condition = Condition(RLock())
+        self.backend_pool = BackendPool(max_idle=sum(self.capacity.values()))
+        # Smoothed time (in seconds) for which loaders on each device are held before being
+        # released. This includes the time spent decoding, but also any time that the holder
+        # spends on other work, so it is only a rough measure of each device's throughput.
+        self.hold_times: Dict[str, float] = {}
+        # Devices and start times of loaders which are currently checked out.
+        self._checked_out = {}
+        self._async_waiters = deque()
+
+    def _load(self, device):
+        """Estimate the outstanding work on a device after adding another loader to it."""
+        in_use = self.capacity[device] - self.slots[device]
+        # Devices which have not been measured yet are assumed to be as fast as the fastest.
+        hold_time = self.hold_times.get(device, min(self.hold_times.values(), default=1.0))
+        return (in_use + 1) / self.capacity[device] * hold_time
+
+    def peek_slot(self, filename=None, dtype=torch.float32, backend_opts_by_device=None):
+        if backend_opts_by_device is None:
+            backend_opts_by_device = {}
+        available = [device for device, n in self.slots.items() if n > 0]
+        if not available:
+            return None
+        if filename is not None:
+            for device in available:
+                if self.backend_pool.has_idle(filename, device, dtype,
+                                              backend_opts_by_device.get(device, None)):
+                    return device
+        return min(available, key=self._load)
+
+    def remove_slot(self, filename=None, dtype=torch.float32, backend_opts_by_device=None):
+        device = self.peek_slot(filename, dtype, backend_opts_by_device)
         if device is None:
             raise Exception('No slots available')
         self.slots[device] -= 1
         return device
 
     def add_slots(self, device, n=1):
-        available = self.slots.get(device, 0)
-        self.slots[device] = available + n
+        available = self.slots.get(device, 0) + n
+        self.slots[device] = available
+        self.capacity[device] = max(self.capacity.get(device, 0), available)
+        self.backend_pool.max_idle = sum(self.capacity.values())
+
+    def _create_loader(self, filename, device, dtype, backend_opts_by_device):
+        if backend_opts_by_device is None:
+            backend_opts_by_device = {}
+        try:
+            vl = VideoLoader(filename, device, dtype, backend_opts_by_device.get(device, None),
+                             backend_pool=self.backend_pool)
+        except BaseException:
+            self._release_slot(device, None)
+            raise
+        with self.condition:
+            self._checked_out[vl] = (device, perf_counter())
+        return vl
+
+    def _release_slot(self, device, hold_time):
+        with self.condition:
+            if hold_time is not None:
+                old_hold_time = self.hold_times.get(device)
+                if old_hold_time is None:
+                    self.hold_times[device] = hold_time
+                else:
+                    self.hold_times[device] = old_hold_time + 0.3 * (hold_time - old_hold_time)
+            self.add_slots(device, 1)
+            self.condition.notify()
+            # Wake up coroutines which are waiting for a slot.
+            while self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                loop.call_soon_threadsafe(_set_future_result, waiter)
+
+    def release(self, vl: VideoLoader):
+        """Return a VideoLoader obtained with `acquire` to the pool."""
+        with self.condition:
+            device, start_time = self._checked_out.pop(vl)
+        vl.close()
+        self._release_slot(device, perf_counter() - start_time)
+
+    async def acquire(self, filename, dtype=torch.float32, backend_opts_by_device=None) -> VideoLoader:
+        """Wait for a free slot without blocking the event loop, and create a VideoLoader.
+
+        The VideoLoader must be returned to the pool with `release` when it is no longer needed.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                device = self.peek_slot(filename, dtype, backend_opts_by_device)
+                if device is not None:
+                    self.slots[device] -= 1
+                    break
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+        future = loop.run_in_executor(None, self._create_loader, filename, device, dtype,
+                                      backend_opts_by_device)
+        try:
+            # Shielding keeps the future running if the caller is cancelled, so that the loader
+            # it creates can still be returned to the pool.
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, future):
+        """Release a loader which was created for a cancelled `acquire` call."""
+        if not future.cancelled() and future.exception() is None:
+            self.release(future.result())
 
     @contextmanager
     def loader(self, filename, dtype=torch.float32, backend_opts_by_device=None):
         with self.condition:
             while self.peek_slot() is None:
                 self.condition.wait()
-            device = self.remove_slot()
-
-        if backend_opts_by_device is None:
-            backend_opts_by_device = {}
+            device = self.remove_slot(filename, dtype, backend_opts_by_device)
 
+        vl = self._create_loader(filename, device, dtype, backend_opts_by_device)
         try:
-            yield VideoLoader(filename, device, dtype, backend_opts_by_device.get(device, None))
+            yield vl
         finally:
-            with self.condition:
-                self.add_slots(device, 1)
-                self.condition.notify()
+            self.release(vl)
+
+
+def _set_future_result(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,230 @@
+"""Loading video frames from asyncio code.
+
+`AsyncVideoLoader` wraps a `tvl.VideoLoader` so that frames can be awaited without blocking the
+event loop. Decoding runs on a shared pool of decode threads, so many concurrent requests can
+overlap file I/O and decoding. Cancelling a request stops its decode thread at the next frame
+boundary.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+
+import torch
+
+import tvl
+
+# Thread pool shared by all AsyncVideoLoader instances which are not given an executor explicitly.
+_decode_executor: Optional[Executor] = None
+
+
+def set_decode_executor(executor: Optional[Executor]):
+    """Set the executor used by AsyncVideoLoader instances in this process to decode frames.
+
+    Args:
+        executor (Executor): The executor, or `None` to create a default thread pool on demand.
+    """
+    global _decode_executor
+    _decode_executor = executor
+
+
+def get_decode_executor() -> Executor:
+    """Get the executor used by AsyncVideoLoader instances in this process to decode frames."""
+    global _decode_executor
+    if _decode_executor is None:
+        _decode_executor = ThreadPoolExecutor(max_workers=os.cpu_count(),
+                                              thread_name_prefix='tvl-decode')
+    return _decode_executor
+
+
+_END = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _select_frames(vl, frame_indices, cancelled, stacked, out=None, roi=None):
+    """Read selected frames, stopping early if `cancelled` is set."""
+    def check():
+        if cancelled.is_set():
+            raise _Cancelled()
+
+    try:
+        if stacked:
+            return vl.select_frames_stacked(frame_indices, out, roi=roi, check=check)
+        return list(vl.select_frames(frame_indices, roi=roi, check=check))
+    except _Cancelled:
+        return None
+
+
+class AsyncVideoLoader:
+    def __init__(self, filename, device, dtype=torch.float32, backend_opts=None, *,
+                 executor: Optional[Executor] = None, **kwargs):
+        """Create an asyncio video loader for a particular video file.
+
+        The video file is opened on first use, or when entering the loader as an async context
+        manager. Concurrent requests on one loader are safe (see `tvl.VideoLoader`), but are
+        decoded one at a time. Use separate loaders to decode in parallel.
+
+        Args:
+            filename: Path to the video file.
+            device: Device to load frames onto.
+            dtype: Data type of loaded frames.
+            backend_opts (dict): Backend-specific options.
+            executor (Executor): Executor to decode frames on. Defaults to the process-wide
+                decode thread pool (see `set_decode_executor`).
+            **kwargs: Other keyword arguments for `tvl.VideoLoader`.
+        """
+        self.filename = filename
+        self.device = device
+        self.dtype = dtype
+        self.backend_opts = backend_opts
+        self.executor = executor
+        self._loader_kwargs = kwargs
+        self._loader: Optional[tvl.VideoLoader] = None
+        self._open_lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        executor = self.executor
+        if executor is None:
+            executor = get_decode_executor()
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    async def open(self) -> tvl.VideoLoader:
+        """Open the video file (if it is not open already).
+
+        Returns:
+            tvl.VideoLoader: The underlying synchronous video loader.
+        """
+        async with self._open_lock:
+            if self._loader is None:
+                self._loader = await self._run(
+                    lambda: tvl.VideoLoader(self.filename, self.device, self.dtype,
+                                            self.backend_opts, **self._loader_kwargs))
+        return self._loader
+
+    async def close(self):
+        """Close the underlying video loader, returning its backend to the backend pool (if any)."""
+        async with self._open_lock:
+            if self._loader is not None:
+                self._loader.close()
+                self._loader = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def duration(self):
+        return (await self.open()).duration
+
+    async def frame_rate(self):
+        return (await self.open()).frame_rate
+
+    async def n_frames(self):
+        return (await self.open()).n_frames
+
+    async def seek(self, time_secs):
+        vl = await self.open()
+        await self._run(vl.seek, time_secs)
+
+    async def seek_to_frame(self, frame_index):
+        vl = await self.open()
+        await self._run(vl.seek_to_frame, frame_index)
+
+    async def read_frame(self):
+        vl = await self.open()
+        return await self._run(vl.read_frame)
+
+    async def _select(self, frame_indices, stacked, out=None, roi=None):
+        vl = await self.open()
+        cancelled = threading.Event()
+        try:
+            return await self._run(_select_frames, vl, frame_indices, cancelled, stacked, out,
+                                   roi)
+        except asyncio.CancelledError:
+            # Stop the decode thread at the next frame boundary.
+            cancelled.set()
+            raise
+
+    async def select_frames(self, frame_indices, roi=None):
+        """Read frames selected by frame index.
+
+        Args:
+            frame_indices (Sequence of int): Indices of frames to read.
+            roi (tuple of int): Region of interest (top, left, height, width) to read from
+                these frames, instead of the loader's region of interest.
+
+        Returns:
+            List of torch.Tensor: Image tensors in ascending order of frame index.
+        """
+        return await self._select(frame_indices, stacked=False, roi=roi)
+
+    async def select_frames_stacked(self, frame_indices, out=None, roi=None):
+        """Read frames selected by frame index into a single tensor.
+
+        Args:
+            frame_indices (Sequence of int): Indices of frames to read.
+            out (torch.Tensor): Optional [N x 3 x H x W] tensor to write the frames into.
+            roi (tuple of int): Region of interest (top, left, height, width) to read from
+                these frames, instead of the loader's region of interest.
+
+        Returns:
+            torch.Tensor: The frames, stacked along the first dimension.
+        """
+        return await self._select(frame_indices, stacked=True, out=out, roi=roi)
+
+    async def select_frame(self, frame_index):
+        vl = await self.open()
+        return await self._run(vl.select_frame, frame_index)
+
+    async def remaining_frames(self, read_ahead=4):
+        """Iterate asynchronously over remaining frames in the video.
+
+        Frames are decoded in the background, up to `read_ahead` frames ahead of the consumer.
+        Decoding stops when the iteration is stopped early or cancelled.
+
+        Args:
+            read_ahead (int): Maximum number of decoded frames waiting to be consumed.
+        """
+        vl = await self.open()
+        queue = asyncio.Queue(maxsize=read_ahead)
+
+        async def produce():
+            try:
+                while True:
+                    try:
+                        frame = await self._run(vl.read_frame)
+                    except EOFError:
+                        break
+                    await queue.put(frame)
+                await queue.put(_END)
+            except Exception as e:
+                await queue.put(e)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+
+    async def read_all_frames(self, read_ahead=4):
+        """Iterate asynchronously over all frames in the video."""
+        await self.seek_to_frame(0)
+        async for frame in self.remaining_frames(read_ahead):
+            yield frame
@@ -1,13 +1,23 @@
 import os.path
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from contextlib import contextmanager
+from threading import RLock
+from time import perf_counter
+from typing import Optional
 
 import torch
 
+import tvl.metadata
+import tvl.pixel_format
+import tvl.stats
+from tvl.seek_cost import SeekCostModel
 from tvl.transforms import resize
 
 
 class Backend(ABC):
-    def __init__(self, filename, device, dtype, seek_threshold, out_width, out_height):
+    def __init__(self, filename, device, dtype, seek_threshold, out_width, out_height,
+                 pixel_format='rgb_planar', roi=None):
         """Create a video-reading backend instance for a particular video file.
 
         Args:
@@ -16,10 +26,18 @@ class Backend(ABC):
             dtype:
             seek_threshold (int): Hint for predicting when seeking to the next target frame
                 would be faster than reading and discarding intermediate frames. Setting this value
-                close to the video's GOP size should be a reasonable choice.
+                close to the video's GOP size should be a reasonable choice. This is only used
+                when the backend does not know the positions of keyframes in the video. If
+                `None`, the threshold is tuned automatically from the measured costs of seeking
+                and decoding (see `tvl.seek_cost`).
             out_width (int): Desired output width of read frames.
             out_height (int): Desired output height of read frames.
+            pixel_format (str): Layout of read frames (see `tvl.pixel_format`).
+            roi (tuple of int): Region of interest (top, left, height, width) in source frame
+                pixels. Only this region of each frame is read, and it is resized to
+                `out_width` x `out_height` if they are given.
         """
+        tvl.pixel_format.check_pixel_format(pixel_format)
         self.filename = filename
         if not os.path.isfile(filename):
             raise FileNotFoundError(filename)
@@ -27,9 +45,59 @@ class Backend(ABC):
         if self.device.type == 'cuda' and self.device.index is None:
             self.device = torch.device('cuda', torch.cuda.current_device())
         self.dtype = dtype
+        # When set, seek thresholds are learned from the reads made by `select_frames`.
+        self.auto_seek_threshold = seek_threshold is None
+        if seek_threshold is None:
+            seek_threshold = self.default_seek_threshold
         self.seek_threshold = seek_threshold
+        # Extra number of frames that must be saved by seeking to a keyframe for the seek to be
+        # worthwhile, when keyframe positions are known.
+        self.keyframe_seek_threshold = 0
+        self._seek_cost_model: Optional[SeekCostModel] = None
+        # Metadata key of seek costs which have been measured but not yet shared with other
+        # backends (see `_save_seek_costs`).
+        self._unsaved_seek_costs_key = None
+        # Number of frames which were decoded but not returned when reading selected frames.
+        self.n_frames_skipped = 0
         self._out_width = out_width
         self._out_height = out_height
+        self.pixel_format = pixel_format
+        self.roi = self._check_roi(roi)
+        self._check_out_size()
+        # The metadata key is computed once, since doing so involves a file system call.
+        self._metadata_key = tvl.metadata.metadata_key(filename, type(self).__name__)
+        self._metadata = tvl.metadata.get_metadata_by_key(self._metadata_key)
+        # Guards the decoder state (eg. the read position) when the backend is shared by threads.
+        self.lock = RLock()
+        # Instrumentation for the loader currently using this backend (see `tvl.stats`), or
+        # `None` if instrumentation is disabled.
+        self.stats: Optional[tvl.stats.Stats] = None
+        if self.auto_seek_threshold:
+            self._load_seek_costs()
+
+    # Seek threshold used before any seek costs have been measured.
+    default_seek_threshold = 3
+
+    # Whether `_read_raw_frame` crops frames to the region of interest itself (so that only the
+    # region is colour converted). Otherwise, frames are cropped when they are postprocessed.
+    crops_natively = False
+
+    # Whether returned frames may share memory which is overwritten by later reads (eg. a ring of
+    # reusable frame buffers), so that frames must be copied before being kept.
+    reuses_frame_memory = False
+
+    def _timer(self, stage):
+        """Get a context manager which times a loading stage (if instrumentation is enabled)."""
+        stats = self.stats
+        if stats is None:
+            return tvl.stats.NULL_TIMER
+        return stats.timer(stage)
+
+    def _count(self, name, n=1):
+        """Add to an instrumentation counter (if instrumentation is enabled)."""
+        stats = self.stats
+        if stats is not None:
+            stats.count(name, n)
 
     @property
     @abstractmethod
@@ -56,11 +124,38 @@ class Backend(ABC):
     def height(self):
         """The original height of a frame in the video file."""
 
+    def _probe_metadata(self):
+        """Read metadata from the video file.
+
+        Backends which support metadata caching should override this to return a dictionary of
+        metadata values (such as 'duration', 'frame_rate', 'n_frames', 'width', and 'height').
+        """
+        return {}
+
+    def _get_metadata(self, name):
+        """Get a metadata value, probing the video file only if it is not already cached."""
+        if name not in self._metadata:
+            with self.lock:
+                self._set_metadata(**self._probe_metadata())
+        return self._metadata[name]
+
+    def _set_metadata(self, **values):
+        """Store metadata values, sharing them with other backends in this process."""
+        tvl.metadata.update_metadata_by_key(self._metadata_key, **values)
+        self._metadata.update(values)
+
+    @property
+    def keyframe_indices(self):
+        """Sorted indices of the keyframes in the video, or `None` if they are not known."""
+        return None
+
     @property
     def out_width(self):
         """The width of the output image after reading."""
         if self._out_width > 0:
             return self._out_width
+        elif self.roi is not None:
+            return self.roi[3]
         else:
             return self.width
 
@@ -69,9 +164,95 @@ class Backend(ABC):
         """The height of the output image after reading."""
         if self._out_height > 0:
             return self._out_height
+        elif self.roi is not None:
+            return self.roi[2]
         else:
             return self.height
 
+    def _check_roi(self, roi):
+        if roi is None:
+            return None
+        roi = tuple(int(value) for value in roi)
+        if len(roi) != 4 or roi[0] < 0 or roi[1] < 0 or roi[2] <= 0 or roi[3] <= 0:
+            raise ValueError(f'expected a region of interest (top, left, height, width), '
+                             f'got {roi}')
+        if self.pixel_format == 'yuv420p' and not self.crops_natively:
+            # Cropping in postprocessing only works for formats with whole-resolution planes.
+            raise ValueError(f'{type(self).__name__} does not support regions of interest for '
+                             f'yuv420p frames')
+        return roi
+
+    def _check_out_size(self):
+        """Check the parts of the output size which are known before the video is opened."""
+        if self.pixel_format != 'yuv420p':
+            return
+        height, width = self._out_height, self._out_width
+        if self.roi is not None:
+            height, width = height or self.roi[2], width or self.roi[3]
+        odd = [f'{name} {size}' for name, size in [('width', width), ('height', height)]
+               if size % 2 != 0]
+        if odd:
+            # Otherwise decoders which cannot produce such frames would only fail when reading.
+            raise ValueError(f'yuv420p frames must have an even width and height, '
+                             f'got {", ".join(odd)}')
+
+    @contextmanager
+    def _region_of_interest(self, roi):
+        """Temporarily read frames with a different region of interest.
+
+        Must be used with the lock held. If `roi` is `None`, the current region is kept.
+        """
+        if roi is None:
+            yield
+            return
+        previous = self.roi
+        self.roi = self._check_roi(roi)
+        try:
+            yield
+        finally:
+            self.roi = previous
+
+    def _roi_region(self, height, width):
+        """Get the region of interest within a decoded frame of the given size.
+
+        The region of interest is given in source frame pixels. If the decoder has scaled the
+        frame, the region is scaled to match.
+
+        Returns:
+            tuple of int: The region (top, left, height, width).
+        """
+        t, l, h, w = self.roi
+        if t + h > self.height or l + w > self.width:
+            raise ValueError(f'region of interest {self.roi} is outside of the '
+                             f'{self.width}x{self.height} frame')
+        if (height, width) != (self.height, self.width):
+            sy = height / self.height
+            sx = width / self.width
+            t, l = round(t * sy), round(l * sx)
+            h, w = max(round(h * sy), 1), max(round(w * sx), 1)
+        return t, l, h, w
+
+    @property
+    def _crops_in_postprocess(self):
+        return self.roi is not None and not self.crops_natively
+
+    @property
+    def _crops_raw_frames(self):
+        # The default `_read_raw_frame` reads frames with `read_frame`, so they are already cropped.
+        return self._crops_in_postprocess \
+            and type(self)._read_raw_frame is not Backend._read_raw_frame
+
+    def _crop_to_roi(self, frames):
+        """Crop a raw frame (or a batch of raw frames) to the region of interest."""
+        h_dim = -3 if self.pixel_format == 'rgb_hwc' else -2
+        t, l, h, w = self._roi_region(frames.shape[h_dim], frames.shape[h_dim + 1])
+        return frames.narrow(h_dim, t, h).narrow(h_dim + 1, l, w)
+
+    @property
+    def frame_shape(self):
+        """The shape of a frame tensor after reading."""
+        return tvl.pixel_format.frame_shape(self.pixel_format, self.out_height, self.out_width)
+
     @abstractmethod
     def seek(self, time_secs):
         """Seek to the specified time in the video file."""
@@ -83,46 +264,356 @@ class Backend(ABC):
     def read_frame(self):
         """Read a single video frame as an RGB PyTorch tensor."""
 
+    def _read_raw_frame(self):
+        """Read a single video frame as an RGB PyTorch tensor, without postprocessing.
+
+        Backends should override this so that batched reads can postprocess many frames at once.
+        By default, frames are read with `read_frame`.
+        """
+        return self.read_frame()
+
+    def release_frame(self, frame):
+        """Indicate that a frame returned by this backend is no longer needed.
+
+        Backends which reuse frame memory can override this to recycle the frame's memory. The
+        frame must not be used after it has been released.
+        """
+
+    def _skip_frame(self):
+        """Read a single video frame and discard it.
+
+        Backends can override this to avoid converting frames which will not be used.
+        """
+        self._read_raw_frame()
+
+    def _record_skipped(self, n=1):
+        """Record that `n` frames were decoded, but not returned."""
+        self.n_frames_skipped += n
+        self._count('frames_skipped', n)
+
+    def _discard_frame(self):
+        """Skip a frame while reading ahead to a selected frame."""
+        self._skip_frame()
+        self._record_skipped()
+
     def read_frames(self, n):
-        return [self.read_frame() for _ in range(n)]
+        with self.lock:
+            return [self.read_frame() for _ in range(n)]
+
+    def read_frames_into(self, n, out=None):
+        """Read a sequence of frames into a single [N, 3, H, W] tensor.
+
+        Args:
+            n (int): Number of frames to read.
+            out (torch.Tensor): Optional tensor to write the frames into.
 
-    def select_frames(self, frame_indices):
+        Returns:
+            torch.Tensor: The frames, stacked along the first dimension.
+        """
+        with self.lock:
+            return self._stack_frames((self._read_raw_frame() for _ in range(n)), n, out)
+
+    def _should_seek(self, pos, frame_index):
+        """Predict whether seeking to `frame_index` is faster than reading forwards from `pos`."""
+        if pos is None:
+            return True
+        keyframes = self.keyframe_indices
+        if keyframes is None:
+            return frame_index - pos > self.seek_threshold
+        # Seeking lands on the nearest keyframe at or before the target frame, so it only saves
+        # decoding work when that keyframe is beyond the current position.
+        k = bisect_right(keyframes, frame_index) - 1
+        return k >= 0 and keyframes[k] - pos > self.keyframe_seek_threshold
+
+    def _seek_costs_key(self):
+        # Seek costs include the decoding from wherever the seek lands when keyframe positions are
+        # unknown, so they are stored separately.
+        return 'seek_costs' if self.keyframe_indices is None else 'keyframe_seek_costs'
+
+    def _load_seek_costs(self):
+        """Start from seek costs learned by earlier backends for the same file (if any)."""
+        for key in ('seek_costs', 'keyframe_seek_costs'):
+            costs = self._metadata.get(key)
+            if costs is not None:
+                self._apply_seek_threshold(key, SeekCostModel(costs).threshold)
+
+    def _apply_seek_threshold(self, key, threshold):
+        if threshold is None:
+            return
+        if key == 'seek_costs':
+            self.seek_threshold = int(round(threshold))
+        else:
+            self.keyframe_seek_threshold = threshold
+
+    def _update_seek_costs(self, seek_index, seek_secs, frame_secs):
+        """Learn from the timings of a read segment, and update the seek threshold.
+
+        Args:
+            seek_index (int): Index of the frame which was sought.
+            seek_secs (float): Time taken to seek and read the first frame.
+            frame_secs (list): (seconds, kept) pairs for the remaining frames in the segment.
+        """
+        key = self._seek_costs_key()
+        model = self._seek_cost_model
+        if model is None:
+            model = SeekCostModel(self._metadata.get(key))
+            self._seek_cost_model = model
+        for secs, kept in frame_secs:
+            model.observe_frame(secs, kept)
+        n_preroll = 0
+        keyframes = self.keyframe_indices
+        if keyframes is not None:
+            n_preroll = seek_index - keyframes[max(bisect_right(keyframes, seek_index) - 1, 0)]
+        model.observe_seek(seek_secs, n_preroll)
+        self._apply_seek_threshold(key, model.threshold)
+        self._unsaved_seek_costs_key = key
+
+    def _save_seek_costs(self):
+        """Share measured seek costs with other backends for the same file.
+
+        This is done once per read, rather than after every read segment, to keep the metadata
+        cache out of the decoding loop.
+        """
+        with self.lock:
+            key = self._unsaved_seek_costs_key
+            if key is None:
+                return
+            self._unsaved_seek_costs_key = None
+            self._set_metadata(**{key: self._seek_cost_model.as_dict()})
+
+    @property
+    def seek_costs(self):
+        """Measured seek and decode costs (in seconds), or `None` if nothing has been measured."""
+        if self._seek_cost_model is None:
+            return None
+        return self._seek_cost_model.as_dict()
+
+    def _read_segment(self, seek_index, seq_len, seq_keepers, read_fn, check=None):
+        """Seek and read through a segment planned by `_plan_reads`.
+
+        Must be called with the lock held.
+
+        Args:
+            seek_index (int): Index of the frame to seek to.
+            seq_len (int): Number of frames to read after seeking.
+            seq_keepers (Iterable of int): Offsets of frames to keep.
+            read_fn: Function for reading a kept frame.
+            check: Optional function to call before reading each frame.
+
+        Returns:
+            Iterator[torch.Tensor]: The kept frames.
+        """
+        seq_keepers = set(seq_keepers)
+        tune = self.auto_seek_threshold
+        seek_secs = None
+        frame_secs = []
+        start = perf_counter() if tune else None
+        self.seek_to_frame(seek_index)
+        for i in range(seq_len):
+            if check is not None:
+                check()
+            kept = i in seq_keepers
+            frame = read_fn() if kept else self._discard_frame()
+            if tune:
+                end = perf_counter()
+                if i == 0:
+                    seek_secs = end - start
+                else:
+                    frame_secs.append((end - start, kept))
+            if kept:
+                yield frame
+            if tune:
+                # Do not count the time spent by the consumer of a kept frame.
+                start = perf_counter()
+        if tune and seek_secs is not None:
+            self._update_seek_costs(seek_index, seek_secs, frame_secs)
+
+    def _plan_reads(self, frame_indices):
+        """Plan the seeks and sequential reads required to load a set of frames.
+
+        Args:
+            frame_indices (Sequence of int): Indices of frames to read.
+
+        Returns:
+            list: Read segments of the form `[seek_index, n_frames, keepers]`, where `keepers`
+            contains the offsets of wanted frames within the segment.
+        """
+        segments = []
+        pos = None
         # We will be loading unique frames in ascending index order.
-        sorted_frame_indices = list(sorted(set(frame_indices)))
-
-        pos = -(self.seek_threshold + 1)
-        seq_len = 0
-        seq_keepers = []
-        for frame_index in sorted_frame_indices:
-            if frame_index - pos > self.seek_threshold:
-                # Read previous sequence
-                if seq_len > 0:
-                    frames = self.read_frames(seq_len)
-                    for i in seq_keepers:
-                        yield frames[i]
-                    seq_keepers.clear()
-                    seq_len = 0
+        for frame_index in sorted(set(frame_indices)):
+            if self._should_seek(pos, frame_index):
                 # Skip to desired location by seeking.
-                self.seek_to_frame(frame_index)
-            else:
-                # Skip to desired location by reading and discarding intermediate frames.
-                while pos < frame_index:
-                    seq_len += 1
-                    pos += 1
-            # Read the frame that we care about.
-            seq_keepers.append(seq_len)
-            seq_len += 1
+                segments.append([frame_index, 0, []])
+            # Frames between the seek location and the desired frame are read and discarded.
+            segment = segments[-1]
+            segment[1] = frame_index - segment[0] + 1
+            segment[2].append(frame_index - segment[0])
             pos = frame_index + 1
-        if seq_len > 0:
-            frames = self.read_frames(seq_len)
-            for i in seq_keepers:
-                yield frames[i]
+        return segments
+
+    def select_frames(self, frame_indices, roi=None, check=None):
+        for seek_index, seq_len, seq_keepers in self._plan_reads(frame_indices):
+            # Every segment starts with a seek, so other threads may use the backend in between
+            # segments without disrupting this read.
+            with self.lock, self._region_of_interest(roi):
+                frames = list(self._read_segment(seek_index, seq_len, seq_keepers,
+                                                 self.read_frame, check))
+            yield from frames
+        self._save_seek_costs()
+
+    def select_frames_stacked(self, frame_indices, out=None, roi=None, check=None):
+        """Read frames selected by frame index into a single [N, 3, H, W] tensor.
+
+        Frames are stacked in ascending order of frame index, and duplicate frame indices are
+        ignored (as in `select_frames`).
+
+        Args:
+            frame_indices (Sequence of int): Indices of frames to read.
+            out (torch.Tensor): Optional tensor to write the frames into.
+            roi (tuple of int): Region of interest for these frames, instead of the backend's.
+            check: Optional function to call before decoding each frame. It may raise an
+                exception to stop reading early.
+
+        Returns:
+            torch.Tensor: The frames, stacked along the first dimension.
+        """
+        segments = self._plan_reads(frame_indices)
+
+        def read_raw_frames():
+            for seek_index, seq_len, seq_keepers in segments:
+                yield from self._read_segment(seek_index, seq_len, seq_keepers,
+                                              self._read_raw_frame, check)
+
+        n = sum(len(seq_keepers) for _, _, seq_keepers in segments)
+        with self.lock, self._region_of_interest(roi):
+            out = self._stack_frames(read_raw_frames(), n, out)
+        self._save_seek_costs()
+        return out
 
     def select_frame(self, frame_index):
         return next(self.select_frames([frame_index]))
 
+    def _stream_frames(self, frame_indices):
+        """Iterate over frames selected by frame index, without reading ahead of the consumer.
+
+        Unlike `select_frames`, frames are decoded as they are consumed, so only a bounded
+        number of frames is held in memory at once. The backend is locked while each read
+        segment is being iterated over.
+
+        Args:
+            frame_indices (Sequence of int): Indices of frames to read.
+
+        Returns:
+            Iterator[torch.Tensor]: The frames, in ascending order of frame index.
+        """
+        for seek_index, seq_len, seq_keepers in self._plan_reads(frame_indices):
+            with self.lock:
+                yield from self._read_segment(seek_index, seq_len, seq_keepers, self.read_frame)
+        self._save_seek_costs()
+
+    def sliding_windows(self, length, stride=1, dilation=1):
+        """Iterate over overlapping clips of frames in a single forward pass through the video.
+
+        See `tvl.VideoLoader.sliding_windows`.
+        """
+        if length < 1 or stride < 1 or dilation < 1:
+            raise ValueError('length, stride and dilation must all be positive')
+        span = (length - 1) * dilation + 1
+        window_starts = range(0, self.n_frames - span + 1, stride)
+        if len(window_starts) == 0:
+            return
+        frame_indices = sorted({start + i * dilation for start in window_starts
+                                for i in range(length)})
+        # Frames are written to the ring buffer at their offset from `base`. When the buffer
+        # fills up, the frames still needed by upcoming windows are moved back to the start.
+        capacity = 2 * span
+        ring = None
+        base = 0
+        windows = iter(window_starts)
+        window_start = next(windows)
+        for frame, frame_index in zip(self._stream_frames(frame_indices), frame_indices):
+            if ring is None:
+                ring = torch.empty((capacity, *frame.shape), dtype=frame.dtype,
+                                   device=frame.device)
+                self._count('bytes_allocated', ring.numel() * ring.element_size())
+            if frame_index - base >= capacity:
+                # Copy one frame at a time, since the source and destination may overlap.
+                for i in range(window_start - base, frame_index - base):
+                    ring[i - window_start + base].copy_(ring[i])
+                base = window_start
+            ring[frame_index - base].copy_(frame)
+            self.release_frame(frame)
+            if frame_index == window_start + span - 1:
+                offset = window_start - base
+                yield ring[offset:offset + span:dilation]
+                window_start = next(windows, None)
+
+    def _output_tensor(self, n, out=None):
+        """Allocate (or validate) a tensor for holding `n` output frames."""
+        out_shape = (n, *self.frame_shape)
+        if out is None:
+            out = torch.empty(out_shape, dtype=self.dtype, device=self.device)
+            self._count('bytes_allocated', out.numel() * out.element_size())
+            return out
+        if tuple(out.shape) != out_shape or out.dtype != self.dtype:
+            raise ValueError(f'expected out to be a {self.dtype} tensor with shape {out_shape}, '
+                             f'got a {out.dtype} tensor with shape {tuple(out.shape)}')
+        return out
+
+    def _stack_frames(self, raw_frames, n, out=None):
+        """Copy raw frames into a single batch tensor and postprocess them together.
+
+        Args:
+            raw_frames (Iterator[torch.Tensor]): Exactly `n` frames, as returned by
+                `_read_raw_frame`.
+            n (int): Number of frames.
+            out (torch.Tensor): Optional tensor to write the postprocessed frames into.
+
+        Returns:
+            torch.Tensor: The postprocessed frames, stacked along the first dimension.
+        """
+        out = self._output_tensor(n, out)
+        if n == 0:
+            return out
+        raw = None
+        for i, rgb in enumerate(raw_frames):
+            if raw is None:
+                if rgb.dtype == out.dtype and rgb.shape == out.shape[1:] \
+                        and not self._crops_raw_frames:
+                    # No postprocessing is required, so we can write directly to the output.
+                    raw = out
+                else:
+                    raw = torch.empty((n, *rgb.shape), dtype=rgb.dtype, device=out.device)
+                    self._count('bytes_allocated', raw.numel() * raw.element_size())
+            raw[i].copy_(rgb)
+        return self._postprocess_frames(raw, out)
+
+    def _postprocess_frames(self, rgb: torch.Tensor, out: torch.Tensor):
+        """Postprocess a batch of RGB image tensors, writing the result into `out`."""
+        if rgb is out:
+            return out
+        with self._timer('postprocess'):
+            if self._crops_raw_frames:
+                rgb = self._crop_to_roi(rgb)
+            if rgb.shape[-2:] != out.shape[-2:]:
+                return out.copy_(self._convert_dtype_and_resize(rgb))
+            # Convert the data type in a single pass over the batch.
+            if out.is_floating_point() and not rgb.is_floating_point():
+                return out.copy_(rgb).div_(255)
+            if rgb.is_floating_point() and not out.is_floating_point():
+                rgb = rgb.mul_(255)
+            return out.copy_(rgb)
+
     def _postprocess_frame(self, rgb: torch.Tensor):
         """Postprocess an RGB image tensor to have the expected dtype and size."""
+        with self._timer('postprocess'):
+            if self._crops_in_postprocess:
+                # Copy the region, so that the rest of the frame's memory can be freed.
+                return self._convert_dtype_and_resize(self._crop_to_roi(rgb)).contiguous()
+            return self._convert_dtype_and_resize(rgb)
+
+    def _convert_dtype_and_resize(self, rgb: torch.Tensor):
         if self.dtype == torch.float32:
             if not rgb.is_floating_point():
                 rgb = rgb.to(self.dtype).div_(255)
@@ -135,7 +626,10 @@ class Backend(ABC):
                 rgb = rgb.to(self.dtype)
         else:
             raise NotImplementedError(f'Unsupported dtype: {self.dtype}')
-        if self._out_height > 0 or self._out_width > 0:
+        # Only channels-first frames can be resized here. Backends must produce the other pixel
+        # formats at the output size.
+        if (self._out_height > 0 or self._out_width > 0) \
+                and tvl.pixel_format.is_channels_first(self.pixel_format):
             rgb = resize(rgb, (self.out_height, self.out_width))
         return rgb
 
@@ -0,0 +1,59 @@
+"""Reusable frame buffers.
+
+Allocating a fresh tensor for every decoded frame costs an allocation plus a pass over the frame
+to fault in its memory. A `FrameBufferRing` instead cycles through a fixed set of tensors. A
+backend that is given a ring writes each decoded frame into the ring's next buffer, and the
+returned frame is a view of that buffer.
+
+The recycling contract is simple: a buffer returned by `next_buffer` is overwritten by the
+`n_buffers`-th call after it. Consumers must therefore finish with (or copy) a frame before
+that many further frames have been read from the same ring.
+"""
+
+from threading import Lock
+
+import torch
+
+
+class FrameBufferRing:
+    def __init__(self, n_buffers, pin_memory=False):
+        """Create a ring of reusable CPU frame buffers.
+
+        Args:
+            n_buffers (int): Number of buffers in the ring.
+            pin_memory (bool): Allocate buffers in page-locked memory, so that copying frames to
+                a CUDA device can be asynchronous (`tensor.to(device, non_blocking=True)`).
+                Ignored when CUDA is not available.
+        """
+        if n_buffers < 1:
+            raise ValueError('n_buffers must be at least 1')
+        self.n_buffers = n_buffers
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self._buffers = [None] * n_buffers
+        self._next_index = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return self.n_buffers
+
+    def next_buffer(self, shape, dtype=torch.uint8) -> torch.Tensor:
+        """Take the next buffer from the ring.
+
+        The buffer is reallocated if it does not have the requested shape and data type.
+
+        Args:
+            shape (tuple of int): Shape of the buffer.
+            dtype (torch.dtype): Data type of the buffer.
+
+        Returns:
+            torch.Tensor: A contiguous buffer, which will be reused after `n_buffers` more calls.
+        """
+        shape = tuple(shape)
+        with self._lock:
+            index = self._next_index
+            self._next_index = (index + 1) % self.n_buffers
+            buffer = self._buffers[index]
+            if buffer is None or tuple(buffer.shape) != shape or buffer.dtype != dtype:
+                buffer = torch.empty(shape, dtype=dtype, pin_memory=self.pin_memory)
+                self._buffers[index] = buffer
+            return buffer
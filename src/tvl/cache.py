@@ -0,0 +1,194 @@
+"""Caching of decoded video frames.
+
+A `FrameCache` holds postprocessed frames in memory, so that frames which are requested more
+than once (eg. from overlapping clips) only need to be decoded once. One cache may be shared by
+many `VideoLoader` instances, either by passing it to each loader explicitly or by setting it as
+the process-wide default with `tvl.set_frame_cache`.
+"""
+
+import os
+import weakref
+from collections import OrderedDict
+from threading import Lock
+
+from tvl.backend import Backend
+
+
+def _tensor_bytes(tensor):
+    return tensor.numel() * tensor.element_size()
+
+
+class FrameCache:
+    def __init__(self, max_bytes):
+        """Create a least-recently-used cache of decoded frames.
+
+        Args:
+            max_bytes (int): Memory budget for cached frames, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+        # Every frame which has been stored, by id, for as long as the frame exists.
+        self._stored_frames = weakref.WeakValueDictionary()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        """Look up a frame, returning `None` if it is not in the cache."""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        """Add a frame to the cache, evicting least recently used frames to stay within budget."""
+        frame_bytes = _tensor_bytes(frame)
+        if frame_bytes > self.max_bytes:
+            return
+        with self._lock:
+            old_frame = self._frames.pop(key, None)
+            if old_frame is not None:
+                self.n_bytes -= _tensor_bytes(old_frame)
+            while self._frames and self.n_bytes + frame_bytes > self.max_bytes:
+                _, evicted_frame = self._frames.popitem(last=False)
+                self.n_bytes -= _tensor_bytes(evicted_frame)
+                self.evictions += 1
+            self._frames[key] = frame
+            self._stored_frames[id(frame)] = frame
+            self.n_bytes += frame_bytes
+
+    def shares(self, frame):
+        """Check whether a frame has been stored in the cache, and so may be used by others.
+
+        This remains true after the frame has been evicted, since it may already have been
+        returned to other readers.
+        """
+        with self._lock:
+            return self._stored_frames.get(id(frame)) is frame
+
+    def clear(self):
+        """Remove all frames from the cache."""
+        with self._lock:
+            self._frames.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        """Get a snapshot of the cache's counters."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        n_frames=len(self._frames), n_bytes=self.n_bytes)
+
+
+class CachedBackend(Backend):
+    def __init__(self, backend: Backend, frame_cache: FrameCache):
+        """Wrap a backend so that frames read by index are stored in a frame cache.
+
+        Frames returned from the cache are shared with other readers, and must not be modified
+        in-place.
+
+        Args:
+            backend (Backend): The backend to read uncached frames from.
+            frame_cache (FrameCache): The cache to store frames in.
+        """
+        super().__init__(backend.filename, backend.device, backend.dtype, backend.seek_threshold,
+                         backend._out_width, backend._out_height, backend.pixel_format,
+                         backend.roi)
+        self.backend = backend
+        self.frame_cache = frame_cache
+        self.lock = backend.lock
+        self._key_prefix = (os.path.abspath(self.filename), str(self.device), self.dtype,
+                            backend._out_height, backend._out_width, self.pixel_format)
+
+    # The wrapped backend reads frames, so it does any cropping to the region of interest.
+    crops_natively = True
+
+    @property
+    def duration(self):
+        return self.backend.duration
+
+    @property
+    def frame_rate(self):
+        return self.backend.frame_rate
+
+    @property
+    def n_frames(self):
+        return self.backend.n_frames
+
+    @property
+    def width(self):
+        return self.backend.width
+
+    @property
+    def height(self):
+        return self.backend.height
+
+    @property
+    def keyframe_indices(self):
+        return self.backend.keyframe_indices
+
+    def seek(self, time_secs):
+        self.backend.seek(time_secs)
+
+    def seek_to_frame(self, frame_index):
+        self.backend.seek_to_frame(frame_index)
+
+    def read_frame(self):
+        return self.backend.read_frame()
+
+    def read_frames(self, n):
+        return self.backend.read_frames(n)
+
+    def read_frames_into(self, n, out=None):
+        return self.backend.read_frames_into(n, out)
+
+    def release_frame(self, frame):
+        # Frames which are shared through the cache must not have their memory reused.
+        if not self.frame_cache.shares(frame):
+            self.backend.release_frame(frame)
+
+    def _frame_key(self, frame_index, roi):
+        return (*self._key_prefix, roi, int(frame_index))
+
+    def select_frames(self, frame_indices, roi=None, check=None):
+        roi = self._check_roi(roi) if roi is not None else self.roi
+        sorted_frame_indices = list(sorted(set(frame_indices)))
+        cached_frames = [self.frame_cache.get(self._frame_key(i, roi))
+                         for i in sorted_frame_indices]
+        # Only decode the frames which were not found in the cache.
+        missing_frame_indices = [i for i, frame in zip(sorted_frame_indices, cached_frames)
+                                 if frame is None]
+        decoded_frames = iter(())
+        if missing_frame_indices:
+            kwargs = {}
+            if roi is not None:
+                kwargs['roi'] = roi
+            if check is not None:
+                kwargs['check'] = check
+            decoded_frames = self.backend.select_frames(missing_frame_indices, **kwargs)
+        for frame_index, frame in zip(sorted_frame_indices, cached_frames):
+            if frame is None:
+                frame = next(decoded_frames)
+                # Frames in reusable memory would be overwritten while still in the cache.
+                cached_frame = frame.clone() if self.backend.reuses_frame_memory else frame
+                self.frame_cache.put(self._frame_key(frame_index, roi), cached_frame)
+            yield frame
+
+    def select_frames_stacked(self, frame_indices, out=None, roi=None, check=None):
+        with self.lock, self._region_of_interest(roi):
+            out = self._output_tensor(len(set(frame_indices)), out)
+            for i, frame in enumerate(self.select_frames(frame_indices, check=check)):
+                out[i].copy_(frame)
+        return out
+
+    def _stream_frames(self, frame_indices):
+        # Every frame is read once by a streaming read, so there is nothing to gain from caching.
+        return self.backend._stream_frames(frame_indices)
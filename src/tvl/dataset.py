@@ -1,33 +1,122 @@
-from concurrent.futures import Executor
+import math
+import random
+from collections import deque, defaultdict
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from time import perf_counter
 
+import torch
 from torch.utils.data.dataloader import default_collate
 from torch.utils.data.sampler import Sampler, BatchSampler, RandomSampler, SequentialSampler
 
+import tvl
+import tvl.stats
+
 
 class BatchDataIter:
     def __init__(self, loader):
         self.loader = loader
         self.batch_iter = iter(loader.batch_sampler)
-        self.batch_buffer = []
-        self.max_buffer_len = 2
+        # Examples which have been requested but not yet returned, as (submit time, future) pairs.
+        self.pending_examples = []
+        # Sizes of the batches which have been requested but not yet returned.
+        self.pending_batch_sizes = deque()
+        self.max_buffer_len = loader.prefetch_batches
+        # Smoothed estimates of how long it takes to produce a batch, and how long the consumer
+        # spends between requesting batches.
+        self.batch_latency = None
+        self.consumer_interval = None
+        self._last_return_time = None
 
     def _prepare_future_batches(self, batch_iter):
-        while len(self.batch_buffer) < self.max_buffer_len:
+        while len(self.pending_batch_sizes) < self.max_buffer_len:
             try:
                 batch_indices = next(batch_iter)
             except StopIteration:
                 break
-            future_batch = [self.loader.dataset[index] for index in batch_indices]
-            self.batch_buffer.append(future_batch)
+            submit_time = perf_counter()
+            self.loader._check_batch_size(len(batch_indices))
+            get_batch = getattr(self.loader.dataset, 'get_batch', None)
+            if get_batch is not None:
+                future_batch = get_batch(batch_indices)
+            else:
+                future_batch = [self.loader.dataset[index] for index in batch_indices]
+            self.pending_examples.extend((submit_time, example) for example in future_batch)
+            self.pending_batch_sizes.append(len(future_batch))
+
+    def _take_first_completed(self, n):
+        """Take `n` pending examples, preferring those which have finished loading."""
+        while True:
+            done = [item for item in self.pending_examples if item[1].done()]
+            if len(done) >= n:
+                break
+            wait([example for _, example in self.pending_examples if not example.done()],
+                 return_when=FIRST_COMPLETED)
+        taken = done[:n]
+        taken_ids = {id(example) for _, example in taken}
+        self.pending_examples = [item for item in self.pending_examples
+                                 if id(item[1]) not in taken_ids]
+        return taken
+
+    @staticmethod
+    def _production_time(taken):
+        """Estimate how long it took to produce a batch from its (submit time, future) pairs.
+
+        Futures with a `production_time` attribute (set by `AsyncDataset` and
+        `ProcessPoolDataset`) report the time spent loading the example, excluding time spent
+        waiting for a worker. Examples in a batch load in parallel, so the slowest one is taken.
+        Otherwise, the time since the batch was submitted is used instead.
+        """
+        times = [getattr(example, 'production_time', None) for _, example in taken]
+        if None in times:
+            return perf_counter() - min(t for t, _ in taken)
+        return max(times, default=0.0)
+
+    def _update_prefetch_depth(self, latency, interval):
+        alpha = 0.3
+        if self.batch_latency is None:
+            self.batch_latency = latency
+        else:
+            self.batch_latency += alpha * (latency - self.batch_latency)
+        if interval is None:
+            return
+        if self.consumer_interval is None:
+            self.consumer_interval = interval
+        else:
+            self.consumer_interval += alpha * (interval - self.consumer_interval)
+        if self.loader.adaptive_prefetch:
+            # Keep enough batches in flight to cover the time taken to produce one.
+            depth = math.ceil(self.batch_latency / max(self.consumer_interval, 1e-6))
+            self.max_buffer_len = min(max(depth, 1), self.loader.max_prefetch_batches)
 
     def __next__(self):
+        interval = None
+        if self._last_return_time is not None:
+            interval = perf_counter() - self._last_return_time
         self._prepare_future_batches(self.batch_iter)
-        if len(self.batch_buffer) == 0:
+        if len(self.pending_batch_sizes) == 0:
             raise StopIteration()
-        future_batch = self.batch_buffer.pop(0)
+        n = self.pending_batch_sizes.popleft()
+        wait_start = perf_counter()
+        if self.loader.in_order:
+            taken = self.pending_examples[:n]
+            self.pending_examples = self.pending_examples[n:]
+        else:
+            taken = self._take_first_completed(n)
+        future_batch = [example for _, example in taken]
         batch = [example.result() for example in future_batch]
+        if tvl.stats.is_stats_enabled():
+            tvl.stats.get_process_stats().add_time('wait', perf_counter() - wait_start)
+        self._update_prefetch_depth(self._production_time(taken), interval)
         self._prepare_future_batches(self.batch_iter)
-        return self.loader.collate(batch)
+        collated = self.loader.collate(batch)
+        # Examples may hold resources (eg. shared memory) which are no longer needed once they
+        # have been collated.
+        for example in future_batch:
+            release = getattr(example, 'release', None)
+            if release is not None:
+                release()
+        self._last_return_time = perf_counter()
+        return collated
 
     def __len__(self):
         return len(self.loader)
@@ -35,7 +124,8 @@ class BatchDataIter:
 
 class BatchDataLoader:
     def __init__(self, dataset, *, batch_size=1, shuffle=False, sampler=None, batch_sampler=None,
-                 collate_fn=default_collate, drop_last=False):
+                 collate_fn=default_collate, drop_last=False, prefetch_batches=2,
+                 adaptive_prefetch=False, max_prefetch_batches=16, in_order=True):
         """Loads batches of data from an asynchronous dataset.
 
         Args:
@@ -46,10 +136,24 @@ class BatchDataLoader:
             batch_sampler (Sampler):
             collate_fn (function):
             drop_last (bool):
+            prefetch_batches (int): Number of batches to request ahead of time.
+            adaptive_prefetch (bool): Automatically adjust the number of batches requested ahead
+                of time, based on how quickly batches are produced and consumed. In this case,
+                `prefetch_batches` is the initial value.
+            max_prefetch_batches (int): Upper limit for adaptive prefetching.
+            in_order (bool): Return batches as sampled. If `False`, batches are instead assembled
+                from whichever requested examples finish loading first, so that slow examples do
+                not hold up the pipeline. Batch sizes are unaffected.
         """
         self.dataset = dataset
         self.batch_size = batch_size
         self.collate = collate_fn
+        if prefetch_batches < 1:
+            raise ValueError('prefetch_batches must be at least 1')
+        self.prefetch_batches = prefetch_batches
+        self.adaptive_prefetch = adaptive_prefetch
+        self.max_prefetch_batches = max(max_prefetch_batches, prefetch_batches)
+        self.in_order = in_order
 
         if sampler is not None and shuffle:
             raise ValueError('sampler option is mutually exclusive with shuffle')
@@ -65,10 +169,19 @@ class BatchDataLoader:
                 else:
                     sampler = SequentialSampler(dataset)
             batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+            self._check_batch_size(batch_size)
 
         self.sampler = sampler
         self.batch_sampler = batch_sampler
 
+    def _check_batch_size(self, batch_size):
+        # Datasets with a limited number of unreleased examples (like `ProcessPoolDataset`) would
+        # never finish loading a batch which is larger than that limit.
+        max_unreleased = getattr(self.dataset, 'max_unreleased', None)
+        if max_unreleased is not None and batch_size > max_unreleased:
+            raise ValueError(f'batch size ({batch_size}) exceeds the number of examples that the '
+                             f'dataset can hold at once ({max_unreleased})')
+
     def __iter__(self):
         return BatchDataIter(self)
 
@@ -91,4 +204,170 @@ class AsyncDataset:
         return len(self.dataset)
 
     def __getitem__(self, index):
-        return self.executor.submit(self.dataset.__getitem__, index)
+        return _submit_timed(self.executor, self.dataset.__getitem__, index)
+
+    def get_batch(self, indices):
+        """Request a batch of examples.
+
+        If the wrapped dataset is able to plan batches (like `VideoClipDataset`), each group of
+        examples in the plan is loaded by a single task. Otherwise, examples are loaded
+        individually.
+
+        Args:
+            indices (Sequence of int): Indices of the examples.
+
+        Returns:
+            list of Future: A future for each example.
+        """
+        plan_batch = getattr(self.dataset, 'plan_batch', None)
+        if plan_batch is None:
+            return [self[index] for index in indices]
+        futures = [Future() for _ in indices]
+        futures_by_index = defaultdict(list)
+        for index, future in zip(indices, futures):
+            futures_by_index[index].append(future)
+        for group in plan_batch(indices):
+            group_future = _submit_timed(self.executor, self.dataset.load_group, group)
+            group_future.add_done_callback(
+                lambda f, group=group: _resolve_group(f, group, futures_by_index))
+        return futures
+
+
+def _submit_timed(executor, fn, *args):
+    """Submit a task to an executor, recording how long it runs for.
+
+    The time spent running the task (but not waiting for a worker) is stored as the
+    `production_time` attribute of the returned future before it completes.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        start_time = perf_counter()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.production_time = perf_counter() - start_time
+            future.set_exception(e)
+        else:
+            future.production_time = perf_counter() - start_time
+            future.set_result(result)
+
+    executor.submit(run)
+    return future
+
+
+def _resolve_group(group_future, group, futures_by_index):
+    """Pass on the result of loading a group of examples to the futures for each example."""
+    exception = group_future.exception()
+    for i, index in enumerate(group):
+        for future in futures_by_index[index]:
+            future.production_time = group_future.production_time
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(group_future.result()[i])
+
+
+class VideoClipDataset:
+    def __init__(self, videos, clip_length, *, stride=1, clip_step=None, jitter=0,
+                 device='cpu', dtype=torch.float32, backend_opts=None):
+        """A dataset of fixed-length clips taken from a collection of videos.
+
+        Clips from the same video which are requested together (see `plan_batch`) are read with
+        a single video loader, which reads forwards through the union of their frames.
+
+        Args:
+            videos (Sequence of str): Paths to the video files.
+            clip_length (int): Number of frames in each clip.
+            stride (int): Step between consecutive frames within a clip.
+            clip_step (int): Step between the first frames of consecutive clips from the same
+                video. Defaults to the span of a clip, so that clips do not overlap.
+            jitter (int): Maximum random offset (in frames) applied to the start of each clip
+                when it is loaded.
+            device: Device to load frames onto.
+            dtype: Data type of loaded frames.
+            backend_opts (dict): Backend-specific options.
+        """
+        self.videos = list(videos)
+        self.clip_length = clip_length
+        self.stride = stride
+        self.clip_span = (clip_length - 1) * stride + 1
+        self.clip_step = clip_step if clip_step is not None else self.clip_span
+        self.jitter = jitter
+        self.device = device
+        self.dtype = dtype
+        self.backend_opts = backend_opts
+
+        # Each clip is identified by a (video index, start frame index) pair.
+        self.n_frames = []
+        self.clips = []
+        for video_index, video in enumerate(self.videos):
+            with tvl.VideoLoader(video, device, dtype, backend_opts) as vl:
+                n_frames = vl.n_frames
+            self.n_frames.append(n_frames)
+            for start in range(0, n_frames - self.clip_span + 1, self.clip_step):
+                self.clips.append((video_index, start))
+
+    def __len__(self):
+        return len(self.clips)
+
+    def __getitem__(self, index):
+        return self.load_group([index])[0]
+
+    def clip_frame_indices(self, index):
+        """Choose the indices of frames in a clip, applying random jitter."""
+        video_index, start = self.clips[index]
+        if self.jitter > 0:
+            max_start = self.n_frames[video_index] - self.clip_span
+            start = min(max(start + random.randint(-self.jitter, self.jitter), 0), max_start)
+        return list(range(start, start + self.clip_span, self.stride))
+
+    def plan_batch(self, indices):
+        """Group the clips of a batch so that each group can be read with one video loader.
+
+        Args:
+            indices (Sequence of int): Indices of clips in the batch.
+
+        Returns:
+            list of list of int: Groups of clip indices. Each group contains clips from a single
+            video, ordered by position within the video.
+        """
+        groups = defaultdict(list)
+        for index in dict.fromkeys(indices):
+            groups[self.clips[index][0]].append(index)
+        return [sorted(group, key=lambda index: self.clips[index][1])
+                for _, group in sorted(groups.items())]
+
+    def load_group(self, indices):
+        """Load clips which all come from the same video.
+
+        Args:
+            indices (Sequence of int): Indices of the clips.
+
+        Returns:
+            list of dict: An example for each clip.
+        """
+        video_indices = {self.clips[index][0] for index in indices}
+        if len(video_indices) != 1:
+            raise ValueError('all clips in a group must come from the same video')
+        video_index = video_indices.pop()
+        clip_frame_indices = [self.clip_frame_indices(index) for index in indices]
+        # Read every frame that is needed by the group of clips in a single pass.
+        all_frame_indices = sorted(set().union(*clip_frame_indices))
+        with tvl.VideoLoader(self.videos[video_index], self.device, self.dtype,
+                             self.backend_opts) as vl:
+            frames = vl.select_frames_stacked(all_frame_indices)
+        positions = {frame_index: i for i, frame_index in enumerate(all_frame_indices)}
+        examples = []
+        for index, frame_indices in zip(indices, clip_frame_indices):
+            clip_positions = torch.as_tensor([positions[i] for i in frame_indices],
+                                             device=frames.device)
+            examples.append(dict(
+                frames=frames.index_select(0, clip_positions),
+                frame_indices=torch.as_tensor(frame_indices),
+                video_index=video_index,
+                example_index=index,
+            ))
+        return examples
@@ -0,0 +1,139 @@
+"""Persistent per-video keyframe indices.
+
+Building a keyframe index requires a pass over every packet in the video container, so the
+results are stored on disk and reused for as long as the video file remains unchanged. Indices
+are stored as small JSON files, either in a cache directory (the default) or alongside the video
+files that they describe. The same pass also finds the timestamp of every frame, so an index may
+store those too.
+"""
+
+import hashlib
+import json
+import os
+from typing import Callable, List, Optional, Sequence
+
+_INDEX_VERSION = 2
+
+# Directory in which index files are stored. If this is None, index files will be stored
+# alongside the video files they describe.
+_cache_dir: Optional[str] = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'tvl', 'keyframes',
+)
+
+
+def set_cache_dir(cache_dir):
+    """Set the directory in which keyframe index files are stored.
+
+    Args:
+        cache_dir (str): Path to the cache directory. If `None`, index files will be stored
+            alongside the video files that they describe instead.
+    """
+    global _cache_dir
+    _cache_dir = os.fspath(cache_dir) if cache_dir is not None else None
+
+
+def get_cache_dir():
+    """Get the directory in which keyframe index files are stored."""
+    return _cache_dir
+
+
+def index_path(filename):
+    """Get the path of the keyframe index file for a particular video file."""
+    filename = os.path.abspath(os.fspath(filename))
+    if _cache_dir is None:
+        return filename + '.keyframes.json'
+    key = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return os.path.join(_cache_dir, key + '.json')
+
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_keyframes(filename, with_frame_pts=False):
+    """Load the stored keyframe index for a video file.
+
+    Args:
+        filename: Path to the video file.
+        with_frame_pts (bool): Also load the stored frame timestamps.
+
+    Returns:
+        List of int: Sorted keyframe frame indices, or `None` if there is no valid stored index.
+        If `with_frame_pts` is set, a (keyframes, frame timestamps) pair is returned instead, in
+        which the timestamps are `None` if they were not stored.
+    """
+    try:
+        with open(index_path(filename), 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('version') != _INDEX_VERSION:
+        return None
+    # Discard indices which were built for a different version of the video file.
+    if data.get('file') != _file_signature(filename):
+        return None
+    if with_frame_pts:
+        return data['keyframes'], data.get('frame_pts')
+    return data['keyframes']
+
+
+def save_keyframes(filename, keyframes, frame_pts: Optional[Sequence[int]] = None):
+    """Store the keyframe index for a video file.
+
+    Failing to write the index file (eg. due to a read-only file system) is not considered to be
+    an error, since the index can always be rebuilt.
+
+    Args:
+        filename: Path to the video file.
+        keyframes (Sequence of int): Keyframe frame indices.
+        frame_pts (Sequence of int): Optional presentation timestamp of every frame.
+    """
+    path = index_path(filename)
+    data = {
+        'version': _INDEX_VERSION,
+        'file': _file_signature(filename),
+        'keyframes': sorted(int(e) for e in keyframes),
+    }
+    if frame_pts is not None:
+        data['frame_pts'] = [int(pts) for pts in frame_pts]
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def get_keyframes(filename, scan_keyframes: Callable, with_frame_pts=False):
+    """Get the keyframe index for a video file, building and storing it if necessary.
+
+    Args:
+        filename: Path to the video file.
+        scan_keyframes: Function which builds the keyframe index for a video file. If
+            `with_frame_pts` is set, it must return a (keyframes, frame timestamps) pair.
+        with_frame_pts (bool): Also get the frame timestamps. A stored index without them is
+            rebuilt.
+
+    Returns:
+        List of int: Sorted keyframe frame indices, or a (keyframes, frame timestamps) pair if
+        `with_frame_pts` is set.
+    """
+    if not with_frame_pts:
+        keyframes = load_keyframes(filename)
+        if keyframes is None:
+            keyframes = sorted(scan_keyframes(filename))
+            save_keyframes(filename, keyframes)
+        return keyframes
+    index = load_keyframes(filename, with_frame_pts=True)
+    if index is None or index[1] is None:
+        keyframes, frame_pts = scan_keyframes(filename)
+        index = sorted(keyframes), list(frame_pts)
+        save_keyframes(filename, *index)
+    return index
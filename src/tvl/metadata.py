@@ -0,0 +1,114 @@
+"""Process-wide cache of video file metadata.
+
+Opening and probing a video container is relatively slow, so backends store the metadata that
+they discover (duration, frame rate, frame count, frame size, keyframe positions, etc.) here.
+Entries are keyed by the path, size, and modification time of the video file, so modifying a
+file invalidates its metadata. Since backends may disagree on some values (eg. the number of
+frames), each backend stores its metadata in a separate namespace.
+
+Some metadata can be large (eg. the timestamp of every frame), so only the most recently used
+entries are kept (see `set_max_entries`).
+"""
+
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict
+
+_metadata: 'OrderedDict[tuple, Dict[str, Any]]' = OrderedDict()
+_max_entries = 256
+_lock = Lock()
+
+
+def set_max_entries(max_entries: int):
+    """Set the maximum number of entries in the metadata cache.
+
+    There is one entry for each combination of video file and namespace. Least recently used
+    entries are evicted when the cache is full.
+
+    Args:
+        max_entries (int): The maximum number of entries.
+    """
+    global _max_entries
+    if max_entries < 1:
+        raise ValueError('max_entries must be at least 1')
+    with _lock:
+        _max_entries = max_entries
+        _evict()
+
+
+def get_max_entries() -> int:
+    """Get the maximum number of entries in the metadata cache."""
+    return _max_entries
+
+
+def _evict():
+    while len(_metadata) > _max_entries:
+        _metadata.popitem(last=False)
+
+
+def metadata_key(filename, namespace=None):
+    """Get the key under which the metadata for a video file is cached.
+
+    Computing the key involves a call to `os.stat`, so code which accesses the metadata for a
+    file repeatedly can compute the key once and use `get_metadata_by_key` and
+    `update_metadata_by_key` instead.
+
+    Args:
+        filename: Path to the video file.
+        namespace (str): Namespace of the metadata (typically the name of a backend class).
+
+    Returns:
+        tuple: The key.
+    """
+    stat = os.stat(filename)
+    return namespace, os.path.abspath(os.fspath(filename)), stat.st_size, stat.st_mtime_ns
+
+
+def get_metadata(filename, namespace=None) -> Dict[str, Any]:
+    """Get the cached metadata for a video file.
+
+    Args:
+        filename: Path to the video file.
+        namespace (str): Namespace of the metadata (typically the name of a backend class).
+
+    Returns:
+        dict: Cached metadata values, which may be empty. The returned dictionary is a snapshot,
+        and modifying it will not affect the cache.
+    """
+    return get_metadata_by_key(metadata_key(filename, namespace))
+
+
+def get_metadata_by_key(key) -> Dict[str, Any]:
+    """Get cached metadata using a key from `metadata_key` (see `get_metadata`)."""
+    with _lock:
+        values = _metadata.get(key)
+        if values is None:
+            return {}
+        _metadata.move_to_end(key)
+        return dict(values)
+
+
+def update_metadata(filename, namespace=None, **values):
+    """Add values to the cached metadata for a video file.
+
+    Args:
+        filename: Path to the video file.
+        namespace (str): Namespace of the metadata (typically the name of a backend class).
+        **values: Metadata values to store.
+    """
+    update_metadata_by_key(metadata_key(filename, namespace), **values)
+
+
+def update_metadata_by_key(key, **values):
+    """Add values to cached metadata using a key from `metadata_key` (see `update_metadata`)."""
+    with _lock:
+        _metadata.setdefault(key, {}).update(values)
+        _metadata.move_to_end(key)
+        _evict()
+
+
+def clear_metadata():
+    """Remove all entries from the metadata cache."""
+    with _lock:
+        _metadata.clear()
@@ -0,0 +1,213 @@
+"""Output pixel formats for decoded frames.
+
+Frames are returned as planar RGB by default, but consumers which do not need RGB can ask the
+backend for a different layout and skip some or all of the colour conversion work:
+
+* `rgb_planar`: [3 x H x W] RGB (the default).
+* `rgb_hwc`: [H x W x 3] RGB (channels-last).
+* `yuv420p`: [(H * 3 / 2) x W] planar YUV 4:2:0 with BT.601 limited range values. The first H
+  rows hold the Y plane, and the remaining rows hold the [H / 2 x W / 2] U and V planes stored
+  one after the other. This is the same layout as an I420 image in OpenCV and a `yuv420p` frame
+  in PyAV. The frame width and height must be even.
+* `gray`: [1 x H x W] luma (the Y plane of `yuv420p`).
+
+Integer frames hold values in [0, 255]. Floating point frames hold the same values divided by
+255.
+"""
+
+from functools import lru_cache
+
+import torch
+from torch.nn.functional import interpolate
+
+PIXEL_FORMATS = ('rgb_planar', 'rgb_hwc', 'yuv420p', 'gray')
+
+
+def check_pixel_format(pixel_format):
+    """Raise a ValueError if `pixel_format` is not a supported pixel format."""
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f'unsupported pixel format: {pixel_format!r} '
+                         f'(expected one of {", ".join(PIXEL_FORMATS)})')
+
+
+def frame_shape(pixel_format, height, width):
+    """Get the shape of a frame tensor.
+
+    Args:
+        pixel_format (str): The pixel format of the frame.
+        height (int): Height of the frame image.
+        width (int): Width of the frame image.
+
+    Returns:
+        tuple of int: The frame tensor shape.
+    """
+    check_pixel_format(pixel_format)
+    if pixel_format == 'rgb_planar':
+        return 3, height, width
+    if pixel_format == 'rgb_hwc':
+        return height, width, 3
+    if pixel_format == 'gray':
+        return 1, height, width
+    if height % 2 != 0 or width % 2 != 0:
+        raise ValueError(f'yuv420p frames must have an even width and height, got {width}x{height}')
+    return height * 3 // 2, width
+
+
+def is_channels_first(pixel_format):
+    """Check whether frames in `pixel_format` are [C x H x W] images which can be resized."""
+    return pixel_format in {'rgb_planar', 'gray'}
+
+
+def _yuv_from_rgb(rgb):
+    """Convert [..., 3, H, W] RGB values in [0, 255] to BT.601 limited range YUV."""
+    r, g, b = rgb.unbind(-3)
+    y = r * 0.256788 + g * 0.504129 + b * 0.097906 + 16
+    u = r * -0.148223 + g * -0.290993 + b * 0.439216 + 128
+    v = r * 0.439216 + g * -0.367788 + b * -0.071427 + 128
+    return y, u, v
+
+
+def convert_rgb_planar(rgb: torch.Tensor, pixel_format) -> torch.Tensor:
+    """Convert planar RGB frames to another pixel format.
+
+    This is for backends which can only decode to RGB. Backends which can produce the other
+    pixel formats natively should do so instead.
+
+    Args:
+        rgb (torch.Tensor): [..., 3 x H x W] RGB frames.
+        pixel_format (str): The desired pixel format.
+
+    Returns:
+        torch.Tensor: Frames with the same data type as `rgb`, in the desired pixel format.
+    """
+    check_pixel_format(pixel_format)
+    if pixel_format == 'rgb_planar':
+        return rgb
+    if pixel_format == 'rgb_hwc':
+        return rgb.movedim(-3, -1).contiguous()
+    dtype = rgb.dtype
+    scale = 1 if not dtype.is_floating_point else 255
+    y, u, v = _yuv_from_rgb(rgb.float() * scale)
+    if pixel_format == 'gray':
+        planes = y.unsqueeze(-3)
+    else:
+        height, width = y.shape[-2:]
+        frame_shape(pixel_format, height, width)
+        # Subsample chroma by averaging each 2x2 block.
+        u = u.unflatten(-1, (width // 2, 2)).unflatten(-3, (height // 2, 2)).mean((-3, -1))
+        v = v.unflatten(-1, (width // 2, 2)).unflatten(-3, (height // 2, 2)).mean((-3, -1))
+        planes = torch.cat([y.flatten(-2), u.flatten(-2), v.flatten(-2)], -1)
+        planes = planes.unflatten(-1, (height * 3 // 2, width))
+    if dtype.is_floating_point:
+        return planes.div_(255).to(dtype)
+    return planes.round_().clamp_(0, 255).to(dtype)
+
+
+# BT.601 limited range YUV to RGB conversion coefficients for values in [0, 255].
+_LUMA_TO_RGB = 1.164383
+_CHROMA_TO_RGB = (
+    (0.0, 1.596027),
+    (-0.391762, -0.812968),
+    (2.017232, 0.0),
+)
+
+
+@lru_cache(16)
+def _chroma_conv_consts(device, scale, bias):
+    """Get the [3 x 2] chroma matrix and [3 x 1] offsets for converting YUV to scaled RGB."""
+    matrix = torch.tensor(_CHROMA_TO_RGB, device=device) * scale
+    offsets = torch.tensor([[(-16 * _LUMA_TO_RGB - 128 * (cu + cv)) * scale + bias]
+                            for cu, cv in _CHROMA_TO_RGB], device=device)
+    return matrix, offsets
+
+
+def nv12_planes(planar_yuv: torch.Tensor, height, width):
+    """Get views of the Y, U, and V planes of an NV12 image.
+
+    Args:
+        planar_yuv (torch.Tensor): Flat NV12 image data.
+        height (int): Height of the image.
+        width (int): Width of the image.
+
+    Returns:
+        tuple of torch.Tensor: The [H x W] Y plane, and the [H/2 x W/2] U and V planes.
+    """
+    y = planar_yuv[:width * height].view(height, width)
+    uv = planar_yuv[width * height:width * height * 3 // 2].view(height // 2, width // 2, 2)
+    return y, uv[..., 0], uv[..., 1]
+
+
+def yuv420p_planes(frame: torch.Tensor):
+    """Get views of the Y, U, and V planes of a `yuv420p` frame.
+
+    Args:
+        frame (torch.Tensor): [(H * 3 / 2) x W] frame.
+
+    Returns:
+        tuple of torch.Tensor: The [H x W] Y plane, and the [H/2 x W/2] U and V planes.
+    """
+    height, width = frame.shape[0] * 2 // 3, frame.shape[1]
+    data = frame.reshape(-1)
+    n_luma = width * height
+    n_chroma = n_luma // 4
+    return (
+        data[:n_luma].view(height, width),
+        data[n_luma:n_luma + n_chroma].view(height // 2, width // 2),
+        data[n_luma + n_chroma:n_luma + 2 * n_chroma].view(height // 2, width // 2),
+    )
+
+
+def yuv420_to_rgb(y, u, v, size=None, dtype=torch.float32, out=None):
+    """Convert YUV 4:2:0 planes to planar RGB, with resizing and data type conversion.
+
+    The colour matrix, value scaling for the output data type, and resizing are folded together
+    so that the full resolution output is only touched by a few passes. All three chroma terms
+    are computed in one matrix multiply at chroma resolution (or at the output resolution, if that
+    is smaller), then upsampled to the output size. Nearest neighbour upsampling is used when not
+    resizing, which matches how the chroma planes are subsampled. Luma is resized separately, and
+    added to the chroma terms in place.
+
+    Args:
+        y (torch.Tensor): [H x W] luma plane, with BT.601 limited range values in [0, 255].
+        u (torch.Tensor): [H/2 x W/2] U (Cb) plane.
+        v (torch.Tensor): [H/2 x W/2] V (Cr) plane.
+        size (tuple of int): Output size (height, width). Defaults to the size of `y`.
+        dtype (torch.dtype): Output data type. Floating point outputs have values in [0, 1],
+            and uint8 outputs have values in [0, 255].
+        out (torch.Tensor): Optional [3 x H x W] tensor to write the result into.
+
+    Returns:
+        torch.Tensor: The [3 x H x W] RGB image.
+    """
+    if out is not None:
+        dtype = out.dtype
+    if dtype.is_floating_point:
+        scale, bias, max_value = 1 / 255, 0.0, 1.0
+    else:
+        # Adding 0.5 before truncating to an integer type rounds to the nearest integer.
+        scale, bias, max_value = 1.0, 0.5, 255.0
+    if size is None:
+        size = tuple(y.shape)
+    size = tuple(size)
+
+    resizing = size != tuple(y.shape)
+    uv = torch.stack([u, v]).float()
+    if resizing and size[0] * size[1] < u.numel():
+        # Shrinking below chroma resolution, so convert at the (smaller) output size instead.
+        uv = interpolate(uv[None], size=size, mode='bilinear', align_corners=False)[0]
+    matrix, offsets = _chroma_conv_consts(str(y.device), scale, bias)
+    chroma = torch.addmm(offsets, matrix, uv.view(2, -1)).view(1, 3, *uv.shape[1:])
+    if not resizing:
+        rgb = interpolate(chroma, size=size, mode='nearest')[0]
+    elif chroma.shape[2:] != size:
+        rgb = interpolate(chroma, size=size, mode='bilinear', align_corners=False)[0]
+    else:
+        rgb = chroma[0]
+    if resizing:
+        y = interpolate(y[None, None].float(), size=size, mode='bilinear',
+                        align_corners=False)[0, 0]
+    rgb.add_(y, alpha=_LUMA_TO_RGB * scale).clamp_(0, max_value)
+
+    if out is not None:
+        return out.copy_(rgb)
+    return rgb.to(dtype)
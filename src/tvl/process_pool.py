@@ -0,0 +1,250 @@
+"""Multiprocess data loading with shared memory tensor handoff.
+
+Decoding video on the CPU involves a fair amount of Python code, so using threads to load
+examples in parallel is limited by the GIL. `ProcessPoolDataset` instead loads examples in a pool
+of worker processes. Each worker keeps its video backends open between examples (via a
+`tvl.BackendPool`), and writes the tensors of each example into a ring of shared memory slots
+which are reused for the lifetime of the worker. Only small handles describing the tensors are
+sent back to the main process, so examples are never pickled.
+"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import perf_counter
+
+import torch
+import torch.multiprocessing as mp
+
+import tvl
+
+# Alignment (in bytes) of tensors within a shared memory slot.
+_ALIGNMENT = 64
+
+
+def _align(value, alignment=_ALIGNMENT):
+    return ((value + alignment - 1) // alignment) * alignment
+
+
+class _SharedTensorSpec:
+    """Placeholder for a tensor which has been written to a shared memory slot."""
+    __slots__ = ('offset', 'dtype', 'shape')
+
+    def __init__(self, offset, dtype, shape):
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+
+
+def _map_tensors(obj, fn):
+    """Apply `fn` to every tensor in a nested structure of dicts, lists, and tuples."""
+    if torch.is_tensor(obj) or isinstance(obj, _SharedTensorSpec):
+        return fn(obj)
+    if isinstance(obj, dict):
+        return {k: _map_tensors(v, fn) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_map_tensors(v, fn) for v in obj)
+    return obj
+
+
+def _storage_view(storage, spec):
+    elem_size = torch.empty(0, dtype=spec.dtype).element_size()
+    tensor = torch.empty(0, dtype=spec.dtype)
+    tensor.set_(storage, spec.offset // elem_size, spec.shape)
+    return tensor
+
+
+def _write_to_slot(storage, example):
+    """Write the tensors of an example into shared memory, replacing them with specs.
+
+    Returns:
+        tuple: The example with tensors replaced, and a new (larger) storage if `storage` was too
+        small to hold the example.
+    """
+    tensors = []
+    _map_tensors(example, tensors.append)
+    n_bytes = 0
+    for tensor in tensors:
+        n_bytes = _align(n_bytes) + tensor.numel() * tensor.element_size()
+    new_storage = None
+    if storage is None or storage.nbytes() < n_bytes:
+        new_storage = torch.UntypedStorage(max(n_bytes, 1)).share_memory_()
+        storage = new_storage
+
+    offset = 0
+
+    def write(tensor):
+        nonlocal offset
+        offset = _align(offset)
+        spec = _SharedTensorSpec(offset, tensor.dtype, tuple(tensor.shape))
+        _storage_view(storage, spec).copy_(tensor)
+        offset += tensor.numel() * tensor.element_size()
+        return spec
+
+    return _map_tensors(example, write), new_storage
+
+
+def _worker_loop(dataset, task_queue, result_queue, worker_id, n_slots):
+    torch.set_num_threads(1)
+    # Keep backends open so that repeat examples from the same video skip opening the file.
+    tvl.set_backend_pool(tvl.BackendPool())
+    slots = [None] * n_slots
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, index, slot = task
+        start_time = perf_counter()
+        try:
+            example = dataset[index]
+            example, new_storage = _write_to_slot(slots[slot], example)
+            if new_storage is not None:
+                slots[slot] = new_storage
+            result_queue.put((worker_id, task_id, slot, example, new_storage,
+                              perf_counter() - start_time, None))
+        except Exception as e:
+            result_queue.put((worker_id, task_id, slot, None, None,
+                              perf_counter() - start_time, e))
+
+
+class SharedMemoryFuture(Future):
+    """Future for an example loaded by a `ProcessPoolDataset`.
+
+    The tensors in the result are views of a shared memory slot. They remain valid until
+    `release` is called, after which the slot may be overwritten by another example.
+    """
+
+    def __init__(self, pool):
+        super().__init__()
+        self._pool = pool
+        self._slot = None
+
+    def release(self):
+        """Return the shared memory slot holding the result to the pool for reuse."""
+        if self._slot is not None:
+            slot = self._slot
+            self._slot = None
+            self._pool._release_slot(*slot)
+
+
+class ProcessPoolDataset:
+    def __init__(self, dataset, num_workers, slots_per_worker=4, multiprocessing_context=None):
+        """Wraps a synchronous dataset to load examples in parallel worker processes.
+
+        This can be used in place of `AsyncDataset`. `BatchDataLoader` releases the shared
+        memory holding each example once the example has been collated into a batch, so batches
+        may not contain more than `max_unreleased` examples.
+
+        Args:
+            dataset (Dataset): The synchronous dataset to wrap. It will be sent to each worker
+                once, when the worker is started.
+            num_workers (int): Number of worker processes.
+            slots_per_worker (int): Number of shared memory slots for each worker. This limits
+                the number of unreleased examples that each worker can have.
+            multiprocessing_context: Multiprocessing start method (eg. 'spawn'). Defaults to the
+                platform default.
+        """
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.slots_per_worker = slots_per_worker
+        if multiprocessing_context is None or isinstance(multiprocessing_context, str):
+            multiprocessing_context = mp.get_context(multiprocessing_context)
+        self.lock = threading.Lock()
+        self._result_queue = multiprocessing_context.Queue()
+        self._task_queues = []
+        self._workers = []
+        # Shared memory storages for each worker's slots, as received from the workers.
+        self._storages = [[None] * slots_per_worker for _ in range(num_workers)]
+        self._free_slots = [list(range(slots_per_worker)) for _ in range(num_workers)]
+        self._pending = deque()
+        self._futures = {}
+        self._next_task_id = 0
+        self._closed = False
+        for worker_id in range(num_workers):
+            task_queue = multiprocessing_context.Queue()
+            worker = multiprocessing_context.Process(
+                target=_worker_loop,
+                args=(dataset, task_queue, self._result_queue, worker_id, slots_per_worker),
+                daemon=True,
+            )
+            worker.start()
+            self._task_queues.append(task_queue)
+            self._workers.append(worker)
+        self._result_thread = threading.Thread(target=self._receive_results, daemon=True)
+        self._result_thread.start()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    @property
+    def max_unreleased(self):
+        """The number of examples which can be loaded before any of them are released."""
+        return self.num_workers * self.slots_per_worker
+
+    def __getitem__(self, index):
+        if self._closed:
+            raise RuntimeError('cannot load examples from a closed ProcessPoolDataset')
+        future = SharedMemoryFuture(self)
+        with self.lock:
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            self._futures[task_id] = future
+            self._pending.append((task_id, index))
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """Send pending tasks to workers with free slots. Must be called with the lock held."""
+        while self._pending:
+            # Choose the worker with the most free slots, which is the least busy.
+            worker_id = max(range(self.num_workers), key=lambda i: len(self._free_slots[i]))
+            if not self._free_slots[worker_id]:
+                break
+            slot = self._free_slots[worker_id].pop()
+            task_id, index = self._pending.popleft()
+            self._task_queues[worker_id].put((task_id, index, slot))
+
+    def _release_slot(self, worker_id, slot):
+        with self.lock:
+            self._free_slots[worker_id].append(slot)
+            self._dispatch()
+
+    def _receive_results(self):
+        while True:
+            try:
+                result = self._result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed:
+                    break
+                continue
+            worker_id, task_id, slot, example, new_storage, production_time, exception = result
+            if new_storage is not None:
+                self._storages[worker_id][slot] = new_storage
+            with self.lock:
+                future = self._futures.pop(task_id)
+            future.production_time = production_time
+            if exception is not None:
+                self._release_slot(worker_id, slot)
+                future.set_exception(exception)
+                continue
+            storage = self._storages[worker_id][slot]
+            future._slot = (worker_id, slot)
+            future.set_result(_map_tensors(example, lambda spec: _storage_view(storage, spec)))
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._closed:
+            return
+        self._closed = True
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._result_thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,71 @@
+"""Online estimates of seek and decode costs, for choosing when to seek.
+
+When reading selected frames, a backend can either seek to the next wanted frame or decode and
+discard the frames in between. Which is faster depends on the video file (GOP structure,
+resolution, codec) and on the backend. `SeekCostModel` learns the time taken by each kind of
+operation from the reads that a backend actually performs, and turns those into a threshold on
+the number of frames which are worth decoding to avoid a seek.
+"""
+
+
+class SeekCostModel:
+    def __init__(self, costs=None, alpha=0.2):
+        """Create a model of seek and decode costs.
+
+        Args:
+            costs (dict): Initial costs, as returned by `as_dict` (eg. learned for the same file
+                by another backend instance).
+            alpha (float): Smoothing factor for the exponential moving averages of costs.
+        """
+        costs = costs or {}
+        self.alpha = alpha
+        # Time taken by a seek, beyond the time taken to decode the frames it lands on.
+        self.seek_cost = costs.get('seek')
+        # Time taken to decode a frame which is discarded.
+        self.skip_cost = costs.get('skip')
+        # Time taken to decode and convert a frame which is kept.
+        self.keep_cost = costs.get('keep')
+
+    def _average(self, current, value):
+        if current is None:
+            return value
+        return current + self.alpha * (value - current)
+
+    def observe_frame(self, secs, kept):
+        """Record the time taken to read the next frame without seeking."""
+        if kept:
+            self.keep_cost = self._average(self.keep_cost, secs)
+        else:
+            self.skip_cost = self._average(self.skip_cost, secs)
+
+    def observe_seek(self, secs, n_preroll=0):
+        """Record the time taken to seek and read the target frame.
+
+        Args:
+            secs (float): Time taken by the seek and by reading the frame which was sought.
+            n_preroll (int): Number of frames which the decoder had to decode and discard to get
+                from where the seek landed (eg. a keyframe) to the target frame, if known.
+        """
+        skip_cost = self.skip_cost if self.skip_cost is not None else self.keep_cost
+        keep_cost = self.keep_cost if self.keep_cost is not None else self.skip_cost
+        if skip_cost is None:
+            # The cost of the seek itself cannot be separated from the cost of decoding yet.
+            return
+        overhead = max(secs - n_preroll * skip_cost - keep_cost, 0.0)
+        self.seek_cost = self._average(self.seek_cost, overhead)
+
+    @property
+    def threshold(self):
+        """The number of discarded frames which take as long to decode as a seek.
+
+        Returns:
+            float: The threshold, or `None` if there have not been enough observations yet.
+        """
+        skip_cost = self.skip_cost if self.skip_cost is not None else self.keep_cost
+        if self.seek_cost is None or not skip_cost:
+            return None
+        return self.seek_cost / skip_cost
+
+    def as_dict(self):
+        return {'seek': self.seek_cost, 'skip': self.skip_cost, 'keep': self.keep_cost,
+                'threshold': self.threshold}
@@ -0,0 +1,176 @@
+"""Optional instrumentation of video loading.
+
+When enabled with `set_stats_enabled(True)`, each `tvl.VideoLoader` created afterwards gets a
+`Stats` object (`vl.stats`) which records how long is spent in each loading stage, along with
+counters for the work done. Everything recorded by a loader is also added to the process-wide
+`Stats` object returned by `get_process_stats`.
+
+Stages (timers, in seconds):
+
+* `open`: Opening the video file (or checking out a pooled backend).
+* `seek`: Seeking within the video file.
+* `decode`: Decoding frames.
+* `convert`: Converting decoded pictures to tensors in the output pixel format.
+* `postprocess`: Converting frame data types and resizing frames in `_postprocess_frame`.
+* `wait`: Time `BatchDataLoader` spends waiting for examples to finish loading.
+
+Counters:
+
+* `frames_decoded`: Frames decoded by a backend.
+* `frames_returned`: Frames returned by a loader.
+* `frames_skipped`: Frames decoded and then discarded while reading ahead to a selected frame.
+* `seeks`: Seeks issued to a backend.
+* `bytes_allocated`: Bytes allocated for frame tensors.
+
+Instrumentation is disabled by default, in which case recording costs a single attribute check.
+
+Hooks added with `add_stats_hook` are called for every recorded value, which makes it possible
+to forward stats to an external metrics system.
+"""
+
+from contextlib import nullcontext
+from threading import Lock
+from time import perf_counter
+from typing import Callable, List, Optional
+
+# Context manager which does nothing, used in place of a timer when instrumentation is disabled.
+NULL_TIMER = nullcontext()
+
+_enabled = False
+_process_stats: Optional['Stats'] = None
+_hooks: List[Callable[[str, str, float], None]] = []
+
+
+class _StageTimer:
+    __slots__ = ('stats', 'stage', 'start')
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stats.add_time(self.stage, perf_counter() - self.start)
+
+
+class Stats:
+    def __init__(self, parent: Optional['Stats'] = None):
+        """Timers and counters for video loading.
+
+        Args:
+            parent (Stats): Stats object which should also receive everything recorded here.
+        """
+        self.parent = parent
+        self.lock = Lock()
+        self._counters = {}
+        # Maps stage names to [number of timings, total seconds, maximum seconds].
+        self._timers = {}
+
+    def count(self, name, n=1):
+        """Add `n` to a counter."""
+        with self.lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        if self.parent is not None:
+            self.parent.count(name, n)
+        else:
+            _call_hooks('count', name, n)
+
+    def add_time(self, stage, secs):
+        """Record that `secs` seconds were spent in a stage."""
+        with self.lock:
+            timer = self._timers.get(stage)
+            if timer is None:
+                self._timers[stage] = [1, secs, secs]
+            else:
+                timer[0] += 1
+                timer[1] += secs
+                if secs > timer[2]:
+                    timer[2] = secs
+        if self.parent is not None:
+            self.parent.add_time(stage, secs)
+        else:
+            _call_hooks('time', stage, secs)
+
+    def timer(self, stage):
+        """Get a context manager which records the time spent inside it for a stage."""
+        return _StageTimer(self, stage)
+
+    @property
+    def counters(self):
+        """A snapshot of the counter values, as a dictionary."""
+        with self.lock:
+            return dict(self._counters)
+
+    @property
+    def timers(self):
+        """A snapshot of the timers, as a dictionary of dictionaries.
+
+        Each timer has a `count` of timings, the `total` seconds spent in the stage, and the
+        `max` seconds spent in the stage at once.
+        """
+        with self.lock:
+            return {stage: {'count': count, 'total': total, 'max': max_secs}
+                    for stage, (count, total, max_secs) in self._timers.items()}
+
+    def as_dict(self):
+        return {'counters': self.counters, 'timers': self.timers}
+
+    def reset(self):
+        """Clear all timers and counters."""
+        with self.lock:
+            self._counters.clear()
+            self._timers.clear()
+
+    def __repr__(self):
+        return f'Stats({self.as_dict()!r})'
+
+
+def _call_hooks(kind, name, value):
+    for hook in _hooks:
+        hook(kind, name, value)
+
+
+def set_stats_enabled(enabled: bool):
+    """Enable or disable instrumentation for VideoLoader instances created from now on."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_stats_enabled() -> bool:
+    return _enabled
+
+
+def get_process_stats() -> Stats:
+    """Get the stats aggregated over all instrumented loaders in this process."""
+    global _process_stats
+    if _process_stats is None:
+        _process_stats = Stats()
+    return _process_stats
+
+
+def create_loader_stats() -> Optional[Stats]:
+    """Create a stats object for a new loader, or return `None` if instrumentation is disabled."""
+    if not _enabled:
+        return None
+    return Stats(parent=get_process_stats())
+
+
+def add_stats_hook(hook: Callable[[str, str, float], None]):
+    """Add a function to be called whenever a value is recorded by any loader in this process.
+
+    The hook is called as `hook(kind, name, value)`, where `kind` is 'count' (and `value` is the
+    amount added to counter `name`) or 'time' (and `value` is the seconds spent in stage
+    `name`). Hooks are called on the thread which recorded the value, so they should be fast.
+
+    Args:
+        hook: The hook function.
+    """
+    _hooks.append(hook)
+
+
+def remove_stats_hook(hook: Callable[[str, str, float], None]):
+    """Remove a hook added with `add_stats_hook`."""
+    _hooks.remove(hook)
@@ -9,10 +9,12 @@ As an additional benefit, these functions are defined such that they also work i
 which is especially useful for videos.
 """
 
+import math
+from functools import lru_cache
 from typing import Sequence
 
 import torch
-from torch.nn.functional import interpolate
+from torch.nn.functional import interpolate, grid_sample, affine_grid
 
 
 def normalise(tensor, mean, stddev, inplace=False):
@@ -60,29 +62,159 @@ def denormalise(tensor, mean, stddev, inplace=False):
         return torch.addcmul(mean, tensor, stddev)
 
 
-def resize(tensor, size, mode='bilinear'):
+# Interpolation modes which can resample uint8 images directly, by device type.
+_UINT8_RESIZE_MODES = {
+    'cpu': {'nearest', 'nearest-exact', 'bilinear'},
+    'cuda': {'nearest', 'nearest-exact'},
+}
+
+
+def resize(tensor, size, mode='bilinear', antialias=False):
     """Resize the image.
 
     Args:
         tensor (torch.Tensor): The image tensor to be resized.
         size (tuple of int): Size of the resized image (height, width).
-        mode (str): The pixel sampling interpolation mode to be used.
+        mode (str): The pixel sampling interpolation mode to be used. With `antialias`, this is
+            the resampling filter: "area" (box), "bilinear" or "triangle", or "lanczos" (Lanczos-3).
+        antialias (bool): Resample with a separable filter which is widened when downscaling, so
+            that every input pixel contributes to the output. This avoids aliasing for large
+            downscales, without resizing in several steps.
 
     Returns:
         Tensor: The resized image tensor.
     """
     assert len(size) == 2
+    if antialias and mode not in _RESIZE_FILTERS:
+        raise ValueError(f'unsupported antialiased resize mode: {mode}')
 
     # If the tensor is already the desired size, return it immediately.
     if tensor.shape[-2] == size[0] and tensor.shape[-1] == size[1]:
         return tensor
 
+    if tensor.dtype == torch.uint8:
+        return _resize_uint8(tensor, size, mode, antialias)
+
     if not tensor.is_floating_point():
         dtype = tensor.dtype
         tensor = tensor.to(torch.float32)
-        tensor = resize(tensor, size, mode)
+        tensor = resize(tensor, size, mode, antialias)
         return tensor.to(dtype)
 
+    return _resample(tensor, size, mode, antialias)
+
+
+# Maximum number of elements in the float32 copy made when resizing a uint8 image on the CPU.
+_RESIZE_CHUNK_ELEMENTS = 1 << 22
+
+
+def _resize_uint8(tensor, size, mode, antialias):
+    """Resize a uint8 image without making a full size float32 copy of it.
+
+    Modes which have uint8 kernels on the tensor's device resample the image directly. Otherwise,
+    GPUs resample the image in half precision (which represents 8-bit values exactly, in half the
+    memory of float32). Half precision arithmetic is slow on the CPU, so there the images are
+    resampled in float32 a few at a time instead.
+    """
+    if not antialias and mode in _UINT8_RESIZE_MODES.get(tensor.device.type, ()):
+        return _interpolate(tensor, size, mode)
+    if tensor.device.type != 'cpu' or tensor.ndimension() < 3:
+        resized = _resample(tensor.half(), size, mode, antialias)
+        return resized.round_().clamp_(0, 255).to(torch.uint8)
+    out = torch.empty((*tensor.shape[:-2], *size), dtype=torch.uint8)
+    images = tensor.reshape(-1, *tensor.shape[-3:])
+    out_images = out.view(-1, *out.shape[-3:])
+    chunk_size = max(_RESIZE_CHUNK_ELEMENTS // images[0].numel(), 1)
+    for i in range(0, len(images), chunk_size):
+        resized = _resample(images[i:i + chunk_size].float(), size, mode, antialias)
+        out_images[i:i + chunk_size].copy_(resized.round_().clamp_(0, 255))
+    return out
+
+
+def _resample(tensor, size, mode, antialias):
+    if antialias:
+        return _filter_resize(tensor, size, mode)
+    return _interpolate(tensor, size, mode)
+
+
+def _box_filter(x):
+    return ((x >= -0.5) & (x < 0.5)).to(x.dtype)
+
+
+def _triangle_filter(x):
+    return (1 - x.abs()).clamp_(min=0)
+
+
+def _lanczos_filter(x, a=3):
+    return torch.where(x.abs() < a, torch.sinc(x) * torch.sinc(x / a), torch.zeros_like(x))
+
+
+# Separable filters for antialiased resizing, by mode.
+_RESIZE_FILTERS = {
+    'area': _box_filter,
+    'bilinear': _triangle_filter,
+    'triangle': _triangle_filter,
+    'lanczos': _lanczos_filter,
+}
+
+
+# Number of output pixels in each block of a resampling weight matrix.
+_FILTER_BLOCK_SIZE = 16
+
+
+@lru_cache(maxsize=128)
+def _filter_weights(in_size, out_size, mode, device, dtype):
+    """Get the weights which resample a line of pixels with a filter.
+
+    When downscaling, the filter is widened by the scale factor so that it covers every input
+    pixel. The weights for each output pixel are normalised to sum to one, so pixels near the
+    edges are filtered with only the input pixels that exist.
+
+    The [out_size x in_size] weight matrix is mostly zeros, so it is split into blocks of
+    consecutive output pixels, which only keep the columns for the input pixels that they use.
+    Weights are cached, so resizing many images with the same geometry does not recompute them.
+
+    Returns:
+        tuple: A (start, stop, weights) tuple for each block, where `weights` is the
+        [stop - start x n] matrix which maps input pixels start:stop to the block's n output
+        pixels. The weights must not be modified.
+    """
+    scale = in_size / out_size
+    centres = (torch.arange(out_size, dtype=torch.float64) + 0.5) * scale - 0.5
+    offsets = torch.arange(in_size, dtype=torch.float64) - centres[:, None]
+    weights = _RESIZE_FILTERS[mode](offsets / max(scale, 1.0))
+    weights /= weights.sum(1, keepdim=True)
+    blocks = []
+    for i in range(0, out_size, _FILTER_BLOCK_SIZE):
+        block = weights[i:i + _FILTER_BLOCK_SIZE]
+        used = (block != 0).any(0).nonzero()
+        start, stop = used[0].item(), used[-1].item() + 1
+        block = block[:, start:stop].t().contiguous().to(device=device, dtype=dtype)
+        blocks.append((start, stop, block))
+    return tuple(blocks)
+
+
+def _filter_resize(tensor, size, mode):
+    """Resize an image with separable filter weights, using matrix products for each pass."""
+    (in_h, in_w), (out_h, out_w) = tensor.shape[-2:], size
+    # Apply the pass which leaves the least work for the other one first.
+    height_first = out_h * in_w * (in_h + out_w) < in_h * out_w * (in_w + out_h)
+    for dim in ((-2, -1) if height_first else (-1, -2)):
+        in_size, out_size = tensor.shape[dim], size[dim]
+        if in_size == out_size:
+            continue
+        blocks = _filter_weights(in_size, out_size, mode, tensor.device, tensor.dtype)
+        if dim == -1:
+            parts = [torch.matmul(tensor[..., start:stop], weights)
+                     for start, stop, weights in blocks]
+        else:
+            parts = [torch.matmul(weights.t(), tensor[..., start:stop, :])
+                     for start, stop, weights in blocks]
+        tensor = torch.cat(parts, dim) if len(parts) > 1 else parts[0]
+    return tensor
+
+
+def _interpolate(tensor, size, mode):
     out_shape = (*tensor.shape[:-2], *size)
     if tensor.ndimension() < 3:
         raise Exception('tensor must be at least 2D')
@@ -154,6 +286,136 @@ def crop(tensor, t, l, h, w, padding_mode='constant', fill=0):
     return result
 
 
+def _pad_indices(indices, size, padding_mode):
+    """Map pixel coordinates which may be out of bounds to in-bounds source coordinates."""
+    if padding_mode == 'reflect':
+        if size == 1:
+            return torch.zeros_like(indices)
+        # Reflect about the edge pixels (without repeating them), like `torch.nn.functional.pad`.
+        period = 2 * (size - 1)
+        indices = indices.remainder(period)
+        return torch.where(indices >= size, period - indices, indices)
+    # Replicate padding repeats the edge pixels. For constant padding, the out-of-bounds pixels
+    # are overwritten with the fill value afterwards.
+    return indices.clamp(0, size - 1)
+
+
+def _gather_crops(tensor, boxes, size, padding_mode, fill, out, padded=True):
+    """Crop every image in a batch with a single gather, using one index per output pixel."""
+    batch_size = tensor.shape[0]
+    h, w = size
+    in_h, in_w = tensor.shape[-2:]
+    rows = boxes[:, :1] + torch.arange(h, device=tensor.device)
+    cols = boxes[:, 1:2] + torch.arange(w, device=tensor.device)
+    if padded:
+        valid = (rows >= 0) & (rows < in_h), (cols >= 0) & (cols < in_w)
+        rows = _pad_indices(rows, in_h, padding_mode)
+        cols = _pad_indices(cols, in_w, padding_mode)
+    index = (rows[:, :, None] * in_w + cols[:, None, :]).view(batch_size, 1, h * w)
+    src = tensor.reshape(batch_size, -1, in_h * in_w)
+    torch.gather(src, 2, index.expand(-1, src.shape[1], -1), out=out.view(*src.shape[:2], h * w))
+    if padded and padding_mode == 'constant':
+        mask = ~(valid[0][:, :, None] & valid[1][:, None, :])
+        out.view(batch_size, -1, h, w).masked_fill_(mask[:, None], fill)
+    return out
+
+
+def _copy_crops(tensor, boxes, size, padding_mode, fill, out):
+    """Crop every image in a batch by copying rows, without a per-image loop.
+
+    On the CPU, copying whole rows is much faster than an indexing kernel which handles one
+    element at a time. The crops are read as a single `index_select` of row windows, which are
+    overlapping views of the flattened batch. Padding rows are read from the source rows given by
+    the padding mode, and only the pixels in columns which are outside of the images are fixed up
+    afterwards.
+    """
+    batch_size = tensor.shape[0]
+    h, w = size
+    in_h, in_w = tensor.shape[-2:]
+    src = tensor.reshape(batch_size, -1, in_h, in_w).contiguous().view(-1)
+    n_planes = src.numel() // (batch_size * in_h * in_w)
+    device = tensor.device
+    rows = boxes[:, :1] + torch.arange(h, device=device)
+    cols = boxes[:, 1:2] + torch.arange(w, device=device)
+
+    # Index of the first element of the source row for every row of every crop.
+    planes = torch.arange(batch_size * n_planes, device=device).view(batch_size, n_planes, 1)
+    row_starts = (planes * in_h + _pad_indices(rows, in_h, padding_mode)[:, None, :]) * in_w
+    starts = row_starts + boxes[:, 1, None, None]
+    # Windows must lie within the batch, so they are moved for crops which extend beyond the left
+    # edge of the very first row or the right edge of the very last row.
+    windows = (src if src.numel() >= w else torch.cat([src, src.new_empty(w)])).unfold(0, w, 1)
+    clamped_starts = starts.clamp(0, windows.shape[0] - 1)
+    torch.index_select(windows, 0, clamped_starts.view(-1), out=out.view(-1, w))
+
+    out_rows = out.view(batch_size, n_planes, h, w)
+    col_indices = _pad_indices(cols, in_w, padding_mode)
+    # Redo the rows of any windows which were moved to keep them within the batch.
+    crop_index, plane, row = (starts != clamped_starts).nonzero().unbind(1)
+    out_rows[crop_index, plane, row] = src.take(row_starts[crop_index, plane, row, None]
+                                                + col_indices[crop_index])
+    # Windows run into neighbouring rows for columns which are beyond the left or right edges.
+    crop_index, col = ((cols < 0) | (cols >= in_w)).nonzero().unbind(1)
+    out_cols = out_rows.permute(0, 3, 1, 2)
+    if padding_mode == 'constant':
+        out_cols[crop_index, col] = fill
+        crop_index, row = ((rows < 0) | (rows >= in_h)).nonzero().unbind(1)
+        out_rows.transpose(1, 2)[crop_index, row] = fill
+    else:
+        out_cols[crop_index, col] = src.take(row_starts[crop_index]
+                                             + col_indices[crop_index, col, None, None])
+    return out
+
+
+def crop_batch(tensor, boxes, padding_mode='constant', fill=0, out=None):
+    """Crop each image in a batch with its own crop region, padding out-of-bounds regions.
+
+    This is equivalent to calling `crop` for each image and stacking the results, but without a
+    per-image loop. On the GPU all of the crops are gathered by a single kernel, and on the CPU the
+    rows of every crop are copied by a single call.
+
+    Args:
+        tensor (torch.Tensor): The [B x ... x H x W] batch of images to be cropped.
+        boxes (torch.Tensor): [B x 4] crop regions (top, left, height, width). Every region must
+            have the same height and width.
+        padding_mode (str): Padding mode ("constant", "reflect", or "replicate").
+        fill (float): Fill value to use with constant padding.
+        out (torch.Tensor): Optional contiguous [B x ... x h x w] tensor to write the result into.
+
+    Returns:
+        Tensor: The cropped image tensor.
+    """
+    if padding_mode not in {'constant', 'reflect', 'replicate'}:
+        raise ValueError(f'unsupported padding mode: {padding_mode}')
+    boxes = torch.as_tensor(boxes, dtype=torch.int64, device=tensor.device)
+    if boxes.shape != (tensor.shape[0], 4) or boxes.shape[0] == 0:
+        raise ValueError(f'expected boxes with shape {(tensor.shape[0], 4)}, '
+                         f'got {tuple(boxes.shape)}')
+    # Summarise the boxes with a single device synchronisation.
+    h, w, mixed_sizes, t_min, l_min, b_max, r_max = torch.cat([
+        boxes[0, 2:],
+        (boxes[:, 2:] != boxes[:1, 2:]).any().view(1),
+        boxes[:, :2].min(0).values,
+        (boxes[:, :2] + boxes[:, 2:]).max(0).values,
+    ]).tolist()
+    if mixed_sizes:
+        raise ValueError('all boxes must have the same height and width')
+    if h <= 0 or w <= 0:
+        raise ValueError(f'expected a positive crop size, got {(h, w)}')
+
+    out_shape = (*tensor.shape[:-2], h, w)
+    if out is None:
+        out = torch.empty(out_shape, dtype=tensor.dtype, device=tensor.device)
+    elif out.shape != out_shape or not out.is_contiguous():
+        raise ValueError(f'expected a contiguous out tensor with shape {out_shape}')
+
+    if tensor.device.type == 'cpu':
+        return _copy_crops(tensor, boxes, (h, w), padding_mode, fill, out)
+    # Coordinates only need to be padded when a box extends beyond the image.
+    padded = t_min < 0 or l_min < 0 or b_max > tensor.shape[-2] or r_max > tensor.shape[-1]
+    return _gather_crops(tensor, boxes, (h, w), padding_mode, fill, out, padded)
+
+
 def flip(tensor, horizontal=False, vertical=False):
     """Flip the image.
 
@@ -213,3 +475,438 @@ def fit(tensor, size, fit_mode='cover', resize_mode='bilinear', *, fill=0):
         return result
 
     raise Exception('This code should not be reached.')
+
+
+# Padding modes accepted by `Pipeline`, mapped to the equivalent `grid_sample` padding modes.
+_GRID_PADDING_MODES = {
+    'constant': 'zeros',
+    'replicate': 'border',
+    'reflect': 'reflection',
+}
+
+
+class _Mapping:
+    """Per-sample mapping from output pixel coordinates to input pixel coordinates.
+
+    Coordinates are continuous, with pixel `i` covering the interval `[i, i + 1)`. Along each
+    axis, output coordinate `u` maps to input coordinate `origin + scale * u`. A negative scale
+    means that the axis is flipped.
+    """
+
+    def __init__(self, batch_size):
+        self.origin = torch.zeros(batch_size, 2, dtype=torch.float64)
+        self.scale = torch.ones(batch_size, 2, dtype=torch.float64)
+
+    def crop(self, offset):
+        """Crop to a region starting at `offset` (y, x) in the current coordinates."""
+        self.origin += self.scale * torch.as_tensor(offset, dtype=torch.float64)
+
+    def resize(self, factor):
+        """Resize by dividing current coordinates by `factor` (y, x)."""
+        self.scale *= torch.as_tensor(factor, dtype=torch.float64)
+
+    def flip(self, flipped, size):
+        """Flip the axes where `flipped` (y, x) is set, given the current `size` (h, w)."""
+        flipped = torch.as_tensor(flipped, dtype=torch.bool).expand_as(self.scale)
+        size = torch.as_tensor(size, dtype=torch.float64)
+        self.origin = torch.where(flipped, self.origin + self.scale * size, self.origin)
+        self.scale = torch.where(flipped, -self.scale, self.scale)
+
+    def is_uniform(self):
+        """Check whether every sample has the same mapping."""
+        return bool((self.scale == self.scale[0]).all() and (self.origin == self.origin[0]).all())
+
+    def bounds(self, size):
+        """Get the per-sample input regions as (y0, x0) and (y1, x1) tensors."""
+        end = self.origin + self.scale * torch.as_tensor(size, dtype=torch.float64)
+        return torch.minimum(self.origin, end), torch.maximum(self.origin, end)
+
+
+class Crop:
+    def __init__(self, t, l, h, w):
+        """Crop every sample to the same region (see `crop`)."""
+        self.t, self.l, self.h, self.w = t, l, h, w
+
+    def output_size(self, size):
+        return self.h, self.w
+
+    def sample(self, batch_size, size, generator):
+        return None
+
+    def apply(self, mapping, size, params):
+        mapping.crop((self.t, self.l))
+
+
+class CentreCrop:
+    def __init__(self, size):
+        """Crop the centre of every sample to `size` (height, width)."""
+        self.size = tuple(size)
+
+    def output_size(self, size):
+        return self.size
+
+    def sample(self, batch_size, size, generator):
+        return None
+
+    def apply(self, mapping, size, params):
+        mapping.crop(((size[0] - self.size[0]) // 2, (size[1] - self.size[1]) // 2))
+
+
+class RandomCrop:
+    def __init__(self, size):
+        """Crop each sample to `size` (height, width) at a random position.
+
+        Parameters are an [B x 2] tensor of (top, left) offsets.
+        """
+        self.size = tuple(size)
+
+    def output_size(self, size):
+        return self.size
+
+    def sample(self, batch_size, size, generator):
+        offsets = []
+        for in_dim, out_dim in zip(size, self.size):
+            # If the crop is larger than the image, the image is placed randomly within it.
+            low, high = min(in_dim - out_dim, 0), max(in_dim - out_dim, 0)
+            offsets.append(torch.randint(low, high + 1, (batch_size,), generator=generator))
+        return torch.stack(offsets, -1)
+
+    def apply(self, mapping, size, params):
+        mapping.crop(params)
+
+
+class RandomResizedCrop:
+    def __init__(self, size, scale=(0.08, 1.0), ratio=(3 / 4, 4 / 3)):
+        """Crop a random region of each sample, and resize it to `size` (height, width).
+
+        The region covers a random fraction of the image area in the range `scale`, and has a
+        random aspect ratio (width / height) in the range `ratio`, sampled on a log scale.
+        Parameters are an [B x 4] tensor of (top, left, height, width) regions.
+        """
+        self.size = tuple(size)
+        self.scale = scale
+        self.ratio = ratio
+
+    def output_size(self, size):
+        return self.size
+
+    def sample(self, batch_size, size, generator):
+        h, w = size
+        area = torch.empty(batch_size, dtype=torch.float64).uniform_(*self.scale,
+                                                                     generator=generator)
+        log_ratio = torch.empty(batch_size, dtype=torch.float64).uniform_(
+            math.log(self.ratio[0]), math.log(self.ratio[1]), generator=generator)
+        ratio = log_ratio.exp()
+        crop_w = (area * h * w * ratio).sqrt().clamp_(max=w)
+        crop_h = (area * h * w / ratio).sqrt().clamp_(max=h)
+        offsets = torch.rand(batch_size, 2, dtype=torch.float64, generator=generator)
+        crop_t = offsets[:, 0] * (h - crop_h)
+        crop_l = offsets[:, 1] * (w - crop_w)
+        return torch.stack([crop_t, crop_l, crop_h, crop_w], -1)
+
+    def apply(self, mapping, size, params):
+        params = torch.as_tensor(params, dtype=torch.float64)
+        mapping.crop(params[:, :2])
+        mapping.resize(params[:, 2:] / torch.as_tensor(self.size, dtype=torch.float64))
+
+
+class Resize:
+    def __init__(self, size):
+        """Resize every sample to `size` (height, width)."""
+        self.size = tuple(size)
+
+    def output_size(self, size):
+        return self.size
+
+    def sample(self, batch_size, size, generator):
+        return None
+
+    def apply(self, mapping, size, params):
+        mapping.resize((size[0] / self.size[0], size[1] / self.size[1]))
+
+
+class Flip:
+    def __init__(self, horizontal=False, vertical=False):
+        """Flip every sample (see `flip`)."""
+        self.horizontal = horizontal
+        self.vertical = vertical
+
+    def output_size(self, size):
+        return size
+
+    def sample(self, batch_size, size, generator):
+        return None
+
+    def apply(self, mapping, size, params):
+        mapping.flip((self.vertical, self.horizontal), size)
+
+
+class RandomFlip:
+    def __init__(self, horizontal=True, vertical=False, p=0.5):
+        """Flip each sample with probability `p`.
+
+        Parameters are an [B x 2] boolean tensor of (vertical, horizontal) flips.
+        """
+        self.horizontal = horizontal
+        self.vertical = vertical
+        self.p = p
+
+    def output_size(self, size):
+        return size
+
+    def sample(self, batch_size, size, generator):
+        enabled = torch.tensor([self.vertical, self.horizontal])
+        return (torch.rand(batch_size, 2, generator=generator) < self.p) & enabled
+
+    def apply(self, mapping, size, params):
+        mapping.flip(params, size)
+
+
+class Normalise:
+    def __init__(self, mean, stddev):
+        """Normalise every sample (see `normalise`).
+
+        Normalisation must come after all spatial ops in a `Pipeline`.
+        """
+        self.mean = mean
+        self.stddev = stddev
+
+
+class Pipeline:
+    def __init__(self, ops, dtype=torch.float32, mode='bilinear', padding_mode='constant'):
+        """A sequence of transforms which is applied to a batch of images in as few passes as
+        possible.
+
+        The spatial ops (crops, resizes and flips) are combined into a single mapping from output
+        pixels to input pixels for each sample, which is applied in one of three ways:
+
+        * When every sample maps to the same integer-aligned region, the input is narrowed and
+          resized with a single `interpolate`.
+        * When only whole pixels are moved (crops and flips without resizing), each sample is
+          written straight from a view of the input.
+        * Otherwise, all samples are resampled with a single `grid_sample` call. Unlike cropping
+          and then resizing, this interpolates from pixels just outside of crop regions.
+
+        Conversion to the output data type and normalisation are combined into a single
+        elementwise pass over the output.
+
+        Random ops take their per-sample parameters as tensors, so that a whole batch can be
+        augmented in one call. Parameters are drawn with `sample_params` unless they are given.
+
+        Args:
+            ops (Sequence): The ops to apply, in order (eg. `RandomCrop`, `Resize`, `RandomFlip`,
+                `Normalise`).
+            dtype: Data type of the output. Floating point images have values in [0, 1] before
+                normalisation, and uint8 images have values in [0, 255].
+            mode (str): The pixel sampling interpolation mode ('nearest', 'bilinear' or
+                'bicubic').
+            padding_mode (str): How to fill regions which fall outside of the input image:
+                'constant' (zeros), 'replicate', or 'reflect'.
+        """
+        if padding_mode not in _GRID_PADDING_MODES:
+            raise ValueError(f'unsupported padding mode: {padding_mode}')
+        self.ops = list(ops)
+        self.dtype = dtype
+        self.mode = mode
+        self.padding_mode = padding_mode
+        self.spatial_ops = []
+        self.normalise_ops = []
+        for op in self.ops:
+            if isinstance(op, Normalise):
+                self.normalise_ops.append(op)
+            elif self.normalise_ops:
+                raise ValueError('Normalise must come after all spatial ops')
+            else:
+                self.spatial_ops.append(op)
+        if self.normalise_ops and not dtype.is_floating_point:
+            raise ValueError('normalised images must have a floating point dtype')
+
+    def output_size(self, size):
+        """Get the (height, width) of images output for inputs of the given size."""
+        for op in self.spatial_ops:
+            size = op.output_size(size)
+        return tuple(size)
+
+    def sample_params(self, batch_size, size, generator=None):
+        """Draw random parameters for every sample in a batch.
+
+        Args:
+            batch_size (int): Number of samples.
+            size (tuple of int): Size of the input images (height, width).
+            generator (torch.Generator): Optional random number generator.
+
+        Returns:
+            list: Parameters for each spatial op (`None` for ops which are not random).
+        """
+        params = []
+        for op in self.spatial_ops:
+            params.append(op.sample(batch_size, size, generator))
+            size = op.output_size(size)
+        return params
+
+    def __call__(self, tensor, params=None, generator=None):
+        """Transform a batch of images.
+
+        Args:
+            tensor (torch.Tensor): The images, with shape [B x ... x C x H x W]. Dimensions
+                between the first and the last three (eg. time in [B x T x C x H x W] clips)
+                share the parameters of their sample. A [C x H x W] tensor is a single sample.
+            params (list): Per-sample parameters, as returned by `sample_params`. If `None`,
+                parameters are drawn using `generator`.
+            generator (torch.Generator): Optional random number generator.
+
+        Returns:
+            Tensor: The transformed images.
+        """
+        if tensor.ndimension() < 3:
+            raise ValueError('tensor must be at least 3D')
+        lead_shape = tensor.shape[:-3]
+        c, h, w = tensor.shape[-3:]
+        batch_size = tensor.shape[0] if tensor.ndimension() > 3 else 1
+        # Group the images as [B x N x C x H x W], where the N images of a sample are transformed
+        # in the same way.
+        images = tensor.reshape(batch_size, -1, c, h, w)
+        if params is None:
+            params = self.sample_params(batch_size, (h, w), generator)
+        if len(params) != len(self.spatial_ops):
+            raise ValueError(f'expected parameters for {len(self.spatial_ops)} spatial ops, '
+                             f'got {len(params)}')
+        mapping = _Mapping(batch_size)
+        size = (h, w)
+        for op, op_params in zip(self.spatial_ops, params):
+            if op_params is not None:
+                op_params = torch.as_tensor(op_params).cpu()
+            op.apply(mapping, size, op_params)
+            size = op.output_size(size)
+        result = self._transform(images, mapping, tuple(size))
+        return result.reshape(*lead_shape, c, *size)
+
+    def _transform(self, images, mapping, size):
+        """Apply the spatial mapping and the pointwise ops to [B x N x C x H x W] images."""
+        batch_size, n, c, h, w = images.shape
+        affine = self._affine(c, images.dtype, images.device)
+        lo, hi = mapping.bounds(size)
+        in_bounds = bool((lo >= 0).all() and (hi <= torch.tensor([h, w])).all())
+        whole_pixels = bool((mapping.scale.abs() == 1).all()
+                            and (mapping.origin == mapping.origin.round()).all())
+        if in_bounds and mapping.is_uniform() and bool((mapping.scale > 0).all()):
+            (y0, x0), (y1, x1) = lo[0].tolist(), hi[0].tolist()
+            if all(float(v).is_integer() for v in (y0, x0, y1, x1)):
+                # Every sample uses the same region of the input, so narrow the input to that
+                # region and resize it with a single `interpolate`.
+                region = images[..., int(y0):int(y1), int(x0):int(x1)]
+                if region.shape[-2:] != size:
+                    region = resize(self._to_float(region), size, self.mode)
+                return self._convert(region, affine)
+        if in_bounds and whole_pixels:
+            # Only whole pixels are moved around (eg. by crops and flips), so each sample is a
+            # (possibly flipped) view of the input which can be written to the output directly.
+            out = torch.empty((batch_size, n, c, *size), dtype=self.dtype, device=images.device)
+            flipped = (mapping.scale < 0).tolist()
+            for i, ((y0, x0), (flip_y, flip_x)) in enumerate(zip(lo.long().tolist(), flipped)):
+                region = images[i, ..., y0:y0 + size[0], x0:x0 + size[1]]
+                dims = [d for d, f in ((-2, flip_y), (-1, flip_x)) if f]
+                if dims:
+                    region = region.flip(dims)
+                self._convert(region, affine, out[i])
+            return out
+        resampled = self._grid_sample(images, mapping, size, in_bounds)
+        return self._convert(resampled, affine, resampled)
+
+    def _grid_sample(self, images, mapping, size, in_bounds):
+        """Resample every sample of [B x N x C x H x W] images with a single `grid_sample`."""
+        b, n, c, h, w = images.shape
+        origin = mapping.origin
+        if in_bounds:
+            # Copy the region sampled by each sample (plus a margin for the interpolation
+            # kernel) into a compact buffer, converting it to floating point on the way.
+            image_size = torch.tensor([h, w], dtype=torch.float64)
+            lo, hi = mapping.bounds(size)
+            start = (lo.floor() - 2).clamp(min=0)
+            window = (torch.minimum(hi.ceil() + 2, image_size) - start).max(0).values
+            start = torch.minimum(start, image_size - window)
+            wh, ww = window.long().tolist()
+            buffer = torch.empty((b, n, c, wh, ww), dtype=self._float_dtype, device=images.device)
+            for i, (y0, x0) in enumerate(start.long().tolist()):
+                buffer[i].copy_(images[i, ..., y0:y0 + wh, x0:x0 + ww])
+            images = buffer
+            origin = origin - start
+        else:
+            images = self._to_float(images)
+        in_size = torch.tensor(images.shape[-2:], dtype=torch.float64)
+        out_size = torch.tensor(size, dtype=torch.float64)
+        # Express the mapping in the normalised coordinates used by `grid_sample`, where the
+        # corners of an image are at -1 and 1 (with `align_corners=False`). The affine grid is
+        # in (x, y) order.
+        a = mapping.scale * out_size / in_size
+        t = (2 * origin + mapping.scale * out_size) / in_size - 1
+        theta = torch.zeros(b, 2, 3, dtype=torch.float64)
+        theta[:, 0, 0] = a[:, 1]
+        theta[:, 0, 2] = t[:, 1]
+        theta[:, 1, 1] = a[:, 0]
+        theta[:, 1, 2] = t[:, 0]
+        theta = theta.to(device=images.device, dtype=images.dtype)
+        # All images of a sample share its grid, so they are sampled as extra channels.
+        images = images.reshape(b, n * c, *images.shape[-2:])
+        grid = affine_grid(theta, [b, n * c, *size], align_corners=False)
+        resampled = grid_sample(images, grid, mode=self.mode,
+                                padding_mode=_GRID_PADDING_MODES[self.padding_mode],
+                                align_corners=False)
+        return resampled.view(b, n, c, *size)
+
+    @property
+    def _float_dtype(self):
+        """Data type used for resampling."""
+        return self.dtype if self.dtype.is_floating_point else torch.float32
+
+    def _to_float(self, images):
+        if images.is_floating_point():
+            return images
+        return images.to(self._float_dtype)
+
+    def _affine(self, c, in_dtype, device):
+        """Combine data type conversion and normalisation into a per-channel affine transform.
+
+        Returns:
+            tuple: `(scale, shift)` tensors such that output = input * scale + shift, or `None`
+            if the transform is the identity.
+        """
+        scale = 1.0
+        if in_dtype.is_floating_point and not self.dtype.is_floating_point:
+            scale = 255.0
+        elif not in_dtype.is_floating_point and self.dtype.is_floating_point:
+            scale = 1 / 255
+        scale = torch.full((c,), scale, dtype=torch.float64)
+        shift = torch.zeros(c, dtype=torch.float64)
+        for op in self.normalise_ops:
+            mean = torch.as_tensor(op.mean, dtype=torch.float64)
+            stddev = torch.as_tensor(op.stddev, dtype=torch.float64)
+            scale = scale / stddev
+            shift = (shift - mean) / stddev
+        if bool((scale == 1).all() and (shift == 0).all()):
+            return None
+        return (scale.to(device=device, dtype=self._float_dtype)[:, None, None],
+                shift.to(device=device, dtype=self._float_dtype)[:, None, None])
+
+    def _convert(self, images, affine, out=None):
+        """Convert images to the output data type and normalise them, in a single pass.
+
+        Args:
+            images (torch.Tensor): The resampled images.
+            affine (tuple): The transform returned by `_affine`.
+            out (torch.Tensor): Optional tensor to write the result into (which may be `images`
+                itself, if it has the output data type).
+        """
+        if images.is_floating_point() and not self.dtype.is_floating_point:
+            if affine is not None:
+                images = torch.addcmul(affine[1], images, affine[0])
+            converted = images.round().clamp_(0, 255)
+            if out is None or out.dtype != self.dtype:
+                return converted.to(self.dtype)
+            return out.copy_(converted)
+        if affine is None:
+            if out is None or out is images:
+                return images.to(self.dtype)
+            return out.copy_(images)
+        scale, shift = affine
+        return torch.addcmul(shift, images, scale, out=out)
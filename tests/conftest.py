@@ -20,8 +20,8 @@ for i in range(torch.cuda.device_count()):
 
 
 class DummyBackend(Backend):
-    def __init__(self, frames, video_filename, device):
-        super().__init__(video_filename, device, torch.float32, 3, 0, 0)
+    def __init__(self, frames, video_filename, device, seek_threshold=3):
+        super().__init__(video_filename, device, torch.float32, seek_threshold, 0, 0)
         self.frames = frames
         self.pos = 0
 
@@ -55,6 +55,22 @@ class DummyBackend(Backend):
     def seek(self, *args):
         pass
 
+
+class IndexedDummyBackend(DummyBackend):
+    """Dummy backend with small frames which supports seeking by frame index."""
+
+    @property
+    def width(self):
+        return 4
+
+    @property
+    def height(self):
+        return 4
+
+    def seek_to_frame(self, frame_index):
+        self.pos = frame_index
+
+
 class DummyBackendFactory(BackendFactory):
     def __init__(self, frames, video_filename, device):
         self.frames = frames
@@ -65,6 +81,11 @@ class DummyBackendFactory(BackendFactory):
         return DummyBackend(self.frames, self.video_filename, self.device)
 
 
+class IndexedDummyBackendFactory(DummyBackendFactory):
+    def create(self, *args):
+        return IndexedDummyBackend(self.frames, self.video_filename, self.device)
+
+
 @pytest.fixture()
 def dummy_backend_factory_cpu(video_filename):
     frames = [object() for _ in range(5)]
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from time import sleep
+
+import pytest
+import torch
+
+import tvl
+import tvl.stats
+from tvl.aio import AsyncVideoLoader
+from tests.conftest import IndexedDummyBackend, IndexedDummyBackendFactory
+
+
+class SlowBackend(IndexedDummyBackend):
+    """Dummy backend which counts frame reads and takes a little while to decode each frame."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.n_reads = 0
+
+    def read_frame(self):
+        sleep(0.01)
+        self.n_reads += 1
+        return super().read_frame()
+
+
+class SlowBackendFactory(IndexedDummyBackendFactory):
+    def create(self, *args):
+        return SlowBackend(self.frames, self.video_filename, self.device)
+
+
+@pytest.fixture
+def frames():
+    return [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(20)]
+
+
+@pytest.fixture(autouse=True)
+def slow_backend_factory(frames, video_filename):
+    tvl.set_backend_factory('cpu', SlowBackendFactory(frames, video_filename, 'cpu'))
+
+
+def frame_values(frames):
+    return [int(frame[0, 0, 0]) for frame in frames]
+
+
+def test_select_frames(video_filename):
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            return await vl.select_frames([12, 3, 5])
+
+    assert frame_values(asyncio.run(main())) == [3, 5, 12]
+
+
+def test_select_frames_stacked(video_filename):
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            return await vl.select_frames_stacked([12, 3, 5, 6])
+
+    frames = asyncio.run(main())
+    assert frames.shape == (4, 3, 4, 4)
+    assert frame_values(frames) == [3, 5, 6, 12]
+
+
+def test_select_frames_stats(video_filename):
+    tvl.stats.set_stats_enabled(True)
+
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            await vl.select_frames([1, 3])
+            await vl.select_frames_stacked([4, 5, 6])
+            return dict(vl._loader.stats.counters)
+
+    try:
+        assert asyncio.run(main())['frames_returned'] == 5
+    finally:
+        tvl.stats.set_stats_enabled(False)
+
+
+def test_select_frames_roi(video_filename, mocker):
+    spy = mocker.spy(tvl.VideoLoader, 'select_frames')
+
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            return await vl.select_frames([3, 5], roi=(1, 1, 2, 2))
+
+    asyncio.run(main())
+    assert spy.call_args[1]['roi'] == (1, 1, 2, 2)
+
+
+def test_concurrent_requests(video_filename):
+    async def main():
+        vls = [AsyncVideoLoader(video_filename, 'cpu') for _ in range(4)]
+        results = await asyncio.gather(*[vl.select_frames([i, i + 10]) for i, vl in enumerate(vls)])
+        for vl in vls:
+            await vl.close()
+        return results
+
+    assert [frame_values(e) for e in asyncio.run(main())] == [[i, i + 10] for i in range(4)]
+
+
+def test_remaining_frames(video_filename):
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            await vl.seek_to_frame(15)
+            return [frame async for frame in vl.remaining_frames()]
+
+    assert frame_values(asyncio.run(main())) == list(range(15, 20))
+
+
+def test_remaining_frames_bounded_read_ahead(video_filename):
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            frames = vl.remaining_frames(read_ahead=2)
+            await frames.__anext__()
+            # Give the producer plenty of time to run ahead.
+            await asyncio.sleep(0.2)
+            n_reads = vl._loader.backend.n_reads
+            await frames.aclose()
+            return n_reads
+
+    # One consumed frame, two queued frames, and one frame waiting to be queued.
+    assert asyncio.run(main()) <= 4
+
+
+def test_cancel_select_frames(video_filename):
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            task = asyncio.ensure_future(vl.select_frames(range(20)))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            n_reads = vl._loader.backend.n_reads
+            await asyncio.sleep(0.1)
+            # Decoding should have stopped shortly after cancellation.
+            assert vl._loader.backend.n_reads <= n_reads + 1
+            return n_reads
+
+    assert asyncio.run(main()) < 20
+
+
+def test_decode_executor(video_filename):
+    thread_names = set()
+
+    class RecordingBackend(SlowBackend):
+        def read_frame(self):
+            thread_names.add(threading.current_thread().name)
+            return super().read_frame()
+
+    async def main():
+        async with AsyncVideoLoader(video_filename, 'cpu') as vl:
+            vl._loader.backend.__class__ = RecordingBackend
+            await vl.select_frames([1, 2])
+
+    asyncio.run(main())
+    assert thread_names and all(name.startswith('tvl-decode') for name in thread_names)
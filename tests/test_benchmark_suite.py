@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.suite import compare_results
+
+
+def make_result(scenario, fps=None, p50=None, error=None):
+    result = {'backend': 'pyav', 'device': 'cpu', 'scenario': scenario}
+    if error is not None:
+        result['error'] = error
+    else:
+        result.update(fps=fps, latency_ms={'p50': p50})
+    return result
+
+
+def compare(baseline, current, threshold=0.1):
+    rows = compare_results({'results': baseline}, {'results': current}, threshold)
+    return {row['scenario']: row for row in rows}
+
+
+@pytest.mark.parametrize('fps,p50,regression', [
+    (100.0, 10.0, False),
+    # Changes within the threshold are not regressions.
+    (91.0, 10.9, False),
+    (89.0, 10.0, True),
+    (100.0, 11.1, True),
+    # Getting faster is never a regression.
+    (200.0, 5.0, False),
+])
+def test_compare_results_threshold(fps, p50, regression):
+    rows = compare([make_result('a', 100.0, 10.0)], [make_result('a', fps, p50)])
+    assert rows['a']['regression'] == regression
+    assert rows['a']['fps_change'] == pytest.approx(fps / 100.0 - 1)
+    assert rows['a']['p50_change'] == pytest.approx(p50 / 10.0 - 1)
+    assert rows['a']['note'] is None
+
+
+def test_compare_results_custom_threshold():
+    rows = compare([make_result('a', 100.0, 10.0)], [make_result('a', 89.0, 10.0)],
+                   threshold=0.2)
+    assert not rows['a']['regression']
+
+
+def test_compare_results_not_compared():
+    baseline = [
+        make_result('failed_before', error='RuntimeError: oops'),
+        make_result('failed_now', 100.0, 10.0),
+        make_result('removed', 100.0, 10.0),
+    ]
+    current = [
+        make_result('failed_before', 100.0, 10.0),
+        make_result('failed_now', error='RuntimeError: oops'),
+        make_result('added', 100.0, 10.0),
+    ]
+    rows = compare(baseline, current)
+    assert set(rows) == {'failed_before', 'failed_now', 'removed', 'added'}
+    assert rows['failed_before']['note'] == 'failed in baseline'
+    assert rows['added']['note'] == 'not in baseline'
+    assert rows['removed']['note'] == 'not in current results'
+    assert rows['failed_now']['note'] == 'failed'
+    # Only a new failure counts as a regression.
+    assert [name for name, row in rows.items() if row['regression']] == ['failed_now']
+    assert all(rows[name]['fps_change'] is None for name in rows)
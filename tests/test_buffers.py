@@ -0,0 +1,25 @@
+import pytest
+import torch
+
+from tvl.buffers import FrameBufferRing
+
+
+def test_frame_buffer_ring_recycles_buffers():
+    ring = FrameBufferRing(2)
+    buffers = [ring.next_buffer((3, 4, 4)) for _ in range(3)]
+    assert buffers[0] is buffers[2]
+    assert buffers[0] is not buffers[1]
+    assert buffers[0].dtype == torch.uint8
+    assert buffers[0].is_contiguous()
+
+
+def test_frame_buffer_ring_reallocates_on_shape_change():
+    ring = FrameBufferRing(1)
+    buffer = ring.next_buffer((3, 4, 4))
+    assert ring.next_buffer((3, 4, 4)) is buffer
+    assert ring.next_buffer((3, 2, 2)).shape == (3, 2, 2)
+
+
+def test_frame_buffer_ring_size():
+    with pytest.raises(ValueError):
+        FrameBufferRing(0)
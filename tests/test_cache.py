@@ -0,0 +1,137 @@
+from unittest.mock import call
+
+import pytest
+import torch
+
+import tvl
+from tvl.cache import FrameCache, CachedBackend
+from tests.conftest import IndexedDummyBackend
+
+
+@pytest.fixture
+def frames():
+    return [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(20)]
+
+
+@pytest.fixture
+def inner_backend(frames, video_filename):
+    return IndexedDummyBackend(frames, video_filename, 'cpu')
+
+
+FRAME_BYTES = 3 * 4 * 4 * 4
+
+
+def test_frame_cache_lru_eviction():
+    cache = FrameCache(max_bytes=2 * FRAME_BYTES)
+    for i in range(3):
+        cache.put(i, torch.zeros(3, 4, 4))
+    assert len(cache) == 2
+    assert cache.n_bytes == 2 * FRAME_BYTES
+    assert cache.evictions == 1
+    assert cache.get(0) is None
+    assert cache.get(1) is not None
+    cache.put(3, torch.zeros(3, 4, 4))
+    # Frame 1 was used more recently than frame 2, so frame 2 should have been evicted.
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.stats() == dict(hits=2, misses=2, evictions=2, n_frames=2,
+                                 n_bytes=2 * FRAME_BYTES)
+
+
+def test_frame_cache_oversized_frame():
+    cache = FrameCache(max_bytes=FRAME_BYTES - 1)
+    cache.put(0, torch.zeros(3, 4, 4))
+    assert len(cache) == 0
+
+
+def test_cached_backend_select_frames(inner_backend, frames, mocker):
+    cache = FrameCache(max_bytes=100 * FRAME_BYTES)
+    backend = CachedBackend(inner_backend, cache)
+    assert [f[0, 0, 0].item() for f in backend.select_frames([4, 2, 3])] == [2, 3, 4]
+    spy = mocker.spy(inner_backend, 'select_frames')
+    actual = list(backend.select_frames([5, 3, 1]))
+    # Only frames which were not already cached should be decoded.
+    spy.assert_called_once_with([1, 5])
+    assert [f[0, 0, 0].item() for f in actual] == [1, 3, 5]
+    assert actual[1] is frames[3]
+    assert (cache.hits, cache.misses) == (1, 5)
+
+
+def test_cached_backend_select_frames_stacked(inner_backend):
+    backend = CachedBackend(inner_backend, FrameCache(max_bytes=100 * FRAME_BYTES))
+    list(backend.select_frames([2]))
+    stacked = backend.select_frames_stacked([3, 2])
+    assert stacked.shape == (2, 3, 4, 4)
+    assert stacked[:, 0, 0, 0].tolist() == [2, 3]
+
+
+def test_cached_backend_roi(inner_backend, mocker):
+    cache = FrameCache(max_bytes=100 * FRAME_BYTES)
+    backend = CachedBackend(inner_backend, cache)
+    spy = mocker.spy(inner_backend, 'select_frames')
+    list(backend.select_frames([2]))
+    list(backend.select_frames([2], roi=(1, 1, 2, 2)))
+    # Frames read with different regions of interest must be cached separately.
+    assert spy.mock_calls == [call([2]), call([2], roi=(1, 1, 2, 2))]
+    list(backend.select_frames([2], roi=(1, 1, 2, 2)))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+class BufferReusingBackend(IndexedDummyBackend):
+    """Dummy backend which returns frames in a ring of two reusable buffers."""
+    reuses_frame_memory = True
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.buffers = [torch.empty(3, 4, 4) for _ in range(2)]
+        self.n_reads = 0
+
+    def read_frame(self):
+        buffer = self.buffers[self.n_reads % len(self.buffers)]
+        self.n_reads += 1
+        return buffer.copy_(super().read_frame())
+
+
+def test_cached_backend_reused_frame_memory(frames, video_filename):
+    inner_backend = BufferReusingBackend(frames, video_filename, 'cpu')
+    backend = CachedBackend(inner_backend, FrameCache(max_bytes=100 * FRAME_BYTES))
+    list(backend.select_frames([2, 3]))
+    # Reading more frames overwrites the buffers, which must not change the cached frames.
+    list(backend.select_frames([4, 5]))
+    assert [f[0, 0, 0].item() for f in backend.select_frames([2, 3, 4, 5])] == [2, 3, 4, 5]
+
+
+def test_cached_backend_release_frame(frames, video_filename, mocker):
+    inner_backend = BufferReusingBackend(frames, video_filename, 'cpu')
+    backend = CachedBackend(inner_backend, FrameCache(max_bytes=100 * FRAME_BYTES))
+    spy = mocker.spy(inner_backend, 'release_frame')
+    decoded, = backend.select_frames([2])
+    cached, = backend.select_frames([2])
+    uncached = backend.read_frame()
+    for frame in [decoded, cached, uncached]:
+        backend.release_frame(frame)
+    # The cache keeps a copy of the decoded frame, so only the cached copy is kept back.
+    assert spy.call_args_list == [call(decoded), call(uncached)]
+
+
+def test_cached_backend_release_shared_frame(inner_backend, mocker):
+    backend = CachedBackend(inner_backend, FrameCache(max_bytes=FRAME_BYTES))
+    spy = mocker.spy(inner_backend, 'release_frame')
+    frame, = backend.select_frames([2])
+    # The frame is evicted, but may still be in use by another reader which got it from the cache.
+    list(backend.select_frames([3]))
+    backend.release_frame(frame)
+    spy.assert_not_called()
+
+
+def test_vl_shared_frame_cache(dummy_backend_factory_cpu):
+    cache = FrameCache(max_bytes=1024)
+    tvl.set_frame_cache(cache)
+    try:
+        vl1 = tvl.VideoLoader('', 'cpu')
+        vl2 = tvl.VideoLoader('', 'cpu')
+    finally:
+        tvl.set_frame_cache(None)
+    assert vl1.backend.frame_cache is cache
+    assert vl2.backend.frame_cache is cache
+    assert not isinstance(tvl.VideoLoader('', 'cpu').backend, CachedBackend)
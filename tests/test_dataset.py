@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pytest
+import torch
+
+import tvl
+from tvl.dataset import AsyncDataset, BatchDataLoader, VideoClipDataset
+from tests.conftest import IndexedDummyBackendFactory
+
+
+class ListDataset:
+    def __init__(self, n, slow_indices=(), slow_event=None, delay=0):
+        self.n = n
+        self.slow_indices = set(slow_indices)
+        self.slow_event = slow_event
+        self.delay = delay
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if index in self.slow_indices:
+            self.slow_event.wait(timeout=10)
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return index
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown()
+
+
+def test_batch_data_loader_in_order(executor):
+    loader = BatchDataLoader(AsyncDataset(ListDataset(10), executor), batch_size=3)
+    assert [batch.tolist() for batch in loader] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+
+@pytest.mark.parametrize('prefetch_batches', [1, 3])
+def test_batch_data_loader_prefetch_depth(executor, prefetch_batches):
+    loader = BatchDataLoader(AsyncDataset(ListDataset(20), executor), batch_size=2,
+                             prefetch_batches=prefetch_batches)
+    batch_iter = iter(loader)
+    next(batch_iter)
+    # One batch has been returned, and the configured number of batches are in flight.
+    assert len(batch_iter.pending_batch_sizes) == prefetch_batches
+    assert len(batch_iter.pending_examples) == 2 * prefetch_batches
+
+
+def test_batch_data_loader_out_of_order(executor):
+    slow_event = Event()
+    dataset = AsyncDataset(ListDataset(8, slow_indices=[0], slow_event=slow_event), executor)
+    loader = BatchDataLoader(dataset, batch_size=2, prefetch_batches=3, in_order=False)
+    batches = []
+    for batch in loader:
+        batches.append(batch.tolist())
+        if len(batches) == 2:
+            slow_event.set()
+    # The slow example should not have held up the first batches.
+    assert 0 not in batches[0]
+    assert 0 not in batches[1]
+    assert sorted(sum(batches, [])) == list(range(8))
+    assert all(len(batch) == 2 for batch in batches)
+
+
+def test_batch_data_loader_adaptive_prefetch_slow_consumer(executor):
+    loader = BatchDataLoader(AsyncDataset(ListDataset(40), executor), batch_size=2,
+                             prefetch_batches=1, adaptive_prefetch=True, max_prefetch_batches=4)
+    batch_iter = iter(loader)
+    for _ in range(len(loader)):
+        next(batch_iter)
+        time.sleep(0.01)
+        # Batches are produced much faster than they are consumed, so time spent waiting in the
+        # prefetch queue should not make the queue grow.
+        assert batch_iter.max_buffer_len == 1
+    assert batch_iter.batch_latency < batch_iter.consumer_interval
+
+
+def test_batch_data_loader_adaptive_prefetch_slow_producer(executor):
+    loader = BatchDataLoader(AsyncDataset(ListDataset(40, delay=0.01), executor), batch_size=2,
+                             prefetch_batches=1, adaptive_prefetch=True, max_prefetch_batches=4)
+    batch_iter = iter(loader)
+    for _ in range(len(loader)):
+        next(batch_iter)
+    assert batch_iter.max_buffer_len == 4
+    assert batch_iter.batch_latency >= 0.01
+
+
+@pytest.fixture
+def clip_dataset(video_filename):
+    frames = [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(20)]
+    tvl.set_backend_factory('cpu', IndexedDummyBackendFactory(frames, video_filename, 'cpu'))
+    return VideoClipDataset([video_filename, video_filename], clip_length=3, stride=2,
+                            clip_step=4)
+
+
+def test_video_clip_dataset_clips(clip_dataset):
+    # Each video has 20 frames, and each clip spans 5 frames.
+    assert len(clip_dataset) == 8
+    example = clip_dataset[5]
+    assert example['video_index'] == 1
+    assert example['frame_indices'].tolist() == [4, 6, 8]
+    assert example['frames'][:, 0, 0, 0].tolist() == [4, 6, 8]
+
+
+def test_video_clip_dataset_plan_batch(clip_dataset):
+    assert clip_dataset.plan_batch([6, 1, 4, 0, 2]) == [[0, 1, 2], [4, 6]]
+
+
+def test_video_clip_dataset_load_group(clip_dataset, mocker):
+    select_spy = mocker.spy(tvl.VideoLoader, 'select_frames_stacked')
+    examples = clip_dataset.load_group([0, 1])
+    # Both clips should be read with a single call.
+    select_spy.assert_called_once()
+    assert select_spy.call_args.args[1] == [0, 2, 4, 6, 8]
+    assert [e['frames'][:, 0, 0, 0].tolist() for e in examples] == [[0, 2, 4], [4, 6, 8]]
+    with pytest.raises(ValueError):
+        clip_dataset.load_group([0, 5])
+
+
+def test_video_clip_dataset_jitter(clip_dataset):
+    clip_dataset.jitter = 3
+    for _ in range(20):
+        frame_indices = clip_dataset.clip_frame_indices(0)
+        assert 0 <= frame_indices[0] <= 3
+        assert frame_indices[-1] < 20
+
+
+def test_video_clip_dataset_batches(clip_dataset, executor):
+    loader = BatchDataLoader(AsyncDataset(clip_dataset, executor), batch_size=3)
+    example_indices = [batch['example_index'].tolist() for batch in loader]
+    assert example_indices == [[0, 1, 2], [3, 4, 5], [6, 7]]
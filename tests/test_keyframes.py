@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import tvl.keyframes
+from tvl.keyframes import get_keyframes, load_keyframes, save_keyframes, index_path
+
+
+@pytest.fixture(params=['cache_dir', 'sidecar'])
+def keyframe_store(request, tmp_path):
+    old_cache_dir = tvl.keyframes.get_cache_dir()
+    if request.param == 'cache_dir':
+        tvl.keyframes.set_cache_dir(tmp_path.joinpath('cache'))
+    else:
+        tvl.keyframes.set_cache_dir(None)
+    yield request.param
+    tvl.keyframes.set_cache_dir(old_cache_dir)
+
+
+@pytest.fixture
+def video_file(tmp_path):
+    path = tmp_path.joinpath('video.mkv')
+    path.write_bytes(b'not really a video')
+    return str(path)
+
+
+def test_index_path(keyframe_store, video_file, tmp_path):
+    path = index_path(video_file)
+    if keyframe_store == 'sidecar':
+        assert path == video_file + '.keyframes.json'
+    else:
+        assert os.path.dirname(path) == str(tmp_path.joinpath('cache'))
+
+
+def test_save_and_load_keyframes(keyframe_store, video_file):
+    assert load_keyframes(video_file) is None
+    save_keyframes(video_file, [10, 0, 5])
+    assert load_keyframes(video_file) == [0, 5, 10]
+
+
+def test_load_keyframes_after_file_change(keyframe_store, video_file):
+    save_keyframes(video_file, [0, 5, 10])
+    with open(video_file, 'ab') as f:
+        f.write(b'...')
+    assert load_keyframes(video_file) is None
+
+
+def test_get_keyframes_scans_once(keyframe_store, video_file, mocker):
+    scan = mocker.Mock(return_value=[0, 12, 24])
+    assert get_keyframes(video_file, scan) == [0, 12, 24]
+    assert get_keyframes(video_file, scan) == [0, 12, 24]
+    scan.assert_called_once_with(video_file)
+
+
+def test_save_and_load_frame_pts(keyframe_store, video_file):
+    save_keyframes(video_file, [0, 2], frame_pts=[0, 40, 80])
+    assert load_keyframes(video_file) == [0, 2]
+    assert load_keyframes(video_file, with_frame_pts=True) == ([0, 2], [0, 40, 80])
+
+
+def test_get_keyframes_with_frame_pts(keyframe_store, video_file, mocker):
+    # An index without frame timestamps must be rebuilt to get them.
+    save_keyframes(video_file, [0])
+    scan = mocker.Mock(return_value=([0, 2], [0, 40, 80]))
+    assert get_keyframes(video_file, scan, with_frame_pts=True) == ([0, 2], [0, 40, 80])
+    assert get_keyframes(video_file, scan, with_frame_pts=True) == ([0, 2], [0, 40, 80])
+    scan.assert_called_once_with(video_file)
+
+
+def test_save_keyframes_unwritable(video_file, mocker):
+    mocker.patch('tvl.keyframes.index_path', return_value='/dev/null/video.json')
+    save_keyframes(video_file, [0])  # Should not raise.
@@ -0,0 +1,46 @@
+import pytest
+
+import tvl.metadata
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata():
+    tvl.metadata.clear_metadata()
+    old_max_entries = tvl.metadata.get_max_entries()
+    yield
+    tvl.metadata.set_max_entries(old_max_entries)
+    tvl.metadata.clear_metadata()
+
+
+@pytest.fixture
+def filenames(tmp_path):
+    filenames = []
+    for i in range(3):
+        filename = tmp_path.joinpath(f'video{i}.mkv')
+        filename.write_bytes(bytes(i + 1))
+        filenames.append(str(filename))
+    return filenames
+
+
+def test_metadata_namespaces(filenames):
+    tvl.metadata.update_metadata(filenames[0], 'A', n_frames=10)
+    tvl.metadata.update_metadata(filenames[0], 'B', n_frames=11)
+    assert tvl.metadata.get_metadata(filenames[0], 'A') == dict(n_frames=10)
+    assert tvl.metadata.get_metadata(filenames[0], 'B') == dict(n_frames=11)
+    assert tvl.metadata.get_metadata(filenames[1], 'A') == {}
+
+
+def test_metadata_lru_eviction(filenames):
+    tvl.metadata.set_max_entries(2)
+    tvl.metadata.update_metadata(filenames[0], n_frames=0)
+    tvl.metadata.update_metadata(filenames[1], n_frames=1)
+    # Using the first entry makes the second one the least recently used.
+    assert tvl.metadata.get_metadata(filenames[0]) == dict(n_frames=0)
+    tvl.metadata.update_metadata(filenames[2], n_frames=2)
+    assert tvl.metadata.get_metadata(filenames[1]) == {}
+    assert tvl.metadata.get_metadata(filenames[0]) == dict(n_frames=0)
+    assert tvl.metadata.get_metadata(filenames[2]) == dict(n_frames=2)
+    tvl.metadata.set_max_entries(1)
+    assert tvl.metadata.get_metadata(filenames[0]) == {}
+    with pytest.raises(ValueError):
+        tvl.metadata.set_max_entries(0)
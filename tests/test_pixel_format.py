@@ -0,0 +1,100 @@
+import pytest
+import torch
+
+import tvl
+from tvl.pixel_format import check_pixel_format, convert_rgb_planar, frame_shape, nv12_planes, \
+    yuv420_to_rgb, yuv420p_planes
+
+
+def test_check_pixel_format():
+    check_pixel_format('yuv420p')
+    with pytest.raises(ValueError):
+        check_pixel_format('nv12')
+
+
+@pytest.mark.parametrize('pixel_format,expected', [
+    ('rgb_planar', (3, 4, 6)),
+    ('rgb_hwc', (4, 6, 3)),
+    ('yuv420p', (6, 6)),
+    ('gray', (1, 4, 6)),
+])
+def test_frame_shape(pixel_format, expected):
+    assert frame_shape(pixel_format, 4, 6) == expected
+
+
+def test_frame_shape_yuv420p_odd_size():
+    with pytest.raises(ValueError):
+        frame_shape('yuv420p', 5, 6)
+
+
+def test_convert_rgb_planar_hwc():
+    rgb = torch.arange(3 * 4 * 6, dtype=torch.uint8).view(3, 4, 6)
+    hwc = convert_rgb_planar(rgb, 'rgb_hwc')
+    assert hwc.is_contiguous()
+    assert torch.equal(hwc, rgb.permute(1, 2, 0))
+
+
+def test_convert_rgb_planar_yuv420p():
+    rgb = torch.zeros((2, 3, 4, 6), dtype=torch.uint8)
+    rgb[0] = 255
+    rgb[1, 0] = 255
+    yuv = convert_rgb_planar(rgb, 'yuv420p')
+    assert yuv.shape == (2, 6, 6)
+    # White has maximum luma and neutral chroma (in limited range).
+    assert yuv[0, :4].eq(235).all()
+    assert yuv[0, 4:].eq(128).all()
+    # Red has a large V (Cr) component.
+    y, u, v = yuv[1, :4], yuv[1, 4:5], yuv[1, 5:6]
+    assert y.eq(81).all()
+    assert u.eq(90).all()
+    assert v.eq(240).all()
+
+
+def test_convert_rgb_planar_gray_float():
+    rgb = torch.ones((3, 4, 6))
+    gray = convert_rgb_planar(rgb, 'gray')
+    assert gray.shape == (1, 4, 6)
+    assert torch.allclose(gray, torch.full_like(gray, 235 / 255))
+
+
+def test_yuv420_to_rgb_round_trip():
+    # Colours which are constant over each 2x2 block survive chroma subsampling.
+    rgb = torch.randint(20, 230, (3, 2, 3), dtype=torch.uint8)
+    rgb = rgb.repeat_interleave(2, 1).repeat_interleave(2, 2)
+    yuv = convert_rgb_planar(rgb, 'yuv420p')
+    actual = yuv420_to_rgb(*yuv420p_planes(yuv), dtype=torch.uint8)
+    assert actual.dtype == torch.uint8
+    assert (actual.int() - rgb.int()).abs().max() <= 2
+
+
+def test_yuv420_to_rgb_float():
+    yuv = convert_rgb_planar(torch.ones((3, 4, 6), dtype=torch.uint8) * 255, 'yuv420p')
+    rgb = yuv420_to_rgb(*yuv420p_planes(yuv))
+    assert rgb.dtype == torch.float32
+    assert torch.allclose(rgb, torch.ones((3, 4, 6)), atol=1e-3)
+
+
+def test_yuv420_to_rgb_resize():
+    yuv = torch.randint(0, 256, (12, 8), dtype=torch.uint8)
+    out = torch.empty((3, 2, 4), dtype=torch.uint8)
+    rgb = yuv420_to_rgb(*yuv420p_planes(yuv), size=(2, 4), out=out)
+    assert rgb is out
+    rgb = yuv420_to_rgb(*yuv420p_planes(yuv), size=(16, 12))
+    assert rgb.shape == (3, 16, 12)
+    assert rgb.min() >= 0 and rgb.max() <= 1
+
+
+def test_nv12_planes():
+    nv12 = torch.arange(4 * 6 * 3 // 2)
+    y, u, v = nv12_planes(nv12, 4, 6)
+    assert torch.equal(y.flatten(), torch.arange(24))
+    assert torch.equal(u.flatten(), torch.arange(24, 36, 2))
+    assert torch.equal(v.flatten(), torch.arange(25, 36, 2))
+
+
+def test_vl_pixel_format(dummy_backend_factory_cpu, mocker):
+    create_spy = mocker.spy(dummy_backend_factory_cpu, 'create')
+    tvl.VideoLoader('', 'cpu', pixel_format='gray')
+    assert create_spy.call_args.args[3] == {'pixel_format': 'gray'}
+    with pytest.raises(ValueError):
+        tvl.VideoLoader('', 'cpu', pixel_format='bgr')
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import torch
+
+from tvl.dataset import BatchDataLoader
+from tvl.process_pool import ProcessPoolDataset
+
+
+class TensorDataset:
+    def __init__(self, n):
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if index < 0:
+            raise IndexError(index)
+        return dict(
+            frames=torch.full((2, 3, 4, 5), index, dtype=torch.uint8),
+            labels=[torch.tensor([index]), index],
+            example_index=index,
+        )
+
+
+@pytest.fixture
+def pool_dataset():
+    with ProcessPoolDataset(TensorDataset(12), num_workers=2, slots_per_worker=2) as dataset:
+        yield dataset
+
+
+def test_process_pool_dataset_getitem(pool_dataset):
+    future = pool_dataset[3]
+    example = future.result(timeout=60)
+    assert example['example_index'] == 3
+    assert torch.equal(example['frames'], torch.full((2, 3, 4, 5), 3, dtype=torch.uint8))
+    assert example['labels'][0].item() == 3
+    assert example['labels'][1] == 3
+    assert example['frames'].is_shared()
+    future.release()
+
+
+def test_process_pool_dataset_slot_reuse(pool_dataset):
+    # There are only four slots, so this will only complete if slots are reused after release.
+    for index in range(12):
+        future = pool_dataset[index]
+        assert future.result(timeout=60)['example_index'] == index
+        future.release()
+
+
+def test_process_pool_dataset_error(pool_dataset):
+    with pytest.raises(IndexError):
+        pool_dataset[-1].result(timeout=60)
+    # The slot should be returned to the pool after an error.
+    for index in range(6):
+        future = pool_dataset[index]
+        future.result(timeout=60)
+        future.release()
+
+
+def test_process_pool_batch_data_loader(pool_dataset):
+    loader = BatchDataLoader(pool_dataset, batch_size=3)
+    example_indices = []
+    for batch in loader:
+        example_indices.extend(batch['example_index'].tolist())
+        assert batch['labels'][0].shape == (3, 1)
+    assert example_indices == list(range(12))
+
+
+def test_process_pool_batch_too_large(pool_dataset):
+    # There are only four slots, so a batch of five examples could never be completed.
+    with pytest.raises(ValueError):
+        BatchDataLoader(pool_dataset, batch_size=5)
+    loader = BatchDataLoader(pool_dataset, batch_sampler=[[0, 1, 2, 3, 4]])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ValueError):
+            executor.submit(next, iter(loader)).result(timeout=60)
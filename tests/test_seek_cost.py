@@ -0,0 +1,121 @@
+from time import sleep
+
+import pytest
+import torch
+
+import tvl
+import tvl.metadata
+from tvl.seek_cost import SeekCostModel
+from tests.conftest import IndexedDummyBackend, IndexedDummyBackendFactory
+
+
+class SlowSeekingBackend(IndexedDummyBackend):
+    """Dummy backend for which seeking is much slower than decoding a frame."""
+
+    def __init__(self, frames, video_filename, device, seek_secs=0.02, frame_secs=0.001):
+        super().__init__(frames, video_filename, device, seek_threshold=None)
+        self.seek_secs = seek_secs
+        self.frame_secs = frame_secs
+        self.n_seeks = 0
+
+    def seek_to_frame(self, frame_index):
+        sleep(self.seek_secs)
+        self.n_seeks += 1
+        super().seek_to_frame(frame_index)
+
+    def read_frame(self):
+        sleep(self.frame_secs)
+        return super().read_frame()
+
+
+@pytest.fixture
+def frames():
+    return [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(100)]
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata():
+    tvl.metadata.clear_metadata()
+    yield
+    tvl.metadata.clear_metadata()
+
+
+def test_seek_cost_model():
+    model = SeekCostModel()
+    assert model.threshold is None
+    model.observe_frame(0.01, kept=False)
+    model.observe_frame(0.02, kept=True)
+    # Seeking took 0.1 seconds longer than reading the kept frame.
+    model.observe_seek(0.12)
+    assert model.threshold == pytest.approx(10)
+    # Frames decoded after landing on a keyframe are not part of the seek cost.
+    model = SeekCostModel(model.as_dict(), alpha=1.0)
+    model.observe_seek(0.15, n_preroll=3)
+    assert model.threshold == pytest.approx(10)
+
+
+def test_seek_cost_model_needs_frame_costs():
+    model = SeekCostModel()
+    model.observe_seek(0.1)
+    assert model.seek_cost is None
+    assert model.threshold is None
+
+
+def test_seek_threshold_adapts(frames, video_filename):
+    backend = SlowSeekingBackend(frames, video_filename, 'cpu')
+    # Warm up with a read which includes some skipped frames.
+    list(backend.select_frames([0, 2, 50, 52]))
+    assert backend.seek_threshold > 3
+    # The gap is now cheaper to decode through than to seek over.
+    backend.n_seeks = 0
+    result = list(backend.select_frames([60, 70]))
+    assert [int(frame[0, 0, 0]) for frame in result] == [60, 70]
+    assert backend.n_seeks == 1
+    assert backend.n_frames_skipped == 2 + 9
+
+
+def test_seek_costs_are_shared(frames, video_filename):
+    backend = SlowSeekingBackend(frames, video_filename, 'cpu')
+    list(backend.select_frames([0, 2, 50, 52]))
+    threshold = backend.seek_threshold
+    assert tvl.metadata.get_metadata(video_filename, 'SlowSeekingBackend')['seek_costs'] \
+        == backend.seek_costs
+    # A new backend for the same file starts from the learned threshold.
+    backend = SlowSeekingBackend(frames, video_filename, 'cpu')
+    assert backend.seek_threshold == threshold
+
+
+def test_seek_costs_saved_once_per_read(frames, video_filename, mocker):
+    backend = SlowSeekingBackend(frames, video_filename, 'cpu', seek_secs=0.001)
+    update_spy = mocker.spy(tvl.metadata, 'update_metadata_by_key')
+    stat_spy = mocker.spy(tvl.metadata.os, 'stat')
+    # Every one of these frames is read in a separate segment.
+    backend.select_frames_stacked([0, 20, 40, 60, 80])
+    assert update_spy.call_count == 1
+    assert stat_spy.call_count == 0
+    assert tvl.metadata.get_metadata(video_filename, 'SlowSeekingBackend')['seek_costs'] \
+        == backend.seek_costs
+
+
+def test_vl_n_frames_skipped(frames, video_filename):
+    tvl.set_backend_factory('cpu', IndexedDummyBackendFactory(frames, video_filename, 'cpu'))
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+    list(vl.select_frames([1, 4]))
+    assert vl.n_frames_skipped == 2
+
+
+def test_vl_n_frames_skipped_pooled(frames, video_filename):
+    tvl.set_backend_factory('cpu', IndexedDummyBackendFactory(frames, video_filename, 'cpu'))
+    pool = tvl.BackendPool()
+    vl = tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool)
+    backend = vl.backend
+    list(vl.select_frames([1, 4]))
+    vl.close()
+    assert vl.n_frames_skipped == 2
+    # The backend is reused, but frames skipped by the first loader are not counted again.
+    vl2 = tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool)
+    assert vl2.backend is backend
+    assert vl2.n_frames_skipped == 0
+    list(vl2.select_frames([10, 13]))
+    assert vl2.n_frames_skipped == backend.n_frames_skipped - 2 > 0
+    assert vl.n_frames_skipped == 2
@@ -0,0 +1,89 @@
+import pytest
+import torch
+
+import tvl
+import tvl.stats
+from tvl.stats import Stats
+from tests.conftest import IndexedDummyBackendFactory
+
+
+@pytest.fixture
+def stats_enabled():
+    tvl.stats.set_stats_enabled(True)
+    tvl.stats.get_process_stats().reset()
+    yield
+    tvl.stats.set_stats_enabled(False)
+
+
+@pytest.fixture
+def indexed_backend_factory(video_filename):
+    frames = [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(10)]
+    factory = IndexedDummyBackendFactory(frames, video_filename, 'cpu')
+    tvl.set_backend_factory('cpu', factory)
+    return factory
+
+
+def test_stats_counters_and_timers():
+    parent = Stats()
+    stats = Stats(parent=parent)
+    stats.count('seeks')
+    stats.count('seeks', 2)
+    stats.add_time('decode', 0.5)
+    stats.add_time('decode', 1.5)
+    with stats.timer('open'):
+        pass
+    assert stats.counters == {'seeks': 3}
+    assert stats.timers['decode'] == {'count': 2, 'total': 2.0, 'max': 1.5}
+    assert stats.timers['open']['count'] == 1
+    assert parent.as_dict() == stats.as_dict()
+    stats.reset()
+    assert stats.as_dict() == {'counters': {}, 'timers': {}}
+
+
+def test_stats_hooks():
+    events = []
+    hook = lambda *event: events.append(event)
+    tvl.stats.add_stats_hook(hook)
+    try:
+        stats = Stats(parent=Stats())
+        stats.count('frames_decoded', 4)
+        stats.add_time('seek', 0.25)
+    finally:
+        tvl.stats.remove_stats_hook(hook)
+    # Hooks are called once per recorded value, by the root of the stats hierarchy.
+    assert events == [('count', 'frames_decoded', 4), ('time', 'seek', 0.25)]
+
+
+def test_stats_disabled(indexed_backend_factory, video_filename):
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+    assert vl.stats is None
+    assert vl.backend.stats is None
+
+
+def test_vl_stats(stats_enabled, indexed_backend_factory, video_filename):
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+    list(vl.select_frames([1, 3]))
+    vl.read_frame()
+    counters = vl.stats.counters
+    assert counters['frames_returned'] == 3
+    # Frame 2 is read and discarded on the way to frame 3.
+    assert counters['frames_skipped'] == 1
+    assert vl.stats.timers['open']['count'] == 1
+    assert tvl.stats.get_process_stats().counters == counters
+
+
+def test_vl_stats_stacked(stats_enabled, indexed_backend_factory, video_filename):
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+    vl.select_frames_stacked([0, 2, 7])
+    counters = vl.stats.counters
+    assert counters['frames_returned'] == 3
+    assert counters['bytes_allocated'] == 3 * 3 * 4 * 4 * 4
+
+
+def test_vl_stats_detached_on_close(stats_enabled, indexed_backend_factory, video_filename):
+    pool = tvl.BackendPool()
+    vl = tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool)
+    backend = vl.backend
+    assert backend.stats is vl.stats
+    vl.close()
+    assert backend.stats is None
@@ -2,12 +2,16 @@ import math
 
 import hypothesis
 import numpy as np
+import pytest
 import torch
 from hypothesis.extra.numpy import arrays, array_shapes
 from hypothesis.strategies import booleans, one_of, just, integers
 from torch.testing import assert_allclose
 
-from tvl.transforms import normalise, denormalise, resize, crop, flip, fit
+from tvl.transforms import normalise, denormalise, resize, crop, crop_batch, flip, fit
+from tvl.transforms import Pipeline, Crop, CentreCrop, RandomCrop, RandomResizedCrop, Resize, \
+    Flip, RandomFlip, Normalise
+from tvl.transforms import _filter_weights, _pad_indices
 
 DENORMALISED_IMAGE = torch.tensor([math.sqrt(3), -math.sqrt(3)]).add_(5).repeat(3, 2, 1)
 MEAN = [5.0, 5.0, 5.0]
@@ -73,6 +77,46 @@ def test_resize_5d():
     assert_allclose(actual, expected)
 
 
+@pytest.mark.parametrize('mode', ['nearest', 'bilinear', 'bicubic', 'area'])
+def test_resize_uint8(mode):
+    inp = torch.randint(0, 256, (2, 4, 3, 36, 64), dtype=torch.uint8)
+    actual = resize(inp, (9, 16), mode=mode)
+    assert actual.dtype == torch.uint8
+    assert actual.shape == (2, 4, 3, 9, 16)
+    expected = resize(inp.float(), (9, 16), mode=mode).round().clamp(0, 255)
+    assert (actual.float() - expected).abs().max() <= 1
+
+
+def test_resize_antialias():
+    inp = torch.rand(2, 3, 90, 160)
+    actual = resize(inp, (12, 20), antialias=True)
+    expected = torch.nn.functional.interpolate(inp, (12, 20), mode='bilinear',
+                                               align_corners=False, antialias=True)
+    assert_allclose(actual, expected)
+
+
+def test_resize_antialias_area():
+    inp = torch.rand(2, 3, 4, 90, 160)
+    actual = resize(inp, (30, 40), mode='area', antialias=True)
+    expected = inp.view(2, 3, 4, 30, 3, 40, 4).mean((-3, -1))
+    assert_allclose(actual, expected)
+
+
+def test_resize_antialias_lanczos():
+    inp = torch.full((3, 90, 160), 100, dtype=torch.uint8)
+    actual = resize(inp, (9, 16), mode='lanczos', antialias=True)
+    assert actual.dtype == torch.uint8
+    assert torch.equal(actual, torch.full((3, 9, 16), 100, dtype=torch.uint8))
+
+
+def test_resize_antialias_reuses_weights():
+    inp = torch.rand(3, 90, 160)
+    resize(inp, (9, 16), antialias=True)
+    misses = _filter_weights.cache_info().misses
+    resize(inp, (9, 16), antialias=True)
+    assert _filter_weights.cache_info().misses == misses
+
+
 def test_crop():
     inp = torch.FloatTensor([[
         [1, 1, 0, 0],
@@ -133,6 +177,61 @@ def test_crop_cuda():
     assert_allclose(actual, expected)
 
 
+@hypothesis.given(
+    data=arrays(np.float32, array_shapes(min_dims=4, max_dims=4, min_side=1, max_side=8)),
+    offsets=arrays(np.int64, (8, 2), elements=integers(min_value=-10, max_value=10)),
+    h=integers(min_value=1, max_value=10),
+    w=integers(min_value=1, max_value=10),
+)
+def test_crop_batch_constant(data, offsets, h, w):
+    inp = torch.from_numpy(data)
+    boxes = [[t, l, h, w] for t, l in offsets[:len(inp)].tolist()]
+    actual = crop_batch(inp, boxes, fill=2)
+    expected = torch.stack([crop(image, *box, fill=2) for image, box in zip(inp, boxes)])
+    assert_allclose(actual, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('padding_mode', ['reflect', 'replicate'])
+def test_crop_batch_padding(padding_mode):
+    inp = torch.arange(2 * 3 * 5 * 6, dtype=torch.float32).view(2, 3, 5, 6)
+    boxes = torch.tensor([[-2, 3, 4, 5], [3, -4, 4, 5]])
+    padded = torch.nn.functional.pad(inp, (4, 4, 4, 4), mode=padding_mode)
+    expected = torch.stack([padded[0, :, 2:6, 7:12], padded[1, :, 7:11, 0:5]])
+    out = torch.empty(2, 3, 4, 5)
+    actual = crop_batch(inp, boxes, padding_mode=padding_mode, out=out)
+    assert actual.data_ptr() == out.data_ptr()
+    assert torch.equal(actual, expected)
+
+
+@pytest.mark.parametrize('padding_mode', ['constant', 'reflect', 'replicate'])
+def test_crop_batch_far_outside(padding_mode):
+    # Includes boxes which are further outside of the image than the image is wide.
+    inp = torch.randint(0, 256, (4, 2, 3, 5, 6), dtype=torch.uint8)
+    boxes = torch.tensor([[-12, 1, 4, 5], [20, -30, 4, 5], [2, 3, 4, 5], [-1, 5, 4, 5]])
+    expected = torch.full((4, 2, 3, 4, 5), 7, dtype=torch.uint8)
+    for i, (t, l, h, w) in enumerate(boxes.tolist()):
+        for y, row in enumerate(_pad_indices(torch.arange(t, t + h), 5, padding_mode).tolist()):
+            for x, col in enumerate(_pad_indices(torch.arange(l, l + w), 6, padding_mode).tolist()):
+                if padding_mode != 'constant' or (0 <= t + y < 5 and 0 <= l + x < 6):
+                    expected[i, ..., y, x] = inp[i, ..., row, col]
+    actual = crop_batch(inp, boxes, padding_mode=padding_mode, fill=7)
+    assert torch.equal(actual, expected)
+
+
+def test_crop_batch_cuda():
+    inp = torch.arange(4 * 3 * 5 * 6, dtype=torch.float32).view(4, 3, 5, 6)
+    boxes = torch.tensor([[0, 1, 4, 5], [-2, 3, 4, 5], [3, -4, 4, 5], [9, 9, 4, 5]])
+    for padding_mode in ['constant', 'reflect', 'replicate']:
+        expected = crop_batch(inp, boxes, padding_mode=padding_mode, fill=2)
+        actual = crop_batch(inp.cuda(), boxes, padding_mode=padding_mode, fill=2)
+        assert torch.equal(actual.cpu(), expected)
+
+
+def test_crop_batch_mixed_sizes():
+    with pytest.raises(ValueError):
+        crop_batch(torch.zeros(2, 3, 4, 4), [[0, 0, 2, 2], [0, 0, 3, 3]])
+
+
 @hypothesis.given(
     data=arrays(np.float32, array_shapes(min_dims=2, max_dims=4)),
     horizontal=booleans(),
@@ -221,3 +320,68 @@ def test_fit_cover():
     ]], dtype=torch.float32)
     actual = fit(inp, (4, 2), fit_mode='cover', resize_mode='bilinear')
     assert_allclose(actual, expected)
+
+
+def _random_clips(b=4, t=3, h=24, w=32):
+    return torch.randint(0, 256, (b, t, 3, h, w), dtype=torch.uint8,
+                         generator=torch.Generator().manual_seed(0))
+
+
+def test_pipeline_fixed():
+    clips = _random_clips()
+    pipeline = Pipeline([Crop(2, 4, 16, 20), Resize((8, 10)), Normalise(MEAN, STDDEV)])
+    actual = pipeline(clips)
+    expected = normalise(resize(crop(clips.float() / 255, 2, 4, 16, 20), (8, 10)), MEAN, STDDEV)
+    assert actual.shape == (4, 3, 3, 8, 10)
+    assert_allclose(actual, expected)
+
+
+def test_pipeline_fixed_view():
+    clips = _random_clips()
+    actual = Pipeline([CentreCrop((16, 16))], dtype=torch.uint8)(clips)
+    assert actual.data_ptr() == clips[..., 4:, 8:].data_ptr()
+    assert torch.equal(actual, clips[..., 4:20, 8:24])
+
+
+@pytest.mark.parametrize('ops', [
+    [RandomCrop((16, 20)), RandomFlip(vertical=True), Normalise(MEAN, STDDEV)],
+    [RandomCrop((16, 20)), Resize((8, 10)), RandomFlip(), Normalise(MEAN, STDDEV)],
+])
+def test_pipeline_random(ops):
+    clips = _random_clips()
+    pipeline = Pipeline(ops)
+    params = pipeline.sample_params(4, (24, 32), generator=torch.Generator().manual_seed(1))
+    actual = pipeline(clips, params)
+    for i, (clip, sample) in enumerate(zip(clips, actual)):
+        t, l = params[0][i].tolist()
+        flip_v, flip_h = params[-1][i].tolist()
+        expected = resize(crop(clip.float() / 255, t, l, 16, 20), sample.shape[-2:])
+        expected = normalise(flip(expected, flip_h, flip_v), MEAN, STDDEV)
+        assert_allclose(sample, expected)
+
+
+def test_pipeline_padding():
+    clips = _random_clips()
+    actual = Pipeline([Crop(-2, -3, 28, 40)], dtype=torch.uint8)(clips)
+    assert actual.dtype == torch.uint8
+    assert torch.equal(actual, crop(clips, -2, -3, 28, 40))
+
+
+def test_pipeline_random_resized_crop():
+    clips = _random_clips()
+    pipeline = Pipeline([RandomResizedCrop((16, 16)), Flip(horizontal=True)])
+    params = pipeline.sample_params(4, (24, 32))
+    t, l, h, w = params[0].unbind(-1)
+    assert bool(((t >= 0) & (l >= 0) & (t + h <= 24) & (l + w <= 32)).all())
+    assert pipeline(clips, params).shape == (4, 3, 3, 16, 16)
+
+
+def test_pipeline_single_image():
+    image = _random_clips()[0, 0]
+    actual = Pipeline([Flip(horizontal=True)])(image)
+    assert_allclose(actual, image.flip(-1).float() / 255)
+
+
+def test_pipeline_normalise_last():
+    with pytest.raises(ValueError):
+        Pipeline([Normalise(MEAN, STDDEV), Resize((8, 8))])
@@ -1,5 +1,7 @@
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import ExitStack
+from pathlib import Path
 from random import uniform
 from time import sleep
 from unittest.mock import call
@@ -8,6 +10,7 @@ import pytest
 import torch
 
 import tvl
+from tests.conftest import IndexedDummyBackend, IndexedDummyBackendFactory
 from tvl.backend import Backend
 
 
@@ -50,6 +53,130 @@ def test_vl_select_frames_mixed(dummy_backend_factory_cpu, mocker):
     assert mocked_seek.mock_calls == [call(1), call(10)]
 
 
+def test_vl_select_frames_keyframes(dummy_backend_factory_cpu, mocker):
+    vl = tvl.VideoLoader('', dummy_backend_factory_cpu.device)
+    mocker.patch.object(type(vl.backend), 'keyframe_indices', new_callable=mocker.PropertyMock,
+                        return_value=[0, 10, 20, 30])
+    vl.backend.frames = [object() for _ in range(20)]
+    mocked_seek = mocker.patch.object(vl.backend, 'seek_to_frame')
+    list(vl.select_frames([1, 8, 12, 19, 35]))
+    # Seeks should only occur when a keyframe lies between the current position and the target.
+    assert mocked_seek.mock_calls == [call(1), call(12), call(35)]
+
+
+def test_vl_concurrent_select_frames(video_filename):
+    frames = [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(50)]
+    tvl.set_backend_factory('cpu', IndexedDummyBackendFactory(frames, video_filename, 'cpu'))
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+
+    def work(start):
+        for i in range(start, 50 - 3, 7):
+            frame_indices = [i, i + 1, i + 3]
+            actual = vl.select_frames_stacked(frame_indices)
+            assert actual[:, 0, 0, 0].tolist() == frame_indices
+            assert [frame[0, 0, 0].item() for frame in vl.select_frames(frame_indices)] == frame_indices
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for job in [executor.submit(work, start) for start in range(32)]:
+            job.result()
+
+
+@pytest.mark.parametrize('length,stride,dilation', [
+    (16, 4, 1),
+    (4, 1, 3),
+    (3, 10, 2),
+    (50, 1, 1),
+])
+def test_vl_sliding_windows(video_filename, length, stride, dilation):
+    frames = [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(50)]
+    tvl.set_backend_factory('cpu', IndexedDummyBackendFactory(frames, video_filename, 'cpu'))
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+    span = (length - 1) * dilation + 1
+    expected = [[start + i * dilation for i in range(length)]
+                for start in range(0, 50 - span + 1, stride)]
+    actual = [window[:, 0, 0, 0].tolist() for window in vl.sliding_windows(length, stride, dilation)]
+    assert actual == expected
+
+
+def test_vl_sliding_windows_decodes_once(video_filename, mocker):
+    frames = [torch.full((3, 4, 4), i, dtype=torch.float32) for i in range(50)]
+    tvl.set_backend_factory('cpu', IndexedDummyBackendFactory(frames, video_filename, 'cpu'))
+    vl = tvl.VideoLoader(video_filename, 'cpu')
+    read_frame = mocker.spy(vl.backend, 'read_frame')
+    seek_to_frame = mocker.spy(vl.backend, 'seek_to_frame')
+    windows = list(window.clone() for window in vl.sliding_windows(16, 4))
+    assert len(windows) == 9
+    assert read_frame.call_count == 48
+    seek_to_frame.assert_called_once_with(0)
+
+
+def test_vl_sliding_windows_too_long(dummy_backend_factory_cpu):
+    vl = tvl.VideoLoader('', dummy_backend_factory_cpu.device)
+    assert list(vl.sliding_windows(len(dummy_backend_factory_cpu.frames) + 1)) == []
+
+
+def test_vl_select_frames_roi(dummy_backend_factory_cpu, mocker):
+    vl = tvl.VideoLoader('', dummy_backend_factory_cpu.device)
+    select_frames = mocker.patch.object(vl.backend, 'select_frames')
+    select_frames_stacked = mocker.patch.object(vl.backend, 'select_frames_stacked')
+    vl.select_frames([7, 2], roi=(1, 2, 2, 2))
+    select_frames.assert_called_once_with([7, 2], roi=(1, 2, 2, 2))
+    vl.select_frames_stacked([7, 2], roi=(1, 2, 2, 2))
+    select_frames_stacked.assert_called_once_with([7, 2], None, roi=(1, 2, 2, 2))
+
+
+class PostprocessingDummyBackend(IndexedDummyBackend):
+    """Dummy backend which postprocesses frames like a real backend."""
+
+    def read_frame(self):
+        return self._postprocess_frame(super().read_frame())
+
+
+class RawDummyBackend(PostprocessingDummyBackend):
+    """Dummy backend which can read frames without postprocessing them."""
+
+    def _read_raw_frame(self):
+        return IndexedDummyBackend.read_frame(self)
+
+
+@pytest.mark.parametrize('backend_type', [PostprocessingDummyBackend, RawDummyBackend])
+def test_backend_roi(video_filename, backend_type):
+    frames = [torch.arange(48, dtype=torch.float32).view(3, 4, 4) + i for i in range(50)]
+    backend = backend_type(frames, video_filename, 'cpu')
+    backend.roi = (0, 1, 3, 2)
+    assert backend.frame_shape == (3, 3, 2)
+    assert torch.equal(backend.select_frame(5), frames[5][:, 0:3, 1:3])
+    assert torch.equal(backend.select_frames_stacked([5, 6])[1], frames[6][:, 0:3, 1:3])
+    # A region of interest given to a call overrides the backend's region of interest.
+    assert torch.equal(next(backend.select_frames([5], roi=(1, 2, 2, 2))), frames[5][:, 1:3, 2:4])
+    assert torch.equal(backend.select_frames_stacked([6], roi=(1, 2, 2, 2))[0],
+                       frames[6][:, 1:3, 2:4])
+    assert backend.roi == (0, 1, 3, 2)
+    with pytest.raises(ValueError):
+        backend.select_frames_stacked([5], roi=(2, 2, 3, 3))
+    with pytest.raises(ValueError):
+        backend._check_roi((0, 0, 0, 4))
+    # yuv420p frames cannot be cropped in postprocessing, which should be caught up front.
+    backend.pixel_format = 'yuv420p'
+    with pytest.raises(ValueError):
+        backend._check_roi((0, 0, 2, 2))
+    with pytest.raises(ValueError):
+        backend.select_frames_stacked([5], roi=(0, 0, 2, 2))
+
+
+@pytest.mark.parametrize('out_size,roi', [
+    ((161, 91), None),
+    ((161, 0), None),
+    ((0, 0), (0, 0, 90, 161)),
+])
+def test_backend_yuv420p_odd_out_size(video_filename, out_size, roi, mocker):
+    mocker.patch.object(Backend, '__abstractmethods__', new_callable=set)
+    mocker.patch.object(Backend, 'crops_natively', True)
+    with pytest.raises(ValueError, match='even width and height'):
+        Backend(video_filename, 'cpu', torch.uint8, 3, *out_size, pixel_format='yuv420p', roi=roi)
+    Backend(video_filename, 'cpu', torch.uint8, 3, *out_size)
+
+
 @pytest.mark.parametrize('device,expected', [
     ('cuda:0', 'cuda:0'),
     ('cuda:1', 'cuda:1'),
@@ -66,7 +193,8 @@ def test_video_loader_pool(video_filename):
         'cuda:0': 2,
         'cpu': 10,
     })
-    expected = ['cuda:0', 'cuda:0', 'cpu', 'cpu', 'cpu']
+    # Devices are chosen by the fraction of their slots in use.
+    expected = ['cpu', 'cpu', 'cpu', 'cpu', 'cuda:0']
 
     with vlp.loader(video_filename) as vl:
         assert str(vl.backend.device) == expected[0]
@@ -93,3 +221,108 @@ def test_video_loader_pool_threaded(video_filename):
         actual = [job.result() for job in jobs]
         assert actual.count('cuda:0') == 3
         assert actual.count('cpu') == 6
+
+
+def test_video_loader_pool_least_loaded(video_filename):
+    vlp = tvl.VideoLoaderPool({'cpu:0': 1, 'cpu:1': 3})
+    with ExitStack() as stack:
+        vls = [stack.enter_context(vlp.loader(video_filename)) for _ in range(4)]
+        assert [str(vl.device) for vl in vls] == ['cpu:1', 'cpu:1', 'cpu:0', 'cpu:1']
+    assert vlp.slots == {'cpu:0': 1, 'cpu:1': 3}
+
+
+def test_video_loader_pool_measured_hold_times(video_filename):
+    vlp = tvl.VideoLoaderPool({'cpu:0': 2, 'cpu:1': 2})
+    vlp.hold_times = {'cpu:0': 1.0, 'cpu:1': 0.1}
+    with ExitStack() as stack:
+        vls = [stack.enter_context(vlp.loader(video_filename)) for _ in range(4)]
+        assert [str(vl.device) for vl in vls] == ['cpu:1', 'cpu:1', 'cpu:0', 'cpu:0']
+
+
+def test_video_loader_pool_prefers_open_file(video_filename, dummy_backend_factory_cpu, mocker):
+    other_filename = str(Path(video_filename).with_name('diving-h264.mkv'))
+    vlp = tvl.VideoLoaderPool({'cpu:0': 1, 'cpu:1': 1})
+    create_spy = mocker.spy(dummy_backend_factory_cpu, 'create')
+    with vlp.loader(other_filename) as vl0, vlp.loader(video_filename) as vl1:
+        assert str(vl0.device) == 'cpu:0'
+        assert str(vl1.device) == 'cpu:1'
+        backend = vl1.backend
+    # Make cpu:0 look faster, so that it would be chosen if not for the open file.
+    vlp.hold_times = {'cpu:0': 0.1, 'cpu:1': 1.0}
+    with vlp.loader(video_filename) as vl:
+        assert str(vl.device) == 'cpu:1'
+        assert vl.backend is backend
+    assert create_spy.call_count == 2
+
+
+def test_video_loader_pool_acquire(video_filename):
+    vlp = tvl.VideoLoaderPool({'cpu': 1})
+    order = []
+
+    async def use(name):
+        vl = await vlp.acquire(video_filename)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        vlp.release(vl)
+
+    async def main():
+        await asyncio.gather(use('a'), use('b'), use('c'))
+
+    asyncio.run(main())
+    assert sorted(order) == ['a', 'b', 'c']
+    assert vlp.slots == {'cpu': 1}
+
+
+def test_video_loader_pool_acquire_cancelled(video_filename, mocker):
+    vlp = tvl.VideoLoaderPool({'cpu': 1})
+    create_loader = vlp._create_loader
+
+    def slow_create_loader(*args):
+        sleep(0.05)
+        return create_loader(*args)
+
+    mocker.patch.object(vlp, '_create_loader', side_effect=slow_create_loader)
+
+    async def main():
+        task = asyncio.ensure_future(vlp.acquire(video_filename))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Once the loader has been created, it should be returned to the pool.
+        await asyncio.sleep(0.1)
+        assert vlp.slots == {'cpu': 1}
+        assert not vlp._checked_out
+        vl = await asyncio.wait_for(vlp.acquire(video_filename), 10)
+        vlp.release(vl)
+
+    asyncio.run(main())
+
+
+def test_backend_pool_reuses_backends(video_filename, dummy_backend_factory_cpu, mocker):
+    pool = tvl.BackendPool()
+    create_spy = mocker.spy(dummy_backend_factory_cpu, 'create')
+    with tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool) as vl:
+        backend = vl.backend
+    assert len(pool) == 1
+    seek_spy = mocker.spy(backend, 'seek')
+    with tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool) as vl:
+        assert vl.backend is backend
+        # While the backend is checked out, it should not be available to others.
+        with tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool) as vl2:
+            assert vl2.backend is not backend
+    assert create_spy.call_count == 2
+    # Reused backends should be rewound to the start of the video.
+    seek_spy.assert_called_once_with(0)
+    assert len(pool) == 2
+
+
+def test_backend_pool_max_idle(video_filename):
+    pool = tvl.BackendPool(max_idle=1)
+    vls = [tvl.VideoLoader(video_filename, 'cpu', backend_pool=pool) for _ in range(3)]
+    backends = [vl.backend for vl in vls]
+    for vl in vls:
+        vl.close()
+    assert len(pool) == 1
+    # The most recently returned backend should be kept.
+    assert pool.checkout(video_filename, 'cpu') is backends[-1]
@@ -1,7 +1,12 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import PIL.Image
 import pytest
 import torch
 
+from tvl.pixel_format import convert_rgb_planar
+from tvl.stats import Stats
 from tvl.testing import assert_same_image
 
 
@@ -40,6 +45,12 @@ def test_resizing_read_frame(resizing_backend, first_frame_image):
     assert_same_image(rgb, first_frame_image.resize((160, 90), PIL.Image.NEAREST), allow_mismatch=0.01)
 
 
+def test_resizing_during_decode(resizing_backend):
+    # Frames should be scaled by the decoder, rather than resized after decoding.
+    rgb = resizing_backend._read_raw_frame()
+    assert rgb.shape == (3, 90, 160)
+
+
 def test_out_size_attributes(backend, resizing_backend):
     assert backend.out_width == 1280
     assert backend.out_height == 720
@@ -81,11 +92,127 @@ def test_select_frames_without_first(backend, mid_frame_image):
     assert_same_image(frames[0], mid_frame_image)
 
 
+def test_stats(backend):
+    backend.stats = Stats()
+    frames = list(backend.select_frames([25, 27, 29]))
+    counters = backend.stats.counters
+    timers = backend.stats.timers
+    assert counters['seeks'] >= 1
+    assert counters['frames_decoded'] >= len(frames)
+    assert counters['bytes_allocated'] > 0
+    assert timers['decode']['total'] > 0
+
+
+def test_read_frames_into(backend, first_frame_image):
+    frames = backend.read_frames_into(3)
+    assert frames.shape == (3, 3, 720, 1280)
+    assert frames.dtype == backend.dtype
+    assert_same_image(frames[0], first_frame_image)
+
+
+def test_resizing_read_frames_into(resizing_backend):
+    frames = resizing_backend.read_frames_into(3)
+    assert frames.shape == (3, 3, 90, 160)
+    resizing_backend.seek_to_frame(0)
+    expected = torch.stack(resizing_backend.read_frames(3))
+    assert torch.equal(frames.cpu(), expected.cpu())
+
+
+def test_select_frames_stacked(backend, first_frame_image, mid_frame_image):
+    out = torch.empty((2, 3, 720, 1280), dtype=backend.dtype, device=backend.device)
+    frames = backend.select_frames_stacked([25, 0], out=out)
+    assert frames.data_ptr() == out.data_ptr()
+    assert_same_image(frames[0], first_frame_image)
+    assert_same_image(frames[1], mid_frame_image)
+
+
+def test_select_frames_stacked_bad_out(backend):
+    out = torch.empty((1, 3, 720, 1280), dtype=backend.dtype, device=backend.device)
+    with pytest.raises(ValueError):
+        backend.select_frames_stacked([0, 25], out=out)
+
+
+def test_sliding_windows(backend, first_frame_image, mid_frame_image):
+    windows = [window.clone() for window in backend.sliding_windows(5, stride=20, dilation=5)]
+    assert [len(window) for window in windows] == [5, 5]
+    assert_same_image(windows[0][0], first_frame_image)
+    assert_same_image(windows[1][1], mid_frame_image)
+
+
 def test_select_frame(backend, mid_frame_image):
     frame = backend.select_frame(25)
     assert_same_image(frame, mid_frame_image)
 
 
+@pytest.mark.parametrize('pixel_format,frame_shape', [
+    ('rgb_hwc', (720, 1280, 3)),
+    ('yuv420p', (1080, 1280)),
+    ('gray', (1, 720, 1280)),
+])
+def test_pixel_format(backend_factory_and_device, dtype, video_filename, pixel_format,
+                      frame_shape):
+    backend_factory, device = backend_factory_and_device
+    backend = backend_factory.create(video_filename, device, dtype,
+                                     backend_opts=dict(pixel_format=pixel_format))
+    rgb_backend = backend_factory.create(video_filename, device, dtype)
+    assert backend.frame_shape == frame_shape
+    frame = backend.read_frame()
+    assert frame.shape == frame_shape
+    assert frame.dtype == dtype
+    expected = convert_rgb_planar(rgb_backend.read_frame(), pixel_format)
+    scale = 255 if dtype.is_floating_point else 1
+    assert (frame.float() - expected.float()).abs().mean() * scale < 2
+    frames = backend.select_frames_stacked([0, 25])
+    assert frames.shape == (2, *frame_shape)
+    assert torch.equal(frames[0], frame)
+
+
+def test_yuv420p_odd_out_size(backend_factory_and_device, dtype, video_filename):
+    backend_factory, device = backend_factory_and_device
+    with pytest.raises(ValueError, match='even width and height'):
+        opts = dict(out_width=161, out_height=91, pixel_format='yuv420p')
+        backend_factory.create(video_filename, device, dtype, backend_opts=opts)
+
+
+@pytest.mark.parametrize('pixel_format', ['rgb_planar', 'rgb_hwc', 'gray'])
+def test_roi(backend_factory_and_device, dtype, video_filename, pixel_format):
+    backend_factory, device = backend_factory_and_device
+    roi = (100, 200, 360, 640)
+    backend = backend_factory.create(video_filename, device, dtype,
+                                     backend_opts=dict(pixel_format=pixel_format, roi=roi))
+    full_backend = backend_factory.create(video_filename, device, dtype,
+                                          backend_opts=dict(pixel_format=pixel_format))
+    expected = full_backend.select_frames_stacked([0, 25])
+    if pixel_format == 'rgb_hwc':
+        expected = expected[:, 100:460, 200:840]
+    else:
+        expected = expected[:, :, 100:460, 200:840]
+    frames = backend.select_frames_stacked([0, 25])
+    assert frames.shape == expected.shape
+    scale = 255 if dtype.is_floating_point else 1
+    assert (frames.float() - expected.float()).abs().mean() * scale < 1
+    # A region of interest given to a call overrides the backend's region of interest.
+    frame = next(full_backend.select_frames([25], roi=roi))
+    assert torch.equal(frame, frames[1])
+
+
+@pytest.mark.parametrize('opts', [
+    dict(out_width=161, out_height=91),
+    dict(roi=(101, 201, 361, 641)),
+])
+def test_gray_odd_size(backend_factory_and_device, dtype, video_filename, opts):
+    backend_factory, device = backend_factory_and_device
+    backend = backend_factory.create(video_filename, device, dtype,
+                                     backend_opts=dict(pixel_format='gray', **opts))
+    rgb_backend = backend_factory.create(video_filename, device, dtype, backend_opts=opts)
+    frame = backend.read_frame()
+    expected = convert_rgb_planar(rgb_backend.read_frame(), 'gray')
+    assert frame.shape == expected.shape
+    assert frame.shape[1] % 2 == 1 and frame.shape[2] % 2 == 1
+    scale = 255 if dtype.is_floating_point else 1
+    assert (frame.float() - expected.float()).abs().mean() * scale < 2
+
+
 def test_swimming_video(backend_factory_and_device, swimming_video_filename, swimming_mid_image):
     backend_factory, device = backend_factory_and_device
     backend = backend_factory.create(swimming_video_filename, device, torch.float32)
@@ -99,3 +226,26 @@ def test_swimming_video_resized(backend_factory_and_device, swimming_video_filen
                                      backend_opts=dict(out_width=1280, out_height=720))
     frame = backend.select_frame(9)
     assert_same_image(frame, swimming_mid_image.resize((1280, 720)), allow_mismatch=0.001)
+
+
+def test_concurrent_select_frames(resizing_backend):
+    expected = resizing_backend.select_frames_stacked(range(50))
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(5):
+            frame_indices = sorted(rng.sample(range(50), 4))
+            if rng.random() < 0.5:
+                actual = resizing_backend.select_frames_stacked(frame_indices)
+            else:
+                actual = torch.stack(list(resizing_backend.select_frames(frame_indices)))
+            assert torch.equal(actual, expected[frame_indices])
+            # Sequential reads from other threads must not disrupt selected frames.
+            try:
+                resizing_backend.read_frame()
+            except EOFError:
+                pass
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for job in [executor.submit(work, seed) for seed in range(16)]:
+            job.result()
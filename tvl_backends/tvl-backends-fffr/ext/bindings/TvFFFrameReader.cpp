@@ -4,6 +4,22 @@
 #include <cstring>
 #include <memory>
 #include <stdexcept>
+
+using Clock = std::chrono::steady_clock;
+
+// Line sizes of allocated frames are padded to this many bytes.
+static constexpr int FRAME_ALIGNMENT = 32;
+
+static int align_line_size(const int line_size)
+{
+    return (line_size + FRAME_ALIGNMENT - 1) / FRAME_ALIGNMENT * FRAME_ALIGNMENT;
+}
+
+static double seconds_since(const Clock::time_point& start)
+{
+    return std::chrono::duration<double>(Clock::now() - start).count();
+}
+
 std::map<int, std::shared_ptr<std::remove_pointer<CUcontext>::type>> TvFFFrameReader::_contexts;
 
 bool TvFFFrameReader::init_context(const int gpu_index)
@@ -110,7 +126,10 @@ int64_t TvFFFrameReader::get_number_of_frames() const
 void TvFFFrameReader::seek(const float time_secs)
 {
     const auto time = static_cast<int64_t>(time_secs * 1000000.0f);
+    const auto start = Clock::now();
     const bool ret = _stream->seek(time);
+    _stats.seek_secs += seconds_since(start);
+    ++_stats.n_seeks;
     if (!ret) {
         throw std::runtime_error("Seek failed.");
     }
@@ -118,32 +137,111 @@ void TvFFFrameReader::seek(const float time_secs)
 
 void TvFFFrameReader::seek_frame(int frame_index)
 {
+    const auto start = Clock::now();
     const bool ret = _stream->seekFrame(static_cast<int64_t>(frame_index));
+    _stats.seek_secs += seconds_since(start);
+    ++_stats.n_seeks;
     if (!ret) {
         throw std::runtime_error("Seek failed.");
     }
 }
 
+void TvFFFrameReader::set_roi(const int top, const int left, const int height, const int width)
+{
+    if (top < 0 || left < 0 || height < 0 || width < 0) {
+        throw std::runtime_error("Invalid region of interest.");
+    }
+    if (height > 0 && (top + height > _stream->getHeight() || left + width > _stream->getWidth())) {
+        throw std::runtime_error("Region of interest lies outside of the frame.");
+    }
+    _roi[0] = top;
+    _roi[1] = left;
+    _roi[2] = height;
+    _roi[3] = width;
+}
+
+void TvFFFrameReader::crop_plane(
+    const uint8_t* src, const int src_line_size, uint8_t* dst, const int dst_line_size, const bool device) const
+{
+    // Bytes per pixel in a single plane of the output pixel format.
+    const int sample_size = Ffr::getImageLineStep(_pixel_format, 1, 0);
+    const size_t row_bytes = static_cast<size_t>(_roi[3]) * sample_size;
+    src += static_cast<size_t>(_roi[0]) * src_line_size + static_cast<size_t>(_roi[1]) * sample_size;
+    if (device) {
+        CUDA_MEMCPY2D copy = {};
+        copy.srcMemoryType = CU_MEMORYTYPE_DEVICE;
+        copy.srcDevice = reinterpret_cast<CUdeviceptr>(src);
+        copy.srcPitch = static_cast<size_t>(src_line_size);
+        copy.dstMemoryType = CU_MEMORYTYPE_DEVICE;
+        copy.dstDevice = reinterpret_cast<CUdeviceptr>(dst);
+        copy.dstPitch = static_cast<size_t>(dst_line_size);
+        copy.WidthInBytes = row_bytes;
+        copy.Height = static_cast<size_t>(_roi[2]);
+        if (cuMemcpy2D(&copy) != CUDA_SUCCESS) {
+            throw std::runtime_error("Copying the region of interest failed.");
+        }
+    } else {
+        for (int32_t y = 0; y < _roi[2]; y++) {
+            std::memcpy(dst + static_cast<size_t>(y) * dst_line_size, src + static_cast<size_t>(y) * src_line_size,
+                row_bytes);
+        }
+    }
+}
+
 uint8_t* TvFFFrameReader::convert_frame(const std::shared_ptr<Ffr::Frame>& frame, const bool async)
 {
     // Check if known pixel format
     if (frame->getPixelFormat() == Ffr::PixelFormat::Auto) {
         throw std::runtime_error("Unknown pixel format.");
     }
+    const auto start = Clock::now();
 
     // Get frame dimensions
-    const int width = frame->getWidth();
-    const int height = frame->getHeight();
+    const bool crop = _roi[2] > 0;
+    if (crop && (_roi[0] + _roi[2] > frame->getHeight() || _roi[1] + _roi[3] > frame->getWidth())) {
+        throw std::runtime_error("Region of interest lies outside of the frame.");
+    }
+    const int width = crop ? _roi[3] : frame->getWidth();
+    const int height = crop ? _roi[2] : frame->getHeight();
     const int lineSize = Ffr::getImageLineStep(_pixel_format, width, 0);
 
     // Allocate new memory to store frame data
-    const auto newData = reinterpret_cast<uint8_t*>(_image_allocator->allocate_frame(width, height, lineSize, 32));
+    const auto newData =
+        reinterpret_cast<uint8_t*>(_image_allocator->allocate_frame(width, height, lineSize, FRAME_ALIGNMENT));
     if (newData == nullptr) {
         throw std::runtime_error("Memory allocation for frame image failed.");
     }
 
     // Copy/Convert image data into output
-    if (frame->getDataType() == Ffr::DecodeType::Cuda) {
+    if (frame->getDataType() == Ffr::DecodeType::Cuda && crop) {
+        // The GPU conversion only writes whole frames, so convert into a temporary frame and
+        // copy the region of interest out of it on the device.
+        const int fullWidth = frame->getWidth();
+        const int fullHeight = frame->getHeight();
+        const int fullLineSize = Ffr::getImageLineStep(_pixel_format, fullWidth, 0);
+        const auto fullData = reinterpret_cast<uint8_t*>(
+            _image_allocator->allocate_frame(fullWidth, fullHeight, fullLineSize, FRAME_ALIGNMENT));
+        if (fullData == nullptr) {
+            _image_allocator->free_frame(newData);
+            throw std::runtime_error("Memory allocation for frame image failed.");
+        }
+        try {
+            if (!Ffr::convertFormat(frame, fullData, _pixel_format)) {
+                throw std::runtime_error("Pixel format conversion failed.");
+            }
+            const int fullStep = align_line_size(fullLineSize);
+            const int step = align_line_size(lineSize);
+            for (int32_t i = 0; i < 3; i++) {
+                crop_plane(fullData + static_cast<size_t>(i) * fullStep * fullHeight, fullStep,
+                    newData + static_cast<size_t>(i) * step * height, step, true);
+            }
+        } catch (...) {
+            _image_allocator->free_frame(fullData);
+            _image_allocator->free_frame(newData);
+            throw;
+        }
+        _image_allocator->free_frame(fullData);
+    } else if (frame->getDataType() == Ffr::DecodeType::Cuda) {
         bool err;
         if (async) {
             err = Ffr::convertFormatAsync(frame, newData, _pixel_format);
@@ -154,6 +252,14 @@ uint8_t* TvFFFrameReader::convert_frame(const std::shared_ptr<Ffr::Frame>& frame
             _image_allocator->free_frame(newData);
             throw std::runtime_error("Pixel format conversion failed.");
         }
+    } else if (crop) {
+        // Only copy the rows and columns of each plane which lie inside the region of interest.
+        const int step = align_line_size(lineSize);
+        for (int32_t i = 0; i < 3; i++) {
+            const auto planeData = frame->getFrameData(i);
+            crop_plane(planeData.first, planeData.second, newData + static_cast<size_t>(i) * step * height, step,
+                false);
+        }
     } else {
         auto plane = newData;
         for (int32_t i = 0; i < 3; i++) {
@@ -163,6 +269,9 @@ uint8_t* TvFFFrameReader::convert_frame(const std::shared_ptr<Ffr::Frame>& frame
             plane += size;
         }
     }
+    // Asynchronous conversions are only launched here, and finish in synchroniseConvert.
+    _stats.convert_secs += seconds_since(start);
+    ++_stats.n_frames_converted;
 
     return newData;
 }
@@ -170,7 +279,9 @@ uint8_t* TvFFFrameReader::convert_frame(const std::shared_ptr<Ffr::Frame>& frame
 uint8_t* TvFFFrameReader::read_frame()
 {
     // Get next frame
+    const auto start = Clock::now();
     const auto frame = _stream->getNextFrame();
+    _stats.decode_secs += seconds_since(start);
     if (frame == nullptr) {
         if (_stream->isEndOfFile()) {
             // This is an EOF error
@@ -178,6 +289,7 @@ uint8_t* TvFFFrameReader::read_frame()
         }
         throw std::runtime_error("Failed to get the next frame.");
     }
+    ++_stats.n_frames_decoded;
     return convert_frame(frame, false);
 }
 
@@ -189,7 +301,10 @@ int64_t TvFFFrameReader::read_frames_by_index(int64_t* indices, const int n_fram
         const auto last = pos + static_cast<int32_t>(_stream->getMaxFrames());
         const auto end = &indices[std::min(last, n_frames)];
         const std::vector<int64_t> frame_sequence(start, end);
+        const auto decode_start = Clock::now();
         const auto frames_vector = _stream->getFramesByIndex(frame_sequence);
+        _stats.decode_secs += seconds_since(decode_start);
+        _stats.n_frames_decoded += static_cast<int64_t>(frames_vector.size());
         // Convert the pixel format of the decoded frames.
         for (auto& i : frames_vector) {
             *(frames++) = convert_frame(i, true);
@@ -216,3 +331,13 @@ int64_t TvFFFrameReader::read_frames_by_index(int64_t* indices, const int n_fram
     }
     return pos;
 }
+
+TvFFFrameReaderStats TvFFFrameReader::get_stats() const
+{
+    return _stats;
+}
+
+void TvFFFrameReader::reset_stats()
+{
+    _stats = TvFFFrameReaderStats();
+}
@@ -3,11 +3,23 @@
 #include "FFFrameReader.h"
 #include "ImageAllocator.h"
 
+#include <chrono>
 #include <cuda.h>
 #include <map>
 #include <memory>
 #include <string>
 
+// Counters and timers for the work done by a TvFFFrameReader. Times are in seconds.
+struct TvFFFrameReaderStats
+{
+    int64_t n_seeks = 0;
+    int64_t n_frames_decoded = 0;
+    int64_t n_frames_converted = 0;
+    double seek_secs = 0.0;
+    double decode_secs = 0.0;
+    double convert_secs = 0.0;
+};
+
 class TvFFFrameReader
 {
 public:
@@ -23,18 +35,26 @@ public:
     int64_t get_number_of_frames() const;
     void seek(float time_secs);
     void seek_frame(int frame_index);
+    void set_roi(int top, int left, int height, int width);
 
     uint8_t* read_frame();
     int64_t read_frames_by_index(int64_t* indices, int n_frames, uint8_t** frames);
 
+    TvFFFrameReaderStats get_stats() const;
+    void reset_stats();
+
 private:
     static std::map<int, std::shared_ptr<std::remove_pointer<CUcontext>::type>> _contexts;
     std::shared_ptr<Ffr::Stream> _stream = nullptr;
     ImageAllocator* _image_allocator = nullptr;
     std::string _filename;
     Ffr::PixelFormat _pixel_format;
+    TvFFFrameReaderStats _stats;
+    // Region of interest (top, left, height, width) to crop frames to. A zero height means none.
+    int _roi[4] = {0, 0, 0, 0};
 
     static bool init_context(int gpu_index);
     
     uint8_t* convert_frame(const std::shared_ptr<Ffr::Frame>& frame, bool async);
+    void crop_plane(const uint8_t* src, int src_line_size, uint8_t* dst, int dst_line_size, bool device) const;
 };
@@ -1,4 +1,6 @@
-%module(directors="1") pyfffr
+// Release the GIL while decoding, so that other Python threads can run in the meantime.
+// Director callbacks (eg. ImageAllocator) reacquire the GIL before calling into Python.
+%module(directors="1", threads="1") pyfffr
 
 %{
 #include "TvFFFrameReader.h"
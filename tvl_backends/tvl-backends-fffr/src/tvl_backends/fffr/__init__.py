@@ -1,19 +1,58 @@
-from threading import RLock
-
 import numpy as np
 import pyfffr
 import torch
 
+import tvl.stats
 from tvl.backend import Backend, BackendFactory
-from tvl_backends.fffr.memory import TorchImageAllocator
+from tvl.pixel_format import convert_rgb_planar
+from tvl.transforms import resize
+from tvl_backends.fffr.memory import DEFAULT_MAX_POOLED_BYTES, TorchImageAllocator
+
+
+class _NativeStatsRecorder:
+    """Adds the work done by FFFR's native code within a block to a backend's stats."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.n_allocated_bytes = 0
+
+    def __enter__(self):
+        self.backend.frame_reader.reset_stats()
+        self.n_allocated_bytes = self.backend.image_allocator.n_allocated_bytes
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        stats = self.backend.stats
+        native = self.backend.frame_reader.get_stats()
+        if native.n_seeks > 0:
+            stats.count('seeks', native.n_seeks)
+            stats.add_time('seek', native.seek_secs)
+        if native.n_frames_decoded > 0:
+            stats.count('frames_decoded', native.n_frames_decoded)
+        if native.decode_secs > 0:
+            stats.add_time('decode', native.decode_secs)
+        if native.n_frames_converted > 0:
+            stats.add_time('convert', native.convert_secs)
+        n_allocated_bytes = self.backend.image_allocator.n_allocated_bytes - self.n_allocated_bytes
+        if n_allocated_bytes > 0:
+            stats.count('bytes_allocated', n_allocated_bytes)
 
 
 class FffrBackend(Backend):
     def __init__(self, filename, device, dtype, *, seek_threshold=0, out_width=0, out_height=0,
-                 buffer_length=8):
-        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height)
+                 pixel_format='rgb_planar', buffer_length=8, roi=None,
+                 max_pooled_bytes=DEFAULT_MAX_POOLED_BYTES):
+        """Create an FFFR backend.
+
+        Args:
+            buffer_length (int): Number of decoded frames buffered by the native frame reader.
+            max_pooled_bytes (int): Maximum amount of memory retained for reuse by later frames
+                after frames are released, in bytes. Set this to 0 to disable the pool.
 
-        self.lock = RLock()
+        See `Backend` for the other arguments.
+        """
+        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height,
+                         pixel_format, roi)
 
         allocator_dtype = self.dtype
         # The FFFR backend does not currently support direct conversion to float32 for software
@@ -21,8 +60,13 @@ class FffrBackend(Backend):
         if self.device.type == 'cpu' and self.dtype != torch.uint8:
             allocator_dtype = torch.uint8
 
-        image_allocator = TorchImageAllocator(self.device, allocator_dtype)
+        image_allocator = TorchImageAllocator(self.device, allocator_dtype, max_pooled_bytes)
         device_index = self.device.index if self.device.type == 'cuda' else -1
+        # A region of interest is cropped at the source resolution and then resized, so the
+        # decoder must not scale whole frames.
+        self._native_scaling = self.roi is None
+        if not self._native_scaling:
+            out_width, out_height = 0, 0
         frame_reader = pyfffr.TvFFFrameReader(image_allocator, self.filename, device_index,
                                               out_width, out_height, self.seek_threshold,
                                               buffer_length)
@@ -33,6 +77,16 @@ class FffrBackend(Backend):
         self.image_allocator = image_allocator
         self.frame_reader = frame_reader
         self._at_eof = False
+        self._native_roi = (0, 0, 0, 0)
+
+    # Frames are cropped to the region of interest by the native frame reader.
+    crops_natively = True
+
+    def _native_stats(self):
+        """Get a context manager which records the stats of native calls made inside it."""
+        if self.stats is None:
+            return tvl.stats.NULL_TIMER
+        return _NativeStatsRecorder(self)
 
     @property
     def duration(self):
@@ -55,57 +109,130 @@ class FffrBackend(Backend):
         return self.frame_reader.get_height()
 
     def seek(self, time_secs):
-        try:
-            with self.lock:
+        with self.lock, self._native_stats():
+            try:
                 self.frame_reader.seek(time_secs)
-            self._at_eof = False
-        except RuntimeError:
-            if time_secs < self.duration - (1.0 / self.frame_rate + 1e-9):
-                raise
-            self._at_eof = True
+                self._at_eof = False
+            except RuntimeError:
+                if time_secs < self.duration - (1.0 / self.frame_rate + 1e-9):
+                    raise
+                self._at_eof = True
 
     def seek_to_frame(self, frame_index):
-        try:
-            with self.lock:
+        with self.lock, self._native_stats():
+            try:
                 self.frame_reader.seek_frame(frame_index)
-            self._at_eof = False
-        except RuntimeError:
-            if frame_index < self.n_frames:
-                raise
-            self._at_eof = True
-
-    def _convert_frame(self, ptr):
+                self._at_eof = False
+            except RuntimeError:
+                if frame_index < self.n_frames:
+                    raise
+                self._at_eof = True
+
+    def _apply_roi(self):
+        """Tell the native frame reader which region of interest to crop frames to."""
+        roi = (0, 0, 0, 0)
+        if self.roi is not None:
+            if self._native_scaling:
+                height = self._out_height or self.height
+                width = self._out_width or self.width
+            else:
+                height, width = self.height, self.width
+            roi = self._roi_region(height, width)
+        if roi != self._native_roi:
+            self.frame_reader.set_roi(*roi)
+            self._native_roi = roi
+
+    def _get_raw_frame(self, ptr):
         ptr = int(ptr)
         rgb_tensor = self.image_allocator.get_frame_tensor(ptr)
         self.image_allocator.free_frame(ptr)  # Release reference held by the memory manager.
-        return self._postprocess_frame(rgb_tensor)
+        if self.pixel_format != 'rgb_planar':
+            if not self._native_scaling and (self._out_width > 0 or self._out_height > 0):
+                # Other pixel formats can't be resized in postprocessing, so resize the cropped
+                # region before converting it.
+                with self._timer('postprocess'):
+                    resized = resize(rgb_tensor, (self.out_height, self.out_width))
+                if resized.data_ptr() != rgb_tensor.data_ptr():
+                    self.image_allocator.recycle_frame(rgb_tensor)
+                    rgb_tensor = resized
+            # FFFR always decodes to planar RGB, so other pixel formats are converted from that.
+            with self._timer('convert'):
+                frame = convert_rgb_planar(rgb_tensor, self.pixel_format)
+            self.image_allocator.recycle_frame(rgb_tensor)
+            return frame
+        return rgb_tensor
+
+    def _postprocess_and_recycle(self, raw_frame):
+        rgb = self._postprocess_frame(raw_frame)
+        if rgb.data_ptr() != raw_frame.data_ptr():
+            # The raw frame was only needed as an intermediate, so its memory can be reused.
+            self.image_allocator.recycle_frame(raw_frame)
+        return rgb
 
     def read_frame(self):
-        if self._at_eof:
-            raise EOFError()
+        return self._postprocess_and_recycle(self._read_raw_frame())
+
+    def release_frame(self, frame):
+        self.image_allocator.recycle_frame(frame)
 
+    def _read_raw_frame(self):
         with self.lock:
-            ptr = self.frame_reader.read_frame()
+            if self._at_eof:
+                raise EOFError()
+            self._apply_roi()
+            with self._native_stats():
+                ptr = self.frame_reader.read_frame()
             if not ptr:
                 raise EOFError()
-            return self._convert_frame(ptr)
+            return self._get_raw_frame(ptr)
 
-    def _read_frames_by_index(self, indices):
+    def _read_raw_frames_by_index(self, indices):
         frame_indices = torch.tensor(indices, device='cpu', dtype=torch.int64)
         ptrs = torch.zeros(frame_indices.shape, device='cpu', dtype=torch.int64)
-        with self.lock:
+        with self.lock, self._native_stats():
+            self._apply_roi()
             n_frames_read = self.frame_reader.read_frames_by_index(
                 frame_indices.data_ptr(), frame_indices.shape[0], ptrs.data_ptr())
-            return [self._convert_frame(ptr) for ptr in ptrs[:n_frames_read].tolist()]
+            return [self._get_raw_frame(ptr) for ptr in ptrs[:n_frames_read].tolist()]
 
-    def select_frames(self, frame_indices):
-        if self._at_eof:
-            raise EOFError()
+    def _select_raw_frames(self, frame_indices):
         sorted_frame_indices = np.unique(frame_indices)
-        frames = self._read_frames_by_index(sorted_frame_indices)
+        with self.lock:
+            if self._at_eof:
+                raise EOFError()
+            frames = self._read_raw_frames_by_index(sorted_frame_indices)
         assert len(frames) == len(sorted_frame_indices), \
             'read_frames_by_index returned fewer frames than expected.'
-        return iter(frames)
+        return frames
+
+    def select_frames(self, frame_indices, roi=None, check=None):
+        # Frames are read by index in native code, so reading can only be stopped before it
+        # starts.
+        if check is not None:
+            check()
+        with self.lock, self._region_of_interest(roi):
+            frames = self._select_raw_frames(frame_indices)
+        return iter([self._postprocess_and_recycle(frame) for frame in frames])
+
+    def _stream_frames(self, frame_indices):
+        # Frames are read by index in native code, so read a bounded number of them at a time.
+        sorted_frame_indices = np.unique(frame_indices)
+        for start in range(0, len(sorted_frame_indices), self.stream_chunk_size):
+            yield from self.select_frames(
+                sorted_frame_indices[start:start + self.stream_chunk_size])
+
+    # Number of frames read at once by `_stream_frames`.
+    stream_chunk_size = 16
+
+    def select_frames_stacked(self, frame_indices, out=None, roi=None, check=None):
+        if check is not None:
+            check()
+        with self.lock, self._region_of_interest(roi):
+            frames = self._select_raw_frames(frame_indices)
+            out = self._stack_frames(iter(frames), len(frames), out)
+        for frame in frames:
+            self.image_allocator.recycle_frame(frame)
+        return out
 
 
 class FffrBackendFactory(BackendFactory):
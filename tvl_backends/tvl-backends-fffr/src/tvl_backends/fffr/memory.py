@@ -1,8 +1,13 @@
 import warnings
+from collections import defaultdict
+from threading import Lock
 
 import pyfffr
 import torch
 
+# Default limit on the memory retained by the pool of recycled frame storage.
+DEFAULT_MAX_POOLED_BYTES = 256 * 1024 * 1024
+
 
 def _dtype_bytes(dtype):
     info = torch.finfo(dtype) if dtype.is_floating_point else torch.iinfo(dtype)
@@ -16,13 +21,40 @@ def _align(value, alignment):
 
 
 class TorchImageAllocator(pyfffr.ImageAllocator):
-    def __init__(self, device, dtype):
+    def __init__(self, device, dtype, max_pooled_bytes=DEFAULT_MAX_POOLED_BYTES):
+        """Image allocator which stores frames in Torch tensors.
+
+        Storage for frames which have been released with `recycle_frame` is kept in a pool, and
+        reused for later frames of the same size. This avoids a fresh allocation for every
+        decoded frame.
+
+        Args:
+            device: Device to allocate frames on.
+            dtype: Data type of frame pixels.
+            max_pooled_bytes (int): Maximum amount of memory retained by the pool of recycled
+                storage, in bytes.
+        """
         super().__init__()
         if isinstance(device, str):
             device = torch.device(device)
         self.device = device
         self.dtype = dtype
         self.tensors = {}
+        self.max_pooled_bytes = max_pooled_bytes
+        self.hits = 0
+        self.misses = 0
+        self.n_pooled_bytes = 0
+        # Total size of the storage allocated for frames which could not reuse pooled storage.
+        self.n_allocated_bytes = 0
+        # Recycled storage, bucketed by size (in elements). The size includes padding for
+        # alignment, so any storage in a bucket can hold any frame which maps to that bucket.
+        self._pool = defaultdict(list)
+        # Data pointers of the storage allocated by this allocator, and of the storage which is
+        # currently in the pool. These are used to reject storage from elsewhere, and storage
+        # which is recycled more than once.
+        self._issued_ptrs = set()
+        self._pooled_ptrs = set()
+        self._lock = Lock()
 
     def allocate_frame(self, width, height, line_size, alignment):
         """Allocate memory for an image frame.
@@ -51,7 +83,21 @@ class TorchImageAllocator(pyfffr.ImageAllocator):
 
         # Allocate memory with extra space for starting pointer alignment.
         n_padded_elems = 3 * (height * line_elems) + align_elems
-        storage = torch.empty(n_padded_elems, device=self.device, dtype=self.dtype).storage()
+        with self._lock:
+            bucket = self._pool[n_padded_elems]
+            if bucket:
+                storage = bucket.pop()
+                self._pooled_ptrs.discard(storage.data_ptr())
+                self.n_pooled_bytes -= n_padded_elems * elem_size
+                self.hits += 1
+            else:
+                storage = None
+                self.misses += 1
+                self.n_allocated_bytes += n_padded_elems * elem_size
+        if storage is None:
+            storage = torch.empty(n_padded_elems, device=self.device, dtype=self.dtype).storage()
+            with self._lock:
+                self._issued_ptrs.add(storage.data_ptr())
 
         # Calculate memory offset and stride.
         ptr = storage.data_ptr()
@@ -74,6 +120,52 @@ class TorchImageAllocator(pyfffr.ImageAllocator):
         except KeyError:
             warnings.warn('Skipped an attempt to free unrecognised memory.')
 
+    def recycle_frame(self, tensor):
+        """Return the storage of a frame tensor to the pool, so that it can be reused.
+
+        The tensor (and any other views of its storage) must not be used after it has been
+        recycled. Tensors which were not allocated by this allocator, and tensors whose storage
+        has already been recycled, are ignored.
+        """
+        if tensor.dtype != self.dtype or tensor.device.type != self.device.type:
+            return
+        if self.device.index is not None and tensor.device.index != self.device.index:
+            return
+        storage = tensor.storage()
+        ptr = storage.data_ptr()
+        n_elems = storage.size()
+        n_bytes = n_elems * _dtype_bytes(self.dtype)
+        with self._lock:
+            if ptr not in self._issued_ptrs or ptr in self._pooled_ptrs:
+                return
+            if n_elems not in self._pool:
+                return
+            if self.n_pooled_bytes + n_bytes <= self.max_pooled_bytes:
+                self._pool[n_elems].append(storage)
+                self._pooled_ptrs.add(ptr)
+                self.n_pooled_bytes += n_bytes
+            else:
+                # The storage will be freed once the caller drops it, after which its address
+                # may be reused by unrelated storage.
+                self._issued_ptrs.discard(ptr)
+
+    def clear_pool(self):
+        """Release all recycled storage held by the pool."""
+        with self._lock:
+            self._pool.clear()
+            self._issued_ptrs -= self._pooled_ptrs
+            self._pooled_ptrs.clear()
+            self.n_pooled_bytes = 0
+
+    def stats(self):
+        """Get a snapshot of the pool's counters."""
+        with self._lock:
+            n_requests = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses,
+                        hit_rate=self.hits / n_requests if n_requests > 0 else 0.0,
+                        n_pooled_bytes=self.n_pooled_bytes,
+                        n_allocated_bytes=self.n_allocated_bytes)
+
     def get_data_type(self):
         if self.dtype == torch.uint8:
             return pyfffr.ImageAllocator.UINT8
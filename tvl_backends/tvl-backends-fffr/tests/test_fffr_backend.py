@@ -12,6 +12,8 @@ def test_memory_leakage(backend):
     """Check that the memory manager is not leaking memory."""
     device = backend.image_allocator.device
     if device.type == 'cuda':
+        # Read a frame first, so that recycled frame memory is already pooled.
+        backend.read_frame()
         start_mem = torch.cuda.memory_allocated(device.index)
         for _ in range(5):
             backend.read_frame()
@@ -23,6 +25,25 @@ def test_memory_leakage(backend):
     assert len(backend.image_allocator.tensors) == 0
 
 
+def test_frame_memory_is_recycled(video_filename):
+    backend = FffrBackendFactory().create(video_filename, 'cpu', torch.float32)
+    for _ in range(20):
+        backend.read_frame()
+    # Frames are decoded as uint8 and then converted, so the uint8 frames can be reused.
+    stats = backend.image_allocator.stats()
+    assert stats['hits'] > 0
+    assert stats['n_pooled_bytes'] > 0
+
+
+def test_max_pooled_bytes(video_filename):
+    backend = FffrBackendFactory().create(video_filename, 'cpu', torch.uint8,
+                                          backend_opts=dict(max_pooled_bytes=0))
+    assert backend.image_allocator.max_pooled_bytes == 0
+    for _ in range(5):
+        backend.release_frame(backend.read_frame())
+    assert backend.image_allocator.stats()['n_pooled_bytes'] == 0
+
+
 def test_read_frame_float32_cpu(video_filename, first_frame_image):
     backend = FffrBackendFactory().create(video_filename, 'cpu', torch.float32)
     rgb_frame = backend.read_frame()
@@ -38,6 +38,57 @@ def test_free_frame(device):
     assert mm.get_frame_tensor(addr2) is not None
 
 
+def test_recycle_frame(device):
+    mm = TorchImageAllocator(device, torch.uint8)
+    addr1 = mm.allocate_frame(16, 9, 16, 32)
+    tensor = mm.get_frame_tensor(addr1)
+    mm.free_frame(addr1)
+    mm.recycle_frame(tensor)
+    assert mm.stats()['n_pooled_bytes'] > 0
+    del tensor
+    addr2 = mm.allocate_frame(16, 9, 16, 32)
+    assert addr2 == addr1
+    assert mm.stats() == dict(hits=1, misses=1, hit_rate=0.5, n_pooled_bytes=0,
+                              n_allocated_bytes=896)
+
+
+def test_recycle_frame_ignores_other_tensors(device):
+    mm = TorchImageAllocator(device, torch.uint8)
+    mm.allocate_frame(16, 9, 16, 32)
+    mm.recycle_frame(torch.empty(100, device=device, dtype=torch.uint8))
+    mm.recycle_frame(torch.empty(100, device=device, dtype=torch.float32))
+    assert mm.stats()['n_pooled_bytes'] == 0
+
+
+def test_recycle_frame_ignores_foreign_storage(device):
+    mm = TorchImageAllocator(device, torch.uint8)
+    mm.allocate_frame(16, 9, 16, 32)
+    # This storage has the same size as an allocated frame, but was not allocated by `mm`.
+    mm.recycle_frame(torch.empty(896, device=device, dtype=torch.uint8))
+    assert mm.stats()['n_pooled_bytes'] == 0
+
+
+def test_recycle_frame_twice(device):
+    mm = TorchImageAllocator(device, torch.uint8)
+    tensor = mm.get_frame_tensor(mm.allocate_frame(16, 9, 16, 32))
+    mm.recycle_frame(tensor)
+    mm.recycle_frame(tensor[0])
+    assert mm.stats()['n_pooled_bytes'] == 896
+    # The storage must only be handed out once.
+    addr1 = mm.allocate_frame(16, 9, 16, 32)
+    addr2 = mm.allocate_frame(16, 9, 16, 32)
+    assert addr1 != addr2
+
+
+def test_recycle_frame_max_pooled_bytes(device):
+    mm = TorchImageAllocator(device, torch.uint8, max_pooled_bytes=1000)
+    tensors = [mm.get_frame_tensor(mm.allocate_frame(16, 9, 16, 32)) for _ in range(3)]
+    for tensor in tensors:
+        mm.recycle_frame(tensor)
+    # Each frame needs 3 * 9 * 32 + 32 = 896 bytes, so only one fits in the pool.
+    assert mm.stats()['n_pooled_bytes'] == 896
+
+
 def test_allocation_alignment(device):
     dtype = torch.float32
     allocator = TorchImageAllocator(device, dtype)
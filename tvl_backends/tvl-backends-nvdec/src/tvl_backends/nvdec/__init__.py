@@ -1,9 +1,9 @@
-from functools import lru_cache
-
 import torch
 
 import tvlnv
 from tvl.backend import Backend, BackendFactory
+from tvl.pixel_format import convert_rgb_planar, nv12_planes, yuv420_to_rgb
+from tvl.transforms import resize
 
 
 class TorchMemManager(tvlnv.MemManager):
@@ -29,13 +29,6 @@ class TorchMemManager(tvlnv.MemManager):
         return ptr
 
 
-@lru_cache(8)
-def _nv12_conv_consts(device):
-    const1 = torch.tensor([6.258931e-3, -1.536320e-3, 7.910723e-3], device=device).view(3, 1, 1)
-    const2 = torch.tensor([-0.8742, 0.5316706, -1.0856313], device=device).view(3, 1, 1)
-    return const1, const2
-
-
 def nv12_to_rgb(planar_yuv, h, w):
     """Converts planar YUV pixel data in NV12 format to RGB.
 
@@ -47,28 +40,37 @@ def nv12_to_rgb(planar_yuv, h, w):
     Returns:
         torch.FloatTensor: RGB pixels in [0, 1] value range.
     """
-    rgb = torch.empty([3, h, w], dtype=torch.float32, device=planar_yuv.device)
-    # Memory reuse trick
-    v, _, u = rgb
-    # Extract luma channel
-    y = planar_yuv[:w*h].view(h, w).float()
-    # Extract and upsample chroma channels
-    u.copy_(planar_yuv[w*h::2].view(h//2, 1, w//2, 1).expand(h//2, 2, w//2, 2).contiguous().view(h, w))
-    v.copy_(planar_yuv[w*h+1::2].view(h//2, 1, w//2, 1).expand(h//2, 2, w//2, 2).contiguous().view(h, w))
-    # YUV [0, 255] to RGB [0, 1]
-    torch.add(u, v, alpha=2.075161, out=rgb[1])
-    const1, const2 = _nv12_conv_consts(str(rgb.device))
-    rgb.mul_(const1)
-    torch.add(rgb, y, alpha=4.566207e-3, out=rgb)
-    rgb.add_(const2)
-
-    return rgb.clamp_(0, 1)
+    return yuv420_to_rgb(*nv12_planes(planar_yuv, h, w))
+
+
+def nv12_to_yuv420p(planar_yuv, h, w):
+    """Converts planar YUV pixel data in NV12 format to YUV420p (I420).
+
+    Args:
+        planar_yuv (torch.ByteTensor): Planar YUV pixels in NV12 format.
+        h: Height of the image.
+        w: Width of the image.
+
+    Returns:
+        torch.ByteTensor: [(h * 3 / 2) x w] planar YUV pixels in YUV420p format.
+    """
+    # The chroma plane of NV12 interleaves U and V samples, whereas YUV420p stores them as
+    # separate planes.
+    chroma = planar_yuv[w*h:w*h*3//2]
+    return torch.cat([planar_yuv[:w*h], chroma[0::2], chroma[1::2]]).view(h * 3 // 2, w)
 
 
 class NvdecBackend(Backend):
-    def __init__(self, filename, device, dtype, *, seek_threshold=3, out_width=0, out_height=0):
-        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height)
+    def __init__(self, filename, device, dtype, *, seek_threshold=None, out_width=0, out_height=0,
+                 pixel_format='rgb_planar', roi=None):
+        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height,
+                         pixel_format, roi)
         assert self.device.type == 'cuda'
+        # A region of interest is cropped at the source resolution and then resized, so the
+        # decoder must not scale whole frames.
+        self._native_scaling = self.roi is None
+        if not self._native_scaling:
+            out_width, out_height = 0, 0
         mem_manager = TorchMemManager(self.device)
         # Disown mem_manager, since TvlnvFrameReader will be responsible for deleting it.
         mem_manager = mem_manager.__disown__()
@@ -77,6 +79,9 @@ class NvdecBackend(Backend):
         self.frame_reader = tvlnv.TvlnvFrameReader(mem_manager, self.filename, self.device.index,
                                                    out_width, out_height)
 
+    # Frames are cropped to the region of interest before colour conversion.
+    crops_natively = True
+
     @property
     def duration(self):
         return self.frame_reader.get_duration()
@@ -98,18 +103,74 @@ class NvdecBackend(Backend):
         return self.frame_reader.get_height()
 
     def seek(self, time_secs):
-        self.frame_reader.seek(time_secs)
+        with self.lock, self._timer('seek'):
+            self._count('seeks')
+            self.frame_reader.seek(time_secs)
 
     def read_frame(self):
-        result = self.frame_reader.read_frame()
-        if result is None:
-            raise EOFError()
-        data_ptr = int(result)
-        planar_yuv = self.mem_manager.tensors[data_ptr]
+        return self._postprocess_frame(self._read_raw_frame())
+
+    def _read_raw_frame(self):
+        with self.lock:
+            with self._timer('decode'):
+                result = self.frame_reader.read_frame()
+            if result is None:
+                raise EOFError()
+            self._count('frames_decoded')
+            data_ptr = int(result)
+            # The decoder may reuse the frame memory, so the conversion must finish before the
+            # lock is released.
+            planar_yuv = self.mem_manager.tensors[data_ptr]
+            with self._timer('convert'):
+                frame = self._convert_frame(planar_yuv)
+            self._count('bytes_allocated', frame.numel() * frame.element_size())
+            return frame
+
+    def _convert_frame(self, planar_yuv):
         width = self.frame_reader.get_width()
         height = self.frame_reader.get_height()
-        rgb = nv12_to_rgb(planar_yuv, height, width)
-        return self._postprocess_frame(rgb)
+        if self.roi is not None:
+            return self._convert_region(planar_yuv, height, width)
+        if self.pixel_format == 'yuv420p':
+            return nv12_to_yuv420p(planar_yuv, height, width)
+        if self.pixel_format == 'gray':
+            return planar_yuv[:width * height].view(1, height, width).clone()
+        # Convert straight to the output data type, so that postprocessing has nothing to do.
+        rgb = yuv420_to_rgb(*nv12_planes(planar_yuv, height, width), dtype=self.dtype)
+        return convert_rgb_planar(rgb, self.pixel_format)
+
+    def _convert_region(self, planar_yuv, height, width):
+        """Convert only the region of interest of an NV12 frame."""
+        t, l, h, w = self._roi_region(height, width)
+        y, u, v = nv12_planes(planar_yuv, height, width)
+        size = None
+        if not self._native_scaling and (self._out_width > 0 or self._out_height > 0):
+            size = (self.out_height, self.out_width)
+        if self.pixel_format == 'gray':
+            # Gray frames are channels-first, so they are resized in postprocessing.
+            return y[t:t + h, l:l + w].unsqueeze(0).clone()
+        if t % 2 == 0 and l % 2 == 0 and h % 2 == 0 and w % 2 == 0:
+            # The region is aligned with the subsampled chroma planes, so it can be cropped
+            # before conversion.
+            y = y[t:t + h, l:l + w]
+            u = u[t // 2:(t + h) // 2, l // 2:(l + w) // 2]
+            v = v[t // 2:(t + h) // 2, l // 2:(l + w) // 2]
+            if self.pixel_format == 'yuv420p':
+                if size is not None:
+                    y = resize(y.unsqueeze(0), size).squeeze(0)
+                    u = resize(u.unsqueeze(0), (size[0] // 2, size[1] // 2)).squeeze(0)
+                    v = resize(v.unsqueeze(0), (size[0] // 2, size[1] // 2)).squeeze(0)
+                return torch.cat([y.reshape(-1), u.reshape(-1), v.reshape(-1)]) \
+                    .view(y.shape[0] * 3 // 2, y.shape[1])
+            rgb = yuv420_to_rgb(y, u, v, size=size, dtype=self.dtype)
+        else:
+            if self.pixel_format == 'yuv420p':
+                raise ValueError(f'a yuv420p region of interest must have even coordinates, '
+                                 f'got {self.roi}')
+            rgb = yuv420_to_rgb(y, u, v, dtype=self.dtype)[:, t:t + h, l:l + w].contiguous()
+            if size is not None:
+                rgb = resize(rgb, size)
+        return convert_rgb_planar(rgb, self.pixel_format)
 
 
 class NvdecBackendFactory(BackendFactory):
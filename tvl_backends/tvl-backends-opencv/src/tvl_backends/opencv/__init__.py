@@ -6,10 +6,29 @@ from tvl.backend import Backend, BackendFactory
 
 
 class OpenCvBackend(Backend):
-    def __init__(self, filename, device, dtype, *, seek_threshold=3, out_width=0, out_height=0):
-        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height)
+    def __init__(self, filename, device, dtype, *, seek_threshold=None, out_width=0, out_height=0,
+                 pixel_format='rgb_planar', roi=None):
+        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height,
+                         pixel_format, roi)
         assert self.device.type == 'cpu'
-        self.cap = cv2.VideoCapture(self.filename)
+        self._cap = None
+
+    @property
+    def cap(self):
+        # The capture is opened lazily, since cached metadata may make opening it unnecessary.
+        if self._cap is None:
+            with self.lock:
+                if self._cap is None:
+                    self._cap = cv2.VideoCapture(self.filename)
+        return self._cap
+
+    def _probe_metadata(self):
+        return dict(
+            frame_rate=self.cap.get(cv2.CAP_PROP_FPS),
+            n_frames=int(round(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))),
+            width=int(round(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))),
+            height=int(round(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+        )
 
     @property
     def duration(self):
@@ -17,35 +36,85 @@ class OpenCvBackend(Backend):
 
     @property
     def frame_rate(self):
-        return self.cap.get(cv2.CAP_PROP_FPS)
+        return self._get_metadata('frame_rate')
 
     @property
     def n_frames(self):
-        return int(round(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        return self._get_metadata('n_frames')
 
     @property
     def width(self):
-        return int(round(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        return self._get_metadata('width')
 
     @property
     def height(self):
-        return int(round(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return self._get_metadata('height')
+
+    # Frames are cropped to the region of interest before they are resized and colour converted.
+    crops_natively = True
 
     def seek_to_frame(self, frame_index):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        with self.lock, self._timer('seek'):
+            self._count('seeks')
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
 
     def seek(self, time_secs):
         self.seek_to_frame(int(round(time_secs * self.frame_rate)))
 
     def read_frame(self):
-        ret, frame = self.cap.read()
+        return self._postprocess_frame(self._read_raw_frame())
+
+    def _skip_frame(self):
+        # Grabbing decodes the frame without retrieving and converting it.
+        with self.lock, self._timer('decode'):
+            ret = self.cap.grab()
+        if not ret:
+            raise EOFError()
+        self._count('frames_decoded')
+
+    def _read_raw_frame(self):
+        with self.lock, self._timer('decode'):
+            ret, frame = self.cap.read()
         if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            rgb_bytes = torch.from_numpy(np.moveaxis(frame, -1, 0))
-            return self._postprocess_frame(rgb_bytes)
+            self._count('frames_decoded')
+            self._count('bytes_allocated', frame.nbytes)
+            if self.roi is not None:
+                t, l, h, w = self._roi_region(*frame.shape[:2])
+                frame = frame[t:t + h, l:l + w]
+            if self._out_width > 0 or self._out_height > 0:
+                # Resizing the uint8 image before colour conversion is much cheaper than resizing
+                # a float tensor afterwards.
+                out_size = (self.out_width, self.out_height)
+                if out_size[0] * out_size[1] < frame.shape[0] * frame.shape[1]:
+                    interpolation = cv2.INTER_AREA
+                else:
+                    interpolation = cv2.INTER_LINEAR
+                frame = cv2.resize(frame, out_size, interpolation=interpolation)
+            with self._timer('convert'):
+                tensor = self._convert_bgr_frame(frame)
+            self._count('bytes_allocated', tensor.numel())
+            return tensor
         else:
             raise EOFError()
 
+    def _convert_bgr_frame(self, frame):
+        if self.pixel_format == 'yuv420p':
+            return torch.from_numpy(cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420))
+        if self.pixel_format == 'gray':
+            height, width = frame.shape[:2]
+            if height % 2 == 1 or width % 2 == 1:
+                # I420 conversion requires even dimensions, so pad odd ones by repeating the last
+                # row or column, which does not change the luma of the other pixels.
+                frame = cv2.copyMakeBorder(frame, 0, height % 2, 0, width % 2,
+                                           cv2.BORDER_REPLICATE)
+            # Only the Y plane of the I420 image is needed, which is the top part.
+            yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+            return torch.from_numpy(yuv[:height, :width]).unsqueeze(0)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if self.pixel_format == 'rgb_hwc':
+            return torch.from_numpy(frame)
+        return torch.from_numpy(np.moveaxis(frame, -1, 0))
+
 
 class OpenCvBackendFactory(BackendFactory):
     def create(self, filename, device, dtype, backend_opts=None) -> OpenCvBackend:
@@ -1,57 +1,275 @@
 import av
+import numpy as np
 import torch
 
+import tvl.keyframes
 from tvl.backend import Backend, BackendFactory
+from tvl.buffers import FrameBufferRing
+
+
+def scan_frames(filename):
+    """Scan the packets of a video without decoding them.
+
+    Returns:
+        tuple: The presentation timestamp of each frame (in stream time base units), and the
+        indices of keyframes. Frames are numbered in presentation order.
+    """
+    with av.open(filename) as container:
+        stream = container.streams.video[0]
+        packets = [(packet.pts, packet.is_keyframe) for packet in container.demux(stream)
+                   if packet.pts is not None and packet.size > 0]
+    packets.sort(key=lambda packet: packet[0])
+    frame_pts = [pts for pts, _ in packets]
+    keyframes = [i for i, (_, is_keyframe) in enumerate(packets) if is_keyframe]
+    return frame_pts, keyframes
+
+
+def _scan_index(filename):
+    frame_pts, keyframes = scan_frames(filename)
+    return keyframes, frame_pts
 
 
 class PyAvBackend(Backend):
-    def __init__(self, filename, device, dtype, *, seek_threshold=3, out_width=0, out_height=0):
-        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height)
+    def __init__(self, filename, device, dtype, *, seek_threshold=None, out_width=0, out_height=0,
+                 pixel_format='rgb_planar', roi=None, use_keyframe_index=True, frame_buffers=None,
+                 pin_memory=False):
+        """Create a PyAV backend.
+
+        Args:
+            use_keyframe_index (bool): Use a keyframe index to decide when to seek.
+            frame_buffers (int or FrameBufferRing): Convert decoded frames straight into a ring
+                of reusable uint8 buffers, either owned by the backend (when given the number of
+                buffers) or supplied by the caller. With `dtype=torch.uint8`, frames
+                are returned as views of these buffers, which are overwritten once the ring wraps
+                around (see `tvl.buffers`). Frames which are skipped over by `select_frames` do
+                not use buffers, but the ring must be at least as large as the number of frames
+                selected at once.
+            pin_memory (bool): Use page-locked memory for backend-owned frame buffers.
+
+        See `Backend` for the other arguments.
+        """
+        super().__init__(filename, device, dtype, seek_threshold, out_width, out_height,
+                         pixel_format, roi)
         assert self.device.type == 'cpu'
-        self.container = av.open(self.filename)
+        if isinstance(frame_buffers, int):
+            frame_buffers = FrameBufferRing(frame_buffers, pin_memory=pin_memory)
+        self.frame_buffers = frame_buffers
+        self._container = None
         self.generator = None
         self.seek_time = None
+        self.seek_pts = None
+        self.use_keyframe_index = use_keyframe_index
+
+    @property
+    def reuses_frame_memory(self):
+        # Only uint8 frames are returned without being copied out of the frame buffers.
+        return self.frame_buffers is not None and self.dtype == torch.uint8
+
+    @property
+    def container(self):
+        # The container is opened lazily, since cached metadata may make opening it unnecessary.
+        if self._container is None:
+            with self.lock:
+                if self._container is None:
+                    self._container = av.open(self.filename)
+        return self._container
+
+    def _probe_metadata(self):
+        stream = self.container.streams.video[0]
+        duration = self.container.duration / av.time_base
+        frame_rate = stream.average_rate
+        n_frames = stream.frames
+        if n_frames <= 0:
+            n_frames = int(duration * frame_rate)
+        return dict(duration=duration, frame_rate=frame_rate, n_frames=n_frames,
+                    width=stream.width, height=stream.height)
 
     @property
     def duration(self):
-        return self.container.duration / av.time_base
+        return self._get_metadata('duration')
 
     @property
     def frame_rate(self):
-        return self.container.streams.video[0].average_rate
+        return self._get_metadata('frame_rate')
 
     @property
     def n_frames(self):
-        frames = self.container.streams.video[0].frames
-        if frames > 0:
-            return frames
-        return int(self.duration * self.frame_rate)
+        return self._get_metadata('n_frames')
 
     @property
     def width(self):
-        return self.container.streams.video[0].width
+        return self._get_metadata('width')
 
     @property
     def height(self):
-        return self.container.streams.video[0].height
+        return self._get_metadata('height')
+
+    @property
+    def keyframe_indices(self):
+        if not self.use_keyframe_index:
+            return None
+        if 'keyframes' not in self._metadata:
+            self._load_frame_index()
+        return self._metadata['keyframes']
+
+    @property
+    def frame_pts(self):
+        """The presentation timestamp of each frame in the video (in stream time base units)."""
+        if 'frame_pts' not in self._metadata:
+            self._load_frame_index()
+        return self._metadata['frame_pts']
+
+    def _load_frame_index(self):
+        """Find the frame timestamps and keyframes, using the stored keyframe index if enabled.
+
+        The stored index is only rebuilt (by scanning every packet) when it is missing or stale.
+        """
+        if self.use_keyframe_index:
+            keyframes, frame_pts = tvl.keyframes.get_keyframes(self.filename, _scan_index,
+                                                               with_frame_pts=True)
+        else:
+            frame_pts, keyframes = scan_frames(self.filename)
+        self._set_metadata(frame_pts=frame_pts, keyframes=keyframes)
+
+    # Frames are cropped to the region of interest before they are colour converted.
+    crops_natively = True
 
     def seek(self, time_secs):
-        self.container.seek(int(round(time_secs * av.time_base)))
-        self.seek_time = time_secs
-        self.generator = None
+        with self.lock, self._timer('seek'):
+            self._count('seeks')
+            self.container.seek(int(round(time_secs * av.time_base)))
+            self.seek_time = time_secs
+            self.seek_pts = None
+            self.generator = None
+
+    def seek_to_frame(self, frame_index):
+        frame_pts = self.frame_pts
+        with self.lock:
+            self.seek_time = None
+            self.seek_pts = None
+            if frame_index >= len(frame_pts):
+                # Seek past the last frame, so that the next read will hit the end of the stream.
+                self.generator = iter(())
+                return
+            # Seeking by exact presentation timestamp lands on the nearest preceding keyframe,
+            # and then only frames between that keyframe and the target need to be decoded.
+            stream = self.container.streams.video[0]
+            self.seek_pts = frame_pts[frame_index]
+            with self._timer('seek'):
+                self._count('seeks')
+                self.container.seek(self.seek_pts, stream=stream)
+            self.generator = None
+
+    def _is_seek_target(self, frame):
+        if self.seek_pts is not None:
+            return frame.pts is not None and frame.pts >= self.seek_pts
+        if self.seek_time is not None:
+            return frame.pts * frame.time_base >= self.seek_time
+        return True
 
     def read_frame(self):
-        if self.generator is None:
-            self.generator = self.container.decode(video=0)
-        for frame in self.generator:
-            if self.seek_time is None or frame.pts * frame.time_base >= self.seek_time:
-                break
+        return self._postprocess_frame(self._read_raw_frame())
+
+    def _decode_frame(self):
+        with self.lock, self._timer('decode'):
+            if self.generator is None:
+                self.generator = self.container.decode(video=0)
+            for frame in self.generator:
+                self._count('frames_decoded')
+                if self._is_seek_target(frame):
+                    break
+                # Frames between the keyframe that a seek landed on and the target are wasted.
+                self._record_skipped()
+            else:
+                raise EOFError()
+            self.seek_time = None
+            self.seek_pts = None
+            return frame
+
+    def _skip_frame(self):
+        # Discarded frames do not need to be converted to RGB.
+        self._decode_frame()
+
+    def _reformat(self, frame, format):
+        if self._out_width > 0 or self._out_height > 0:
+            # Scale during colour conversion, so that a full resolution frame is never produced.
+            return frame.reformat(width=self.out_width, height=self.out_height, format=format,
+                                  interpolation='AREA')
+        return frame.reformat(format=format)
+
+    def _read_raw_frame(self):
+        frame = self._decode_frame()
+        # The decoded frame is independent of the decoder, so colour conversion can happen
+        # without holding the lock.
+        with self._timer('convert'):
+            return self._convert_frame(frame)
+
+    def _crop_frame(self, frame):
+        """Crop a decoded frame to the region of interest, before it is colour converted.
+
+        The most common case (a `yuv420p` frame and a region with even coordinates) is handled by
+        copying the region of each plane into a new frame, so that swscale only converts and
+        scales the region. Otherwise, the region is cropped from a converted frame.
+        """
+        t, l, h, w = self._roi_region(frame.height, frame.width)
+        if frame.format.name == 'yuv420p' and t % 2 == 0 and l % 2 == 0 and h % 2 == 0 \
+                and w % 2 == 0:
+            cropped = np.empty((h * 3 // 2, w), dtype=np.uint8)
+            data = cropped.reshape(-1)
+            offset = 0
+            for i, plane in enumerate(frame.planes):
+                # Chroma planes are subsampled by 2 in both directions.
+                s = 1 if i == 0 else 2
+                src = np.frombuffer(plane, dtype=np.uint8).reshape(plane.height, plane.line_size)
+                region = src[t // s:(t + h) // s, l // s:(l + w) // s]
+                data[offset:offset + region.size].reshape(region.shape)[...] = region
+                offset += region.size
+            return av.VideoFrame.from_ndarray(cropped, format='yuv420p')
+        if self.pixel_format == 'gray':
+            # Luma is not subsampled, so it can be cropped anywhere.
+            if frame.format.name != 'yuv420p':
+                frame = frame.reformat(format='yuv420p')
+            plane = frame.planes[0]
+            luma = np.frombuffer(plane, dtype=np.uint8).reshape(plane.height, plane.line_size)
+            luma = np.ascontiguousarray(luma[t:t + h, l:l + w])
+            return av.VideoFrame.from_ndarray(luma, format='gray')
+        rgb = np.ascontiguousarray(frame.to_ndarray(format='rgb24')[t:t + h, l:l + w])
+        return av.VideoFrame.from_ndarray(rgb, format='rgb24')
+
+    def _convert_frame(self, frame):
+        if self.roi is not None:
+            frame = self._crop_frame(frame)
+        if self.pixel_format == 'rgb_planar' and self.frame_buffers is not None:
+            return self._convert_frame_into_buffer(frame)
+        if self.pixel_format in {'rgb_planar', 'rgb_hwc'}:
+            tensor = torch.from_numpy(self._reformat(frame, 'rgb24').to_ndarray())
+            if self.pixel_format == 'rgb_planar':
+                tensor = tensor.permute(2, 0, 1)
+        elif self.pixel_format == 'yuv420p':
+            # Most videos are decoded as yuv420p, in which case no conversion is needed.
+            tensor = torch.from_numpy(self._reformat(frame, 'yuv420p').to_ndarray())
         else:
-            raise EOFError()
-        self.seek_time = None
-        np_frame = frame.to_rgb().to_ndarray()
-        rgb_bytes = torch.from_numpy(np_frame).permute(2, 0, 1)
-        return self._postprocess_frame(rgb_bytes)
+            # Cropped luma is already in the right format.
+            luma_format = 'gray' if frame.format.name == 'gray' else 'yuv420p'
+            plane = self._reformat(frame, luma_format).planes[0]
+            tensor = torch.frombuffer(plane, dtype=torch.uint8).view(plane.height, plane.line_size)
+            tensor = tensor[:, :plane.width].unsqueeze(0)
+        if self.frame_buffers is not None:
+            buffer = self.frame_buffers.next_buffer(tensor.shape)
+            return buffer.copy_(tensor)
+        self._count('bytes_allocated', tensor.numel())
+        return tensor
+
+    def _convert_frame_into_buffer(self, frame):
+        # Converting to planar GBR gives us channel-first data, so each plane can be copied
+        # directly into a CHW buffer without an intermediate interleaved RGB array.
+        frame = self._reformat(frame, 'gbrp')
+        width, height = frame.width, frame.height
+        rgb = self.frame_buffers.next_buffer((3, height, width))
+        for channel, plane in zip(rgb, (frame.planes[2], frame.planes[0], frame.planes[1])):
+            src = torch.frombuffer(plane, dtype=torch.uint8).view(height, plane.line_size)
+            channel.copy_(src[:, :width])
+        return rgb
 
 
 class PyAvBackendFactory(BackendFactory):
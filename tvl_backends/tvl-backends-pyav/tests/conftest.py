@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import PIL.Image
+import pytest
+import torch
+
+import tvl.keyframes
+import tvl.metadata
+from tvl_backends.pyav import PyAvBackendFactory
+
+DATA_DIR = Path(__file__).parent.parent.parent.parent.joinpath('data')
+
+
+@pytest.fixture(autouse=True)
+def keyframe_cache_dir(tmp_path):
+    old_cache_dir = tvl.keyframes.get_cache_dir()
+    tvl.keyframes.set_cache_dir(tmp_path.joinpath('keyframes'))
+    tvl.metadata.clear_metadata()
+    yield
+    tvl.keyframes.set_cache_dir(old_cache_dir)
+
+
+@pytest.fixture
+def data_dir():
+    return DATA_DIR
+
+
+@pytest.fixture
+def video_filename():
+    return str(DATA_DIR.joinpath('board_game-h264.mkv'))
+
+
+@pytest.fixture
+def mid_frame_image():
+    return PIL.Image.open(DATA_DIR.joinpath('board_game_mid.jpg'), 'r')
+
+
+@pytest.fixture
+def backend(video_filename):
+    return PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8)
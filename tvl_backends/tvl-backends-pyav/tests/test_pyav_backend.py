@@ -0,0 +1,154 @@
+import av
+import pytest
+import torch
+
+import tvl.keyframes
+import tvl.metadata
+from tvl.buffers import FrameBufferRing
+from tvl.cache import CachedBackend, FrameCache
+from tvl.testing import assert_same_image
+from tvl_backends.pyav import PyAvBackendFactory, scan_frames
+
+
+def test_scan_frames(video_filename):
+    frame_pts, keyframes = scan_frames(video_filename)
+    assert frame_pts == [40 * i for i in range(50)]
+    assert keyframes == [0, 5, 10, 15, 20, 25, 30, 35, 40, 45]
+
+
+def test_keyframe_indices_are_stored(backend, video_filename):
+    assert tvl.keyframes.load_keyframes(video_filename) is None
+    keyframes = backend.keyframe_indices
+    assert tvl.keyframes.load_keyframes(video_filename) == keyframes
+
+
+def test_frame_pts_loaded_from_stored_index(video_filename, mocker):
+    PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8).select_frames_stacked([3])
+    # Simulate a fresh process, in which only the index on disk remains.
+    tvl.metadata.clear_metadata()
+    scan_spy = mocker.patch('tvl_backends.pyav.scan_frames', wraps=scan_frames)
+    backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8)
+    backend.select_frames_stacked([3, 30])
+    assert backend.frame_pts == [40 * i for i in range(50)]
+    scan_spy.assert_not_called()
+
+
+def test_keyframe_indices_disabled(video_filename):
+    backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8,
+                                          backend_opts=dict(use_keyframe_index=False))
+    assert backend.keyframe_indices is None
+
+
+def test_select_frames_seeks_at_keyframes(backend, mid_frame_image, mocker):
+    seek_spy = mocker.spy(backend, 'seek_to_frame')
+    frames = list(backend.select_frames([1, 4, 25, 29, 36]))
+    assert len(frames) == 5
+    assert_same_image(frames[2], mid_frame_image)
+    assert [c.args[0] for c in seek_spy.call_args_list] == [1, 25, 36]
+
+
+@pytest.fixture(params=['swimming-h264.mp4', 'diving-h264.mkv'])
+def sequential_frames(request, data_dir):
+    filename = str(data_dir.joinpath(request.param))
+    backend = PyAvBackendFactory().create(filename, 'cpu', torch.uint8)
+    frames = []
+    while True:
+        try:
+            frames.append(backend.read_frame())
+        except EOFError:
+            break
+    return filename, frames
+
+
+def test_seek_to_frame_matches_sequential(sequential_frames):
+    filename, expected_frames = sequential_frames
+    backend = PyAvBackendFactory().create(filename, 'cpu', torch.uint8)
+    assert len(backend.frame_pts) == len(expected_frames)
+    for frame_index in [7, 0, len(expected_frames) - 1, 3, 12, 4]:
+        backend.seek_to_frame(frame_index)
+        assert torch.equal(backend.read_frame(), expected_frames[frame_index])
+
+
+def test_select_frames_matches_sequential(sequential_frames):
+    filename, expected_frames = sequential_frames
+    backend = PyAvBackendFactory().create(filename, 'cpu', torch.uint8)
+    frame_indices = [1, 2, 9, 10, 17, 19]
+    frames = list(backend.select_frames(frame_indices))
+    assert len(frames) == len(frame_indices)
+    for frame, frame_index in zip(frames, frame_indices):
+        assert torch.equal(frame, expected_frames[frame_index])
+
+
+def test_seek_to_frame_decodes_from_keyframe(backend, mocker):
+    target_spy = mocker.spy(backend, '_is_seek_target')
+    backend.seek_to_frame(28)
+    backend.read_frame()
+    decoded_pts = [c.args[0].pts for c in target_spy.call_args_list]
+    # Frame 28 is preceded by a keyframe at frame 25.
+    assert decoded_pts == [40 * i for i in range(25, 29)]
+
+
+def test_seek_to_frame_past_end(backend):
+    backend.seek_to_frame(backend.n_frames)
+    with pytest.raises(EOFError):
+        backend.read_frame()
+
+
+def test_cached_metadata_skips_container_open(video_filename, mocker):
+    first_backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8)
+    assert first_backend.n_frames == 50
+    assert first_backend.keyframe_indices is not None
+    open_spy = mocker.spy(av, 'open')
+    backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8)
+    assert (backend.n_frames, backend.width, backend.height) == (50, 1280, 720)
+    assert backend.keyframe_indices == [0, 5, 10, 15, 20, 25, 30, 35, 40, 45]
+    open_spy.assert_not_called()
+
+
+def test_frame_buffers_ring(backend, video_filename):
+    ring_backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8,
+                                               backend_opts=dict(frame_buffers=2))
+    frames = [ring_backend.read_frame() for _ in range(3)]
+    expected = [backend.read_frame() for _ in range(3)]
+    assert frames[2].is_contiguous()
+    assert torch.equal(frames[1], expected[1])
+    assert torch.equal(frames[2], expected[2])
+    # The first buffer has been recycled for the third frame.
+    assert frames[0].data_ptr() == frames[2].data_ptr()
+
+
+def test_frame_buffers_select_frames(video_filename, mid_frame_image):
+    ring = FrameBufferRing(2)
+    ring_backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8,
+                                               backend_opts=dict(frame_buffers=ring))
+    # Skipped frames should not use up buffers in the ring.
+    frames = list(ring_backend.select_frames([21, 25]))
+    assert_same_image(frames[1], mid_frame_image)
+    assert frames[0].data_ptr() != frames[1].data_ptr()
+
+
+def test_frame_buffers_cached(backend, video_filename):
+    ring_backend = PyAvBackendFactory().create(video_filename, 'cpu', torch.uint8,
+                                               backend_opts=dict(frame_buffers=2))
+    assert ring_backend.reuses_frame_memory
+    cached_backend = CachedBackend(ring_backend, FrameCache(max_bytes=2**30))
+    list(cached_backend.select_frames([0, 1]))
+    # Further reads recycle the frame buffers, but the cached frames must be unaffected.
+    list(cached_backend.select_frames([2, 3]))
+    cached_frames = list(cached_backend.select_frames([0, 1]))
+    assert cached_backend.frame_cache.hits == 2
+    assert torch.equal(cached_frames[0], backend.select_frame(0))
+    assert torch.equal(cached_frames[1], backend.select_frame(1))
+
+
+def test_frame_buffers_resized(video_filename):
+    ring_backend = PyAvBackendFactory().create(
+        video_filename, 'cpu', torch.float32,
+        backend_opts=dict(frame_buffers=2, out_width=160, out_height=90))
+    plain_backend = PyAvBackendFactory().create(
+        video_filename, 'cpu', torch.float32, backend_opts=dict(out_width=160, out_height=90))
+    frames = ring_backend.select_frames_stacked([0, 10])
+    assert frames.shape == (2, 3, 90, 160)
+    # Scaling planar and packed RGB takes slightly different paths through libswscale.
+    expected = plain_backend.select_frames_stacked([0, 10])
+    assert (frames - expected).abs().mean() < 4 / 255